@@ -0,0 +1,298 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import platform
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import numpy as np
+from src.bench.synthetic import generate, parse_scale
+
+# -----------------------------
+# End-to-end pipeline benchmark on synthetic corpora
+#
+# Every stage runs in a fresh process against its own inputs (synthetic
+# fixtures, or the output of the stage before it when that ran too), so
+# stages can be timed in isolation and peak RSS is per stage. Batch
+# stages report throughput; query stages (retrieve, generate,
+# novelty_score) also report p50/p99 latency per call.
+#
+#   python -m src.bench.pipeline --scales 1k 100k --stages passageize normalize build_faiss novelty_score
+#   python -m src.bench.pipeline --save-baseline       # store as the new baseline
+# -----------------------------
+
+STAGES = ("passageize", "ner", "normalize", "build_embeddings", "build_faiss",
+          "retrieve", "generate", "novelty_score")
+BENCH_DIR = Path("data/bench")
+RESULTS = Path("outputs/bench/pipeline.json")
+BASELINE = Path("outputs/bench/baseline.json")
+TOLERANCE = 0.15
+EMB_DIM = 768
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux; children covers the stage's worker pools
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) / 1024
+
+
+def _queries(ws: Path, n: int):
+    with open(ws / "queries.jsonl", "r", encoding="utf-8") as f:
+        pairs = [(q["gene"], q["disease"]) for q in map(json.loads, f)]
+    return pairs[:n]
+
+
+def _timed_calls(fn, items):
+    lat = []
+    for item in items:
+        t0 = time.perf_counter()
+        fn(*item)
+        lat.append(time.perf_counter() - t0)
+    return lat
+
+
+def _use_workspace_retrieval(ws: Path):
+    from src.retrieval import query
+    query.INDEX = ws / "models" / "faiss.index"
+    query.PASS = ws / "processed" / "passage_store"
+    query.BM25_DIR = ws / "models" / "bm25"
+
+
+def _ensure_store(ws: Path):
+    # query stages read passages from the store that build_embeddings writes
+    from src.retrieval.passage_store import iter_jsonl, write_store
+    store = ws / "processed" / "passage_store"
+    if not (store / "texts.bin").exists():
+        write_store(iter_jsonl(ws / "processed" / "passages.jsonl"), store)
+    return store
+
+
+# each stage returns (items processed, per-call latencies in seconds or None)
+
+def stage_passageize(ws: Path, opts: dict):
+    from src.preprocess.passageize import run
+    out = ws / "processed" / "passages.bench.jsonl"
+    run(ws / "raw", out, workers=opts["workers"], parts_dir=ws / "processed" / "passage_parts")
+    with open(out, "rb") as f:
+        return sum(1 for _ in f), None
+
+
+def stage_ner(ws: Path, opts: dict):
+    from src.ner.ner_infer import run_ner
+    out = ws / "processed" / "ner_predictions.bench.jsonl"
+    run_ner(ws / "processed" / "passages.jsonl", out, workers=opts["workers"] or 1,
+            shard_dir=ws / "processed" / "ner_shards", restart=True)
+    with open(out, "rb") as f:
+        return sum(1 for _ in f), None
+
+
+def stage_normalize(ws: Path, opts: dict):
+    from src.normalization.normalize import run_normalization
+    out = ws / "processed" / "normalized_entities.jsonl"
+    cache = ws / "processed" / "hgnc_lookup.pkl"
+    cache.unlink(missing_ok=True)  # time the cold path, including the HGNC parse
+    run_normalization(ws / "processed" / "ner_predictions.jsonl", out,
+                      ws / "databases" / "hgnc_complete_set.txt", cache)
+    with open(out, "rb") as f:
+        return sum(1 for _ in f), None
+
+
+def stage_build_embeddings(ws: Path, opts: dict):
+    from src.retrieval.build_embeddings import build
+    n = build(ws / "processed" / "passages.jsonl", ws / "processed" / "embeddings.npy",
+              ws / "processed" / "passage_store", ws / "processed" / "embedding_manifest.json")
+    return n, None
+
+
+def stage_build_faiss(ws: Path, opts: dict):
+    import faiss
+    from src.retrieval.faiss_utils import build_index, write_meta
+    emb_path = ws / "processed" / "embeddings.npy"
+    if not emb_path.exists():
+        # stand-in vectors so the index stage can run without the encoder
+        n = sum(1 for _ in open(ws / "processed" / "passages.jsonl", "rb"))
+        rng = np.random.default_rng(0)
+        np.save(emb_path, rng.standard_normal((n, EMB_DIM), dtype="float32"))
+    emb = np.load(emb_path).astype("float32")
+    faiss.normalize_L2(emb)
+    index, meta = build_index(emb, opts["index_type"])
+    out = ws / "models" / "faiss.index"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    faiss.write_index(index, str(out))
+    write_meta(out, meta)
+    return len(emb), None
+
+
+def stage_retrieve(ws: Path, opts: dict):
+    from src import registry
+    from src.retrieval.bm25 import build_bm25
+    from src.retrieval.passage_store import PassageStore
+    from src.retrieval.query import retrieve
+    store = _ensure_store(ws)
+    if not (ws / "models" / "bm25" / "meta.json").exists():
+        build_bm25(PassageStore(store), out_dir=ws / "models" / "bm25")
+    _use_workspace_retrieval(ws)
+    for name in ("encoder", "faiss_index", "passages", "bm25"):
+        registry.get(name)
+    pairs = _queries(ws, opts["queries"])
+    lat = _timed_calls(lambda g, d: retrieve(f"{g} {d}", k=5), pairs)
+    return len(pairs), lat
+
+
+def stage_generate(ws: Path, opts: dict):
+    from src import registry
+    from src.generation.generate import generate_hypothesis
+    _ensure_store(ws)
+    _use_workspace_retrieval(ws)
+    registry.get("generator")
+    pairs = _queries(ws, opts["generate_queries"])
+    lat = _timed_calls(lambda g, d: generate_hypothesis(g, d, k=5, use_cache=False), pairs)
+    return len(pairs), lat
+
+
+def stage_novelty_score(ws: Path, opts: dict):
+    from src import registry
+    from src.validation import validate
+    validate.DG_FILE = ws / "databases" / "disgenet_curated.tsv"
+    validate.DG_INDEX = ws / "processed" / "disgenet_index.pkl"
+    validate.DG_INDEX.unlink(missing_ok=True)
+    registry.get("disgenet_index")
+    pairs = _queries(ws, opts["queries"])
+    lat = _timed_calls(validate.novelty_score, pairs)
+    return len(pairs), lat
+
+
+def _run_stage(stage: str, ws: Path, opts: dict) -> dict:
+    fn = globals()[f"stage_{stage}"]
+    t0 = time.perf_counter()
+    n, lat = fn(ws, opts)
+    wall = time.perf_counter() - t0
+    row = {"items": n, "wall_s": round(wall, 3), "peak_rss_mb": round(peak_rss_mb(), 1)}
+    if lat:
+        total = sum(lat)
+        row.update({
+            "throughput_per_s": round(len(lat) / total, 2) if total else None,
+            "p50_ms": round(float(np.percentile(lat, 50)) * 1000, 3),
+            "p99_ms": round(float(np.percentile(lat, 99)) * 1000, 3),
+            "setup_s": round(wall - total, 3),
+        })
+    else:
+        row["throughput_per_s"] = round(n / wall, 2) if wall else None
+    return row
+
+
+def run_scale(n_passages: int, stages, opts: dict, bench_dir: Path = BENCH_DIR) -> dict:
+    ws = bench_dir / f"p{n_passages}"
+    if not (ws / "synthetic.json").exists() or opts["regenerate"]:
+        shutil.rmtree(ws, ignore_errors=True)
+        t0 = time.perf_counter()
+        summary = generate(ws, n_passages, seed=opts["seed"], n_queries=opts["queries"])
+        print(f"Generated synthetic corpus in {time.perf_counter() - t0:.1f}s:", summary)
+    with open(ws / "synthetic.json", "r", encoding="utf-8") as f:
+        corpus = json.load(f)
+    results = {}
+    ctx = mp.get_context("spawn")
+    for stage in stages:
+        print(f"[{n_passages}] {stage} ...")
+        try:
+            with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+                results[stage] = pool.submit(_run_stage, stage, ws, opts).result()
+        except Exception as e:
+            # e.g. a model that cannot be downloaded here; keep going with the other stages
+            results[stage] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"[{n_passages}] {stage}:", results[stage])
+    return {"passages": n_passages, "corpus": corpus, "stages": results}
+
+
+def compare(current: dict, baseline: dict, tolerance: float = TOLERANCE):
+    """
+    Regressions of current vs baseline runs with the same scale: lower
+    throughput, or higher p99 / peak RSS, by more than `tolerance`.
+    """
+    base = {r["passages"]: r for r in baseline.get("runs", [])}
+    regressions = []
+    for run in current["runs"]:
+        ref = base.get(run["passages"])
+        if ref is None:
+            continue
+        for stage, row in run["stages"].items():
+            old = ref["stages"].get(stage)
+            if not old or "error" in row or "error" in old:
+                continue
+            checks = [("throughput_per_s", -1), ("p99_ms", 1), ("peak_rss_mb", 1)]
+            for metric, sign in checks:
+                if row.get(metric) is None or not old.get(metric):
+                    continue
+                change = (row[metric] - old[metric]) / old[metric]
+                if sign * change > tolerance:
+                    regressions.append({"passages": run["passages"], "stage": stage, "metric": metric,
+                                        "baseline": old[metric], "current": row[metric],
+                                        "change": round(change, 3)})
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark pipeline stages on synthetic corpora.")
+    ap.add_argument("--scales", nargs="+", default=["1k"], help="passages per corpus, e.g. 1k 100k 1M")
+    ap.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    ap.add_argument("--bench-dir", type=Path, default=BENCH_DIR, help="where synthetic corpora are kept")
+    ap.add_argument("--queries", type=int, default=200, help="calls timed by retrieve / novelty_score")
+    ap.add_argument("--generate-queries", type=int, default=5, help="calls timed by generate")
+    ap.add_argument("--workers", type=int, default=None, help="processes for passageize / ner")
+    ap.add_argument("--index-type", default="flat")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--regenerate", action="store_true", help="rebuild synthetic corpora that already exist")
+    ap.add_argument("--out", type=Path, default=RESULTS)
+    ap.add_argument("--baseline", type=Path, default=BASELINE)
+    ap.add_argument("--save-baseline", action="store_true", help="write this run as the new baseline")
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative change counted as a regression")
+    args = ap.parse_args()
+
+    opts = {"queries": args.queries, "generate_queries": args.generate_queries, "workers": args.workers,
+            "index_type": args.index_type, "seed": args.seed, "regenerate": args.regenerate}
+    report = {
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {"platform": platform.platform(), "python": sys.version.split()[0],
+                    "cpus": os.cpu_count()},
+        "runs": [run_scale(parse_scale(s), args.stages, opts, args.bench_dir) for s in args.scales],
+    }
+
+    header = f"{'passages':>9} {'stage':<17}{'items':>9}{'wall s':>9}{'items/s':>11}{'p50 ms':>9}{'p99 ms':>9}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for run in report["runs"]:
+        for stage, r in run["stages"].items():
+            if "error" in r:
+                print(f"{run['passages']:>9} {stage:<17}{r['error']}")
+                continue
+            print(f"{run['passages']:>9} {stage:<17}{r['items']:>9}{r['wall_s']:>9.2f}"
+                  f"{str(r['throughput_per_s']):>11}{str(r.get('p50_ms', '-')):>9}{str(r.get('p99_ms', '-')):>9}"
+                  f"{r['peak_rss_mb']:>9.1f}")
+
+    if args.baseline.exists() and not args.save_baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        for r in report["regressions"]:
+            print(f"REGRESSION {r['stage']} @ {r['passages']}: {r['metric']} "
+                  f"{r['baseline']} -> {r['current']} ({r['change']:+.0%})")
+        if not report["regressions"]:
+            print("No regressions against", args.baseline)
+
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    args.out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print("Wrote", args.out)
+    if args.save_baseline:
+        args.baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.baseline.write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print("Saved baseline", args.baseline)
+    if report.get("regressions"):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import argparse
+import gzip
+import json
+import random
+from pathlib import Path
+from xml.sax.saxutils import escape
+
+# -----------------------------
+# Synthetic PubMed-style corpus and database fixtures for benchmarks
+#
+#   raw/pubmed_synth_NNNN.xml.gz       baseline-style files, ARTICLES_PER_FILE each
+#   databases/hgnc_complete_set.txt    symbol / alias / previous symbol columns
+#   databases/disgenet_curated.tsv     gene-disease associations
+#   processed/passages.jsonl           what passageize produces from raw/
+#   processed/ner_predictions.jsonl    gene and disease mentions, as ner_infer writes them
+#   queries.jsonl                      (gene, disease) pairs for the query stages
+#
+# Every abstract section holds exactly SENTENCES_PER_SECTION sentences,
+# so passageize turns each section into one passage and the passage count
+# is known in advance. Output is deterministic for a given seed.
+# -----------------------------
+
+ARTICLES_PER_FILE = 10_000
+SECTIONS = ("background", "methods", "results", "conclusions")
+SENTENCES_PER_SECTION = 3
+SECTIONS_PER_ARTICLE = 2
+
+DISEASE_PREFIX = ["hereditary", "familial", "early-onset", "juvenile", "metastatic", "chronic",
+                  "congenital", "idiopathic", "autoimmune", "sporadic"]
+DISEASE_ORGAN = ["breast", "lung", "colorectal", "renal", "hepatic", "pancreatic", "cardiac",
+                 "retinal", "thyroid", "ovarian", "prostate", "neural", "skeletal", "dermal"]
+DISEASE_KIND = ["carcinoma", "fibrosis", "dystrophy", "neuropathy", "myopathy", "syndrome",
+                "adenoma", "sarcoma", "degeneration", "insufficiency", "lymphoma", "dysplasia"]
+VERBS = ["upregulated", "downregulated", "mutated", "methylated", "amplified", "silenced"]
+FILLER = [
+    "Samples were collected from {n} patients across {m} independent cohorts",
+    "Expression profiles were compared using a linear mixed model with batch correction",
+    "The association remained significant after adjustment for age and sex",
+    "Knockdown experiments in cultured cells reduced proliferation by {n} percent",
+    "These findings were replicated in an external validation cohort of {m} participants",
+    "Pathway enrichment implicated DNA repair and cell cycle regulation",
+    "Whole exome sequencing identified {m} rare variants in affected families",
+    "Survival analysis showed a hazard ratio of {r} for high expression",
+]
+
+
+def parse_scale(text: str) -> int:
+    """
+    '1000', '10k', '1M' -> number of passages.
+    """
+    text = str(text).strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if mult > 1 else text) * mult)
+
+
+def make_genes(n: int, rng: random.Random):
+    symbols = set()
+    while len(symbols) < n:
+        letters = "".join(rng.choice("ABCDEFGHIKLMNPRSTVWXYZ") for _ in range(rng.randint(2, 4)))
+        symbols.add(f"{letters}{rng.randint(1, 99)}")
+    return sorted(symbols)
+
+
+def make_diseases(n: int, rng: random.Random):
+    names = set()
+    while len(names) < n:
+        names.add(f"{rng.choice(DISEASE_PREFIX)} {rng.choice(DISEASE_ORGAN)} {rng.choice(DISEASE_KIND)}")
+    return sorted(names)
+
+
+def write_hgnc(path: Path, genes, rng: random.Random):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("hgnc_id\tsymbol\talias_symbol\tprev_symbol\n")
+        for i, g in enumerate(genes):
+            aliases = "|".join(f"{g}{s}" for s in rng.sample("ABCDEFGH", rng.randint(0, 2)))
+            prev = f"{g}L" if rng.random() < 0.2 else ""
+            f.write(f"HGNC:{i + 1}\t{g}\t{aliases}\t{prev}\n")
+
+
+def write_disgenet(path: Path, genes, diseases, associations: int, rng: random.Random):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pairs = set()
+    while len(pairs) < associations:
+        pairs.add((rng.randrange(len(genes)), rng.randrange(len(diseases))))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("geneSymbol\tdiseaseId\tdiseaseName\tscore\n")
+        for g, d in sorted(pairs):
+            f.write(f"{genes[g]}\tC{d:07d}\t{diseases[d]}\t{rng.random():.2f}\n")
+
+
+def _sentences(gene: str, disease: str, rng: random.Random):
+    sents = [f"{gene} was {rng.choice(VERBS)} in patients with {disease}."]
+    for tmpl in rng.sample(FILLER, SENTENCES_PER_SECTION - 1):
+        sents.append(tmpl.format(n=rng.randint(10, 900), m=rng.randint(2, 40), r=round(rng.uniform(0.5, 3), 2)) + ".")
+    rng.shuffle(sents)
+    return sents
+
+
+def _article_xml(pmid: int, sections) -> str:
+    body = "".join(f'<AbstractText Label="{label.upper()}">{escape(" ".join(sents))}</AbstractText>'
+                   for label, sents in sections)
+    return (f"<PubmedArticle><MedlineCitation><PMID>{pmid}</PMID><Article>"
+            f"<ArticleTitle>Synthetic article {pmid}</ArticleTitle>"
+            f"<Abstract>{body}</Abstract></Article></MedlineCitation></PubmedArticle>\n")
+
+
+def _entities(text: str, gene: str, disease: str):
+    out = []
+    for word, label in ((gene, "Gene"), (disease, "Disease_disorder")):
+        start = text.find(word)
+        if start >= 0:
+            out.append({"entity_group": label, "score": 0.99, "word": word, "start": start, "end": start + len(word)})
+    return out
+
+
+def generate(out_dir: Path, n_passages: int, seed: int = 0, n_queries: int = 200) -> dict:
+    """
+    Write a corpus of about n_passages passages (rounded up to whole
+    articles) plus matching fixtures into out_dir. Returns a summary.
+    """
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    raw, db, processed = out_dir / "raw", out_dir / "databases", out_dir / "processed"
+    for d in (raw, db, processed):
+        d.mkdir(parents=True, exist_ok=True)
+
+    # vocabulary grows sub-linearly with the corpus, like real literature
+    genes = make_genes(max(100, min(40_000, n_passages // 25)), rng)
+    diseases = make_diseases(max(50, min(len(DISEASE_PREFIX) * len(DISEASE_ORGAN) * len(DISEASE_KIND),
+                                         n_passages // 100)), rng)
+    write_hgnc(db / "hgnc_complete_set.txt", genes, rng)
+    write_disgenet(db / "disgenet_curated.tsv", genes, diseases,
+                   min(len(genes) * len(diseases), max(200, n_passages // 10)), rng)
+
+    n_articles = -(-n_passages // SECTIONS_PER_ARTICLE)
+    fxml = None
+    with open(processed / "passages.jsonl", "w", encoding="utf-8") as fpass, \
+            open(processed / "ner_predictions.jsonl", "w", encoding="utf-8") as fner:
+        for a in range(n_articles):
+            if a % ARTICLES_PER_FILE == 0:
+                if fxml is not None:
+                    fxml.write("</PubmedArticleSet>\n")
+                    fxml.close()
+                name = f"pubmed_synth_{a // ARTICLES_PER_FILE + 1:04d}.xml.gz"
+                fxml = gzip.open(raw / name, "wt", encoding="utf-8", compresslevel=1)
+                fxml.write('<?xml version="1.0" ?>\n<PubmedArticleSet>\n')
+            pmid = 90_000_000 + a
+            sections = []
+            for label in rng.sample(SECTIONS, SECTIONS_PER_ARTICLE):
+                gene, disease = rng.choice(genes), rng.choice(diseases)
+                sents = _sentences(gene, disease, rng)
+                sections.append((label, sents))
+                text = " ".join(sents)
+                rec = {"source": name, "pmid": str(pmid), "section": label, "text": text}
+                fpass.write(json.dumps(rec) + "\n")
+                fner.write(json.dumps({**rec, "entities": _entities(text, gene, disease)}) + "\n")
+            fxml.write(_article_xml(pmid, sections))
+        if fxml is not None:
+            fxml.write("</PubmedArticleSet>\n")
+            fxml.close()
+
+    with open(out_dir / "queries.jsonl", "w", encoding="utf-8") as f:
+        for _ in range(n_queries):
+            f.write(json.dumps({"gene": rng.choice(genes), "disease": rng.choice(diseases)}) + "\n")
+
+    summary = {"passages": n_articles * SECTIONS_PER_ARTICLE, "articles": n_articles,
+               "xml_files": -(-n_articles // ARTICLES_PER_FILE), "genes": len(genes),
+               "diseases": len(diseases), "queries": n_queries, "seed": seed}
+    with open(out_dir / "synthetic.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Generate a synthetic PubMed-style corpus and fixtures.")
+    ap.add_argument("--out-dir", type=Path, default=Path("data/bench/1k"))
+    ap.add_argument("--passages", default="1k", help="corpus size, e.g. 1000, 10k, 1M")
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    print("Synthetic corpus:", generate(args.out_dir, parse_scale(args.passages), args.seed, args.queries))
@@ -0,0 +1,119 @@
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+
+# -----------------------------
+# Inference backends for the generator model
+#
+#   fp32   transformers model as downloaded (GPU when available)
+#   int8   torch dynamic int8 quantization of every nn.Linear (CPU)
+#   onnx   ONNX Runtime export with dynamic int8 weights (CPU,
+#          needs `pip install optimum[onnxruntime]`)
+#
+# Quantized models are built once and cached under ARTIFACT_DIR together
+# with the library versions they were built with; a version change
+# rebuilds them. Every backend returns an object with the usual
+# model.generate(...) interface.
+# -----------------------------
+
+BACKENDS = ("fp32", "int8", "onnx")
+BACKEND = os.environ.get("GENERATOR_BACKEND", "fp32")
+ARTIFACT_DIR = Path("models/generator")
+
+
+def artifact_dir(model_name: str, backend: str) -> Path:
+    return ARTIFACT_DIR / f"{model_name.replace('/', '--')}-{backend}"
+
+
+def _read_info(d: Path):
+    path = d / "backend.json"
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_info(d: Path, info: dict):
+    with open(d / "backend.json", "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+
+
+def load_fp32(model_name: str):
+    import torch
+    from transformers import AutoModelForCausalLM
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    return AutoModelForCausalLM.from_pretrained(model_name).to(device).eval(), device
+
+
+def load_int8(model_name: str, rebuild: bool = False):
+    import torch
+    import transformers
+    d = artifact_dir(model_name, "int8")
+    path = d / "model.pt"
+    info = {"model": model_name, "torch": torch.__version__, "transformers": transformers.__version__}
+    if path.exists() and not rebuild and _read_info(d) == info:
+        # the whole quantized module is pickled: no fp32 checkpoint load, no re-quantization
+        model = torch.load(path, weights_only=False)
+    else:
+        print(f"Quantizing {model_name} linear layers to int8 ...")
+        from transformers import AutoModelForCausalLM
+        model = AutoModelForCausalLM.from_pretrained(model_name).eval()
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        d.mkdir(parents=True, exist_ok=True)
+        torch.save(model, path)
+        _write_info(d, info)
+        print("Saved int8 model to", path)
+    return model.eval(), "cpu"
+
+
+def load_onnx(model_name: str, rebuild: bool = False):
+    try:
+        import onnxruntime
+        from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+    except ImportError as e:
+        raise SystemExit(f"The onnx backend needs `pip install optimum[onnxruntime]` ({e})")
+    from importlib.metadata import version
+    d = artifact_dir(model_name, "onnx")
+    info = {"model": model_name, "onnxruntime": onnxruntime.__version__, "optimum": version("optimum")}
+    if rebuild or _read_info(d) != info:
+        print(f"Exporting {model_name} to ONNX and quantizing weights to int8 ...")
+        shutil.rmtree(d, ignore_errors=True)
+        export_dir = d / "fp32"
+        ORTModelForCausalLM.from_pretrained(model_name, export=True).save_pretrained(export_dir)
+        quantizer = ORTQuantizer.from_pretrained(export_dir, file_name="model.onnx")
+        qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+        quantizer.quantize(save_dir=d, quantization_config=qconfig)
+        for cfg in export_dir.glob("*.json"):
+            if not (d / cfg.name).exists():
+                shutil.copy(cfg, d / cfg.name)
+        shutil.rmtree(export_dir)
+        _write_info(d, info)
+        print("Saved ONNX int8 model to", d)
+    return ORTModelForCausalLM.from_pretrained(d, file_name="model_quantized.onnx"), "cpu"
+
+
+def load_model(model_name: str, backend: str = BACKEND, rebuild: bool = False):
+    """
+    (model, device) for the given backend, building and caching the
+    quantized artifact on first use.
+    """
+    if backend == "fp32":
+        return load_fp32(model_name)
+    if backend == "int8":
+        return load_int8(model_name, rebuild)
+    if backend == "onnx":
+        return load_onnx(model_name, rebuild)
+    raise ValueError(f"Unknown generator backend {backend!r}; expected one of {BACKENDS}")
+
+
+if __name__ == "__main__":
+    from src.generation.generate import MODEL
+    ap = argparse.ArgumentParser(description="Build the cached quantized generator artifacts.")
+    ap.add_argument("--backend", choices=BACKENDS[1:], default="int8")
+    ap.add_argument("--model", default=MODEL)
+    ap.add_argument("--rebuild", action="store_true", help="rebuild even if a cached artifact matches")
+    args = ap.parse_args()
+    load_model(args.model, args.backend, rebuild=args.rebuild)
@@ -0,0 +1,133 @@
+import argparse
+import json
+import multiprocessing as mp
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from src.generation.backends import BACKENDS
+
+# -----------------------------
+# Generation throughput, peak memory and output agreement per backend.
+#
+# Each backend runs in its own fresh process so peak RSS is not shared
+# between them; outputs are compared token by token against fp32.
+# -----------------------------
+
+PAIRS = [
+    ("BRCA1", "breast cancer"),
+    ("TP53", "li-fraumeni syndrome"),
+    ("APOE", "alzheimer disease"),
+    ("CFTR", "cystic fibrosis"),
+    ("EGFR", "lung adenocarcinoma"),
+]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_backend(backend: str, prompts, max_new_tokens: int, num_beams: int) -> dict:
+    import torch
+    from transformers import AutoTokenizer
+    from src.generation.backends import load_model
+    from src.generation.generate import MODEL
+    rss0 = peak_rss_mb()
+    t0 = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
+    model, device = load_model(MODEL, backend)
+    load_s = time.perf_counter() - t0
+
+    outputs, latencies, n_tokens = [], [], 0
+    with torch.inference_mode():
+        # warm-up: first call pays for lazy kernel / session initialisation
+        warm = tokenizer(prompts[0], return_tensors="pt").to(device)
+        model.generate(**warm, max_new_tokens=2, num_beams=num_beams)
+        for prompt in prompts:
+            inputs = tokenizer(prompt, return_tensors="pt").to(device)
+            t0 = time.perf_counter()
+            out = model.generate(**inputs, max_new_tokens=max_new_tokens, num_beams=num_beams,
+                                 early_stopping=True)
+            latencies.append(time.perf_counter() - t0)
+            new = out[0, inputs["input_ids"].shape[1]:].tolist()
+            outputs.append(new)
+            n_tokens += len(new)
+    return {
+        "backend": backend,
+        "device": device,
+        "load_s": round(load_s, 2),
+        "tokens": n_tokens,
+        "tokens_per_s": round(n_tokens / sum(latencies), 2),
+        "mean_latency_s": round(sum(latencies) / len(latencies), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "baseline_rss_mb": round(rss0, 1),
+        "outputs": outputs,
+    }
+
+
+def agreement(ref, other) -> dict:
+    """
+    Exact-match rate and mean shared-prefix fraction of generated token ids.
+    """
+    exact, prefix = 0, 0.0
+    for a, b in zip(ref, other):
+        exact += a == b
+        n = 0
+        while n < min(len(a), len(b)) and a[n] == b[n]:
+            n += 1
+        prefix += n / max(len(a), len(b), 1)
+    return {"exact_match": round(exact / len(ref), 3), "prefix_agreement": round(prefix / len(ref), 3)}
+
+
+def build_prompts(pairs, k: int):
+    from src.generation.generate import build_prompt
+    if k <= 0:
+        return [build_prompt(g, d, []) for g, d in pairs]
+    from src.retrieval.query import retrieve_batch
+    retrieved = retrieve_batch([f"{g} {d}" for g, d in pairs], k=k)
+    return [build_prompt(g, d, passages) for (g, d), passages in zip(pairs, retrieved)]
+
+
+def run_benchmark(backends, prompts, max_new_tokens: int = 64, num_beams: int = 4) -> list:
+    rows = []
+    ctx = mp.get_context("spawn")
+    for backend in backends:
+        with ProcessPoolExecutor(1, mp_context=ctx) as pool:
+            rows.append(pool.submit(_run_backend, backend, prompts, max_new_tokens, num_beams).result())
+    ref = next((r for r in rows if r["backend"] == "fp32"), None)
+    for r in rows:
+        if ref is not None:
+            r.update(agreement(ref["outputs"], r["outputs"]))
+            if ref["tokens_per_s"]:
+                r["speedup"] = round(r["tokens_per_s"] / ref["tokens_per_s"], 2)
+    return rows
+
+
+def main():
+    from src.generation.generate import NUM_BEAMS
+    ap = argparse.ArgumentParser(description="Compare generator backends (speed, memory, agreement with fp32).")
+    ap.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    ap.add_argument("--max-new-tokens", type=int, default=64)
+    ap.add_argument("--num-beams", type=int, default=NUM_BEAMS)
+    ap.add_argument("--k", type=int, default=5, help="retrieved passages per prompt (0: no context)")
+    ap.add_argument("--json", type=Path, default=None, help="also write rows as JSON")
+    args = ap.parse_args()
+
+    prompts = build_prompts(PAIRS, args.k)
+    print(f"Benchmarking {len(prompts)} prompts, max_new_tokens={args.max_new_tokens}, num_beams={args.num_beams}")
+    rows = run_benchmark(args.backends, prompts, args.max_new_tokens, args.num_beams)
+
+    header = f"{'backend':<9}{'load s':>8}{'tok/s':>9}{'speedup':>9}{'peak MB':>10}{'exact':>7}{'prefix':>8}"
+    print(header)
+    print("-" * len(header))
+    for r in rows:
+        print(f"{r['backend']:<9}{r['load_s']:>8.2f}{r['tokens_per_s']:>9.2f}{str(r.get('speedup', '-')):>9}"
+              f"{r['peak_rss_mb']:>10.1f}{str(r.get('exact_match', '-')):>7}{str(r.get('prefix_agreement', '-')):>8}")
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import re
+
+# -----------------------------
+# Token-budgeted context packing for the generation prompt
+# -----------------------------
+
+
+def split_sentences(text: str):
+    # same splitter as preprocess/passageize.py, so trims fall on passage sentence boundaries
+    import nltk
+    try:
+        return nltk.sent_tokenize(text)
+    except LookupError:
+        nltk.download("punkt", quiet=True)
+        nltk.download("punkt_tab", quiet=True)
+        return nltk.sent_tokenize(text)
+
+
+def _shingles(text: str, n: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < n:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def dedupe_passages(passages, overlap: float = 0.8):
+    """
+    Drop passages that repeat or largely overlap a higher-scored one.
+    Overlap is the share of the shorter passage's word 3-grams that also
+    appear in the kept passage. Returns (kept, n_dropped).
+    """
+    kept, kept_sh = [], []
+    for p in sorted(passages, key=lambda p: p.get("score", 0.0), reverse=True):
+        sh = _shingles(p["text"])
+        dup = False
+        for other in kept_sh:
+            small = min(len(sh), len(other))
+            if small == 0 or len(sh & other) / small >= overlap:
+                dup = True
+                break
+        if not dup:
+            kept.append(p)
+            kept_sh.append(sh)
+    return kept, len(passages) - len(kept)
+
+
+def count_tokens(tokenizer, texts):
+    if not texts:
+        return []
+    enc = tokenizer(list(texts), add_special_tokens=False)
+    return [len(ids) for ids in enc["input_ids"]]
+
+
+def pack_context(passages, tokenizer, budget: int, overlap: float = 0.8):
+    """
+    Fill `budget` tokens with passages in score order after removing
+    duplicates. The first passage that does not fit is trimmed at a
+    sentence boundary and packing stops there; if nothing is packed yet
+    and not even its first sentence fits, that sentence is cut to the
+    budget token by token. tokens_dropped counts duplicates too.
+
+    Returns (packed_passages, report). Packed passages are copies; a
+    trimmed one has "truncated": True.
+    """
+    unique, n_dupes = dedupe_passages(passages, overlap=overlap)
+    kept = {id(p) for p in unique}
+    dupe_tokens = sum(count_tokens(tokenizer, [p["text"] for p in passages if id(p) not in kept]))
+    # joined with "\n", which costs about a token per passage
+    lengths = [n + 1 for n in count_tokens(tokenizer, [p["text"] for p in unique])]
+    packed, used = [], 0
+    for p, n in zip(unique, lengths):
+        if used + n <= budget:
+            packed.append(dict(p))
+            used += n
+            continue
+        sents = split_sentences(p["text"])
+        sent_lens = count_tokens(tokenizer, sents)
+        keep, extra = [], 1
+        for s, sn in zip(sents, sent_lens):
+            # +1 for the space the join puts back
+            if used + extra + sn + 1 > budget:
+                break
+            keep.append(s)
+            extra += sn + 1
+        if keep:
+            packed.append({**p, "text": " ".join(keep), "truncated": True})
+            used += extra
+        elif not packed and sents and budget > 1:
+            ids = tokenizer(sents[0], add_special_tokens=False)["input_ids"][:budget - 1]
+            packed.append({**p, "text": tokenizer.decode(ids), "truncated": True})
+            used = len(ids) + 1
+        break
+    total = sum(lengths) + dupe_tokens
+    report = {
+        "budget": budget,
+        "tokens_used": used,
+        "tokens_dropped": max(total - used, 0),
+        "passages_in": len(passages),
+        "passages_packed": len(packed),
+        "duplicates_removed": n_dupes,
+    }
+    return packed, report
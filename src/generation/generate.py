@@ -1,34 +1,275 @@
-import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from src.retrieval.query import retrieve
+import threading
+import time
+from src import metrics, registry
+from src.generation.backends import BACKEND, load_model
+from src.generation.context import pack_context
+from src.generation.result_cache import ResultCache, make_key
+from src.retrieval.query import ENCODER_MODEL, RETRIEVAL_MODE, retrieve_batch
 
 MODEL = "microsoft/biogpt"
+MAX_NEW_TOKENS = 300
+NUM_BEAMS = 4
+# context tokens per prompt; None = whatever is left of the model's
+# position limit after the prompt header and MAX_NEW_TOKENS
+CONTEXT_TOKEN_BUDGET = None
 
-device = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"Device: {device}  |  Loading model: {MODEL}")
+def _load_generator():
+    from transformers import AutoTokenizer
+    print(f"Backend: {BACKEND}  |  Loading model: {MODEL}")
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
+    # decoder-only: pad on the left so every prompt ends where generation starts
+    tokenizer.padding_side = "left"
+    model, device = load_model(MODEL, BACKEND)
+    print("Device:", device)
+    return tokenizer, model, device
 
-tokenizer = AutoTokenizer.from_pretrained(MODEL)
-model = AutoModelForCausalLM.from_pretrained(MODEL).to(device)
+registry.register("generator", _load_generator)
+registry.register("result_cache", ResultCache)
 
-def generate_hypothesis(gene: str, disease: str, k: int = 5):
+def build_prompt(gene: str, disease: str, passages) -> str:
+    context = "\n".join([p["text"] for p in passages])
+    return f"Gene: {gene}\nDisease: {disease}\nContext:\n{context}\nHypothesis:"
+
+def context_budget(tokenizer, model, gene: str, disease: str, budget: int = None) -> int:
     """
-    Generate hypothesis and evidence for a gene-disease pair.
+    Tokens available for retrieved context so that prompt + generation
+    stays inside the model's position limit (1024 for BioGPT).
     """
-    passages = retrieve(f"{gene} {disease}", k=k)
-    context = "\n".join([p["text"] for p in passages])
-    prompt = f"Gene: {gene}\nDisease: {disease}\nContext:\n{context}\nHypothesis:"
+    limit = getattr(model.config, "max_position_embeddings", 1024)
+    header = len(tokenizer(build_prompt(gene, disease, []))["input_ids"])
+    room = max(limit - MAX_NEW_TOKENS - header, 0)
+    return room if budget is None else min(budget, room)
+
+def _prepare(pairs, k: int, budget: int):
+    """
+    Retrieve and pack context for each pair: (prompts, evidence, reports).
+    """
+    tokenizer, model, device = registry.get("generator")
+    retrieved = retrieve_batch([f"{gene} {disease}" for gene, disease in pairs], k=k)
+    evidence, reports, prompts = [], [], []
+    with metrics.span("generate.pack"):
+        for (gene, disease), passages in zip(pairs, retrieved):
+            packed, report = pack_context(passages, tokenizer, context_budget(tokenizer, model, gene, disease, budget))
+            evidence.append(packed)
+            reports.append(report)
+            prompts.append(build_prompt(gene, disease, packed))
+    return prompts, evidence, reports
+
+def _step_timer():
+    """
+    Logits processor that notes when the first decoding step runs, which
+    splits model.generate into prefill (prompt forward pass) and decode.
+    """
+    from transformers import LogitsProcessor, LogitsProcessorList
+
+    class _StepTimer(LogitsProcessor):
+        first_step = None
+
+        def __call__(self, input_ids, scores):
+            if self.first_step is None:
+                self.first_step = time.perf_counter()
+            return scores
 
-    inputs = tokenizer(prompt, return_tensors="pt").to(device)
+    timer = _StepTimer()
+    return timer, LogitsProcessorList([timer])
 
+def _record_generate(tokenizer, inputs, outputs, t0: float, timer):
+    """
+    Prefill / decode spans, generated-token count and tokens/sec for one generate call.
+    """
+    end = time.perf_counter()
+    new = outputs[:, inputs["input_ids"].shape[1]:]
+    tokens = int((new != tokenizer.pad_token_id).sum()) if tokenizer.pad_token_id is not None else new.numel()
+    first = timer.first_step or t0
+    metrics.record("generate.prefill", first - t0, t0)
+    metrics.record("generate.decode", end - first, first, tokens=tokens)
+    metrics.record_generation(tokens, end - first, BACKEND)
+
+def _generate(pairs, k: int, budget: int):
+    tokenizer, model, device = registry.get("generator")
+    prompts, evidence, reports = _prepare(pairs, k, budget)
+
+    with metrics.span("generate.tokenize"):
+        inputs = tokenizer(prompts, return_tensors="pt", padding=True).to(device)
+
+    timer, processors = _step_timer()
+    t0 = time.perf_counter()
     outputs = model.generate(
         **inputs,
-        max_new_tokens=300,
-        num_beams=4,
-        early_stopping=True
+        max_new_tokens=MAX_NEW_TOKENS,
+        num_beams=NUM_BEAMS,
+        early_stopping=True,
+        logits_processor=processors,
     )
+    _record_generate(tokenizer, inputs, outputs, t0, timer)
 
-    hypothesis = tokenizer.decode(outputs[0], skip_special_tokens=True)
-    return hypothesis, passages
+    with metrics.span("generate.detokenize"):
+        hypotheses = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+    return list(zip(hypotheses, evidence, reports))
+
+def cache_key(gene: str, disease: str, k: int, budget: int = CONTEXT_TOKEN_BUDGET,
+              num_beams: int = NUM_BEAMS) -> str:
+    return make_key(
+        gene, disease, k,
+        model=MODEL, backend=BACKEND, encoder=ENCODER_MODEL, index=registry.get("index_version"),
+        retrieval=RETRIEVAL_MODE, max_new_tokens=MAX_NEW_TOKENS, num_beams=num_beams, budget=budget,
+    )
+
+def generate_batch(pairs, k: int = 5, budget: int = CONTEXT_TOKEN_BUDGET, with_report: bool = False,
+                   use_cache: bool = True):
+    """
+    Generate hypotheses for several (gene, disease) pairs at once: one batched
+    retrieval and one padded model.generate call for the pairs not already in
+    the result cache. Returns [(hypothesis, passages), ...], or
+    [(hypothesis, passages, packing_report), ...] with with_report=True.
+    """
+    if not pairs:
+        return []
+    results = [None] * len(pairs)
+    keys = [None] * len(pairs)
+    with metrics.span("generate", pairs=len(pairs)) as span:
+        if use_cache:
+            cache = registry.get("result_cache")
+            for i, (gene, disease) in enumerate(pairs):
+                keys[i] = cache_key(gene, disease, k, budget)
+                hit = cache.get(keys[i])
+                if hit is not None:
+                    results[i] = (hit["hypothesis"], hit["evidence"], hit["report"])
+        todo = [i for i, r in enumerate(results) if r is None]
+        span["cache_misses"] = len(todo)
+        if todo:
+            for i, res in zip(todo, _generate([pairs[i] for i in todo], k, budget)):
+                results[i] = res
+                if use_cache:
+                    cache.put(keys[i], {"hypothesis": res[0], "evidence": res[1], "report": res[2]})
+    if with_report:
+        return results
+    return [(hyp, evid) for hyp, evid, _ in results]
+
+class HypothesisStream:
+    """
+    Iterator over the decoded text of one hypothesis as it is generated in
+    a background thread. `evidence` is set before the first token arrives;
+    cancel() stops decoding after the current token and waits for the
+    thread. Iteration that is abandoned part-way cancels as well.
+    """
+
+    def __init__(self, evidence, report, chunks, stop: threading.Event = None, thread: threading.Thread = None,
+                 on_done=None, started_at: float = None):
+        self.evidence = evidence
+        self.report = report
+        self.text = ""
+        self.done = False
+        self.cancelled = False
+        self.error = None
+        self._chunks = chunks
+        self._stop = stop
+        self._thread = thread
+        self._on_done = on_done
+        self._started_at = started_at or time.perf_counter()
+
+    def __iter__(self):
+        finished = False
+        try:
+            for chunk in self._chunks:
+                if self.cancelled:
+                    break
+                if not self.text and chunk:
+                    metrics.record("generate.first_token", time.perf_counter() - self._started_at, self._started_at)
+                self.text += chunk
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                self.cancel()
+        self._join()
+        if self.error is not None:
+            raise self.error
+        if self._on_done is not None and not self.cancelled:
+            self._on_done(self)
+
+    def _join(self):
+        if self._thread is not None:
+            self._thread.join()
+        self.done = True
+
+    def cancel(self):
+        if self.done:
+            return
+        self.cancelled = True
+        if self._stop is not None:
+            self._stop.set()
+        self._join()
+
+def _stream(gene: str, disease: str, k: int, budget: int, do_sample: bool, temperature: float,
+            top_p: float, on_done) -> HypothesisStream:
+    import torch
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    class _StopOnEvent(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), stop.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    started_at = time.perf_counter()
+    tokenizer, model, device = registry.get("generator")
+    prompts, evidence, reports = _prepare([(gene, disease)], k, budget)
+    inputs = tokenizer(prompts, return_tensors="pt").to(device)
+    timer, processors = _step_timer()
+    stop = threading.Event()
+    # beam search only knows its output at the end, so streaming decodes greedily or samples
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    kwargs = dict(inputs, max_new_tokens=MAX_NEW_TOKENS, num_beams=1, do_sample=do_sample,
+                  streamer=streamer, stopping_criteria=StoppingCriteriaList([_StopOnEvent()]),
+                  logits_processor=processors)
+    if do_sample:
+        kwargs.update(temperature=temperature, top_p=top_p)
+
+    def run():
+        try:
+            t0 = time.perf_counter()
+            with torch.inference_mode():
+                outputs = model.generate(**kwargs)
+            _record_generate(tokenizer, inputs, outputs, t0, timer)
+        except Exception as e:
+            stream.error = e
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="hypothesis-stream", daemon=True)
+    stream = HypothesisStream(evidence[0], reports[0], streamer, stop, thread, on_done, started_at)
+    thread.start()
+    return stream
+
+def stream_hypothesis(gene: str, disease: str, k: int = 5, budget: int = CONTEXT_TOKEN_BUDGET,
+                      do_sample: bool = False, temperature: float = 0.7, top_p: float = 0.9,
+                      use_cache: bool = True) -> HypothesisStream:
+    """
+    Start generating a hypothesis and return a HypothesisStream of text
+    chunks. Greedy results are cached (under their own key, since they
+    differ from the beam-search output); sampled ones are not.
+    """
+    use_cache = use_cache and not do_sample
+    if use_cache:
+        cache = registry.get("result_cache")
+        key = cache_key(gene, disease, k, budget, num_beams=1)
+        hit = cache.get(key)
+        if hit is not None:
+            return HypothesisStream(hit["evidence"], hit["report"], iter([hit["hypothesis"]]))
+
+    def on_done(stream):
+        if use_cache:
+            cache.put(key, {"hypothesis": stream.text, "evidence": stream.evidence, "report": stream.report})
+
+    return _stream(gene, disease, k, budget, do_sample, temperature, top_p, on_done)
+
+def generate_hypothesis(gene: str, disease: str, k: int = 5, use_cache: bool = True, stream: bool = False,
+                        **stream_kw):
+    """
+    Generate hypothesis and evidence for a gene-disease pair. With
+    stream=True, return a HypothesisStream instead (see stream_hypothesis).
+    """
+    if stream:
+        return stream_hypothesis(gene, disease, k=k, use_cache=use_cache, **stream_kw)
+    return generate_batch([(gene, disease)], k=k, use_cache=use_cache)[0]
 
 if __name__ == "__main__":
     gene = "BRCA1"
@@ -38,3 +279,5 @@ if __name__ == "__main__":
     print("\nSupporting evidence:")
     for p in evid:
         print("-", p["text"][:200], "...")
+    print("\nLoad times (s):", registry.load_times())
+    print("Result cache:", registry.get("result_cache").stats())
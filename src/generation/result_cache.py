@@ -0,0 +1,164 @@
+import atexit
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# -----------------------------
+# On-disk cache of generated hypotheses
+#
+# Keys hash everything that determines the output (normalized gene and
+# disease, k, generation parameters, model names, FAISS index
+# fingerprint), so entries stop matching as soon as any of them changes.
+# Total payload size is bounded; the least recently used rows go first.
+#
+# Reads stay read-only: hit/miss counts and access times are buffered in
+# memory and written in one transaction by the next put(), stats() or
+# every FLUSH_EVERY lookups. The byte total is kept in memory and only
+# recounted from the table when it crosses the limit (other processes
+# may have written too); eviction then goes down to EVICT_TO of the
+# limit, so a full cache does not recount on every put.
+# -----------------------------
+
+CACHE_FILE = Path("data/processed/hypothesis_cache.sqlite")
+MAX_BYTES = 256 * 1024 * 1024
+FLUSH_EVERY = 256
+EVICT_TO = 0.9
+
+
+def make_key(gene: str, disease: str, k: int, **params) -> str:
+    payload = {
+        "gene": gene.strip().upper(),
+        "disease": " ".join(disease.lower().split()),
+        "k": k,
+        **params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: Path = CACHE_FILE, max_bytes: int = MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access);
+            CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0), ('evictions', 0);
+        """)
+        self._conn.commit()
+        self._bytes = self._total_bytes()
+        self._accessed = {}                     # key -> last access time, not yet written
+        self._counts = {"hits": 0, "misses": 0}
+        atexit.register(self.flush)
+
+    def _bump(self, name: str, n: int = 1):
+        self._conn.execute("UPDATE stats SET value = value + ? WHERE name = ?", (n, name))
+
+    def _total_bytes(self) -> int:
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+    def _flush(self):
+        if self._accessed:
+            self._conn.executemany("UPDATE results SET last_access = ? WHERE key = ?",
+                                   [(t, k) for k, t in self._accessed.items()])
+            self._accessed = {}
+        for name, n in self._counts.items():
+            if n:
+                self._bump(name, n)
+                self._counts[name] = 0
+
+    def flush(self):
+        """
+        Write buffered hit/miss counts and access times.
+        """
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._counts["misses"] += 1
+            else:
+                self._accessed[key] = time.time()
+                self._counts["hits"] += 1
+            if sum(self._counts.values()) >= FLUSH_EVERY:
+                self._flush()
+                self._conn.commit()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, key: str, value):
+        data = json.dumps(value, ensure_ascii=False)
+        size = len(data.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM results WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                               (key, data, size, now, now))
+            self._bytes += size - (old[0] if old else 0)
+            self._accessed.pop(key, None)
+            self._flush()
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        if self._bytes <= self.max_bytes:
+            return
+        # recount once before evicting: other processes may have written or evicted
+        total = self._bytes = self._total_bytes()
+        if total <= self.max_bytes:
+            return
+        evicted, target = 0, int(self.max_bytes * EVICT_TO)
+        while total > target:
+            rows = self._conn.execute(
+                "SELECT key, size FROM results ORDER BY last_access LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if total <= target:
+                    break
+                self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                total -= size
+                evicted += 1
+        self._bytes = total
+        self._bump("evictions", evicted)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.execute("UPDATE stats SET value = 0")
+            self._conn.commit()
+            self._bytes = 0
+            self._accessed = {}
+            self._counts = {"hits": 0, "misses": 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._flush()
+            self._conn.commit()
+            out = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            out["entries"], out["bytes"] = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        lookups = out["hits"] + out["misses"]
+        out["hit_rate"] = round(out["hits"] / lookups, 3) if lookups else 0.0
+        out["max_bytes"] = self.max_bytes
+        return out
+
+
+if __name__ == "__main__":
+    print("Hypothesis cache:", ResultCache().stats())
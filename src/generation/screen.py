@@ -0,0 +1,194 @@
+import argparse
+import json
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from src import metrics
+
+# -----------------------------
+# Bulk screening of candidate gene-disease pairs
+#
+#   python -m src.generation.screen candidates.tsv --out outputs/screen/run1
+#
+# Input is a TSV (columns gene, disease; a header row is optional) or
+# JSONL ({"gene": ..., "disease": ...}). Pairs are cut into shards of
+# SHARD_SIZE in input order; each shard is scored for novelty first
+# (cheap, one pass over the DisGeNET index) and only the novel pairs go
+# through batched retrieval + generation. Every finished shard is written
+# atomically as part-XXXXX.jsonl (or .parquet), so an interrupted run
+# picks up at the first missing part. With --workers > 1 shards run in
+# separate processes, each loading its own models.
+# -----------------------------
+
+OUT_DIR = Path("outputs/screen")
+SHARD_SIZE = 1000
+BATCH_SIZE = 8
+FORMATS = ("jsonl", "parquet")
+
+
+def read_pairs(path: Path):
+    """
+    [(gene, disease), ...] from a TSV or JSONL file.
+    """
+    path = Path(path)
+    pairs = []
+    with open(path, "r", encoding="utf-8") as f:
+        if path.suffix in (".jsonl", ".json"):
+            for line in f:
+                if line.strip():
+                    rec = json.loads(line)
+                    pairs.append((rec["gene"].strip(), rec["disease"].strip()))
+            return pairs
+        for lineno, line in enumerate(f):
+            cols = [c.strip() for c in line.rstrip("\n").split("\t")]
+            if len(cols) < 2 or not cols[0]:
+                continue
+            if lineno == 0 and (cols[0].lower(), cols[1].lower()) == ("gene", "disease"):
+                continue
+            pairs.append((cols[0], cols[1]))
+    return pairs
+
+
+def part_path(out_dir: Path, shard: int, fmt: str) -> Path:
+    return out_dir / f"part-{shard:05d}.{fmt}"
+
+
+def _write_part(records, path: Path, fmt: str):
+    # write-then-rename: a part file exists only once it is complete
+    tmp = path.with_name(path.name + ".tmp")
+    if fmt == "parquet":
+        import pandas as pd
+        pd.DataFrame.from_records(records).to_parquet(tmp, index=False)
+    else:
+        with open(tmp, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    tmp.replace(path)
+
+
+def screen_shard(pairs, k: int = 5, batch_size: int = BATCH_SIZE, include_known: bool = False) -> list:
+    """
+    Novelty-check, then generate for, one shard of pairs. Known pairs are
+    returned without a hypothesis unless include_known is set.
+    """
+    from src.generation.generate import generate_batch
+    from src.validation.validate import novelty_scores
+
+    novelty = novelty_scores(pairs)
+    records = [{"gene": g, "disease": d, "novelty_score": s, "known": s == 0.0,
+                "hypothesis": None, "evidence": []}
+               for (g, d), s in zip(pairs, novelty)]
+    todo = [i for i, rec in enumerate(records) if include_known or not rec["known"]]
+    for start in range(0, len(todo), batch_size):
+        batch = todo[start:start + batch_size]
+        results = generate_batch([pairs[i] for i in batch], k=k)
+        for i, (hypothesis, evidence) in zip(batch, results):
+            records[i]["hypothesis"] = hypothesis
+            records[i]["evidence"] = evidence
+    metrics.inc("screened_pairs_total", len(pairs), help="Pairs screened in bulk runs")
+    metrics.inc("screen_generated_total", len(todo), help="Screened pairs sent to generation")
+    return records
+
+
+def _run_shard(shard: int, pairs, out_dir: Path, fmt: str, k: int, batch_size: int, include_known: bool):
+    t0 = time.perf_counter()
+    records = screen_shard(pairs, k=k, batch_size=batch_size, include_known=include_known)
+    _write_part(records, part_path(out_dir, shard, fmt), fmt)
+    generated = sum(r["hypothesis"] is not None for r in records)
+    return shard, len(records), generated, time.perf_counter() - t0
+
+
+def screen(in_file: Path, out_dir: Path, k: int = 5, shard_size: int = SHARD_SIZE, batch_size: int = BATCH_SIZE,
+           workers: int = 1, fmt: str = "jsonl", include_known: bool = False) -> dict:
+    """
+    Screen every pair in in_file, skipping shards already written to
+    out_dir. Returns a summary dict.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}; expected one of {FORMATS}")
+    if fmt == "parquet":
+        # fail before any shard is computed, not when the first one is written
+        try:
+            import pandas, pyarrow
+        except ImportError as e:
+            raise SystemExit(f"--format parquet needs `pip install pandas pyarrow` ({e})")
+    pairs = read_pairs(in_file)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    config = {"input": str(in_file), "pairs": len(pairs), "k": k, "shard_size": shard_size,
+              "format": fmt, "include_known": include_known}
+    config_path = out_dir / "screen.json"
+    if config_path.exists():
+        with open(config_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        if previous != config:
+            # resuming with other settings would mix incompatible parts
+            raise SystemExit(f"{out_dir} holds a run with {previous}; use a new --out or matching options.")
+    else:
+        with open(config_path, "w", encoding="utf-8") as f:
+            json.dump(config, f, indent=2)
+
+    shards = [(s, pairs[start:start + shard_size])
+              for s, start in enumerate(range(0, len(pairs), shard_size))]
+    todo = [(s, p) for s, p in shards if not part_path(out_dir, s, fmt).exists()]
+    print(f"Screening {len(pairs)} pairs in {len(shards)} shards "
+          f"({len(shards) - len(todo)} already done) with {workers} worker(s) ...")
+
+    t0 = time.perf_counter()
+    screened = generated = 0
+    args = (out_dir, fmt, k, batch_size, include_known)
+    if workers == 1:
+        results = (_run_shard(s, p, *args) for s, p in todo)
+        for shard, n, g, seconds in results:
+            screened, generated = screened + n, generated + g
+            _report(shard, n, g, seconds, screened, t0)
+    else:
+        # spawn: each worker loads its own torch/FAISS state
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")) as pool:
+            futures = [pool.submit(_run_shard, s, p, *args) for s, p in todo]
+            for fut in as_completed(futures):
+                shard, n, g, seconds = fut.result()
+                screened, generated = screened + n, generated + g
+                _report(shard, n, g, seconds, screened, t0)
+    elapsed = time.perf_counter() - t0
+    summary = {"pairs": len(pairs), "screened": screened, "generated": generated,
+               "skipped_known": screened - generated, "parts": len(shards),
+               "seconds": round(elapsed, 2), "pairs_per_sec": round(screened / elapsed, 2) if elapsed > 0 else 0.0}
+    print("Screening summary:", summary)
+    return summary
+
+
+def _report(shard: int, n: int, generated: int, seconds: float, screened: int, t0: float):
+    elapsed = time.perf_counter() - t0
+    print(f"  part {shard:05d}: {n} pairs, {generated} generated, {n - generated} known, {seconds:.1f}s "
+          f"({screened / elapsed if elapsed > 0 else 0.0:.1f} pairs/sec overall)")
+
+
+def iter_results(out_dir: Path):
+    """
+    Yield result records of a (possibly partial) run in input order.
+    """
+    for path in sorted(Path(out_dir).glob("part-*.*")):
+        if path.suffix == ".parquet":
+            import pandas as pd
+            yield from pd.read_parquet(path).to_dict("records")
+        elif path.suffix == ".jsonl":
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    yield json.loads(line)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Screen many gene-disease pairs: novelty first, then generation.")
+    ap.add_argument("pairs", type=Path, help="TSV (gene<TAB>disease) or JSONL with gene/disease fields")
+    ap.add_argument("--out", type=Path, default=None, help=f"output directory (default {OUT_DIR}/<input name>)")
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--format", choices=FORMATS, default="jsonl")
+    ap.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="pairs per output part (resume unit)")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="pairs per generate call")
+    ap.add_argument("--workers", type=int, default=1, help="processes, each with its own models")
+    ap.add_argument("--include-known", action="store_true", help="also generate for known associations")
+    args = ap.parse_args()
+    screen(args.pairs, args.out or OUT_DIR / args.pairs.stem, k=args.k, shard_size=args.shard_size,
+           batch_size=args.batch_size, workers=args.workers, fmt=args.format, include_known=args.include_known)
+    metrics.write_textfile()
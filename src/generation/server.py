@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+
+from src import metrics, registry
+from src.generation.generate import generate_batch
+from src.validation.validate import novelty_scores
+
+# -----------------------------
+# Dynamic-batching HTTP front end for hypothesis generation
+#
+# Requests are queued; a single worker pulls up to MAX_BATCH_SIZE of them,
+# waiting at most MAX_WAIT_MS after the first one arrives, and runs
+# retrieval + generation for the whole group in one padded batch.
+#
+#   uvicorn src.generation.server:app --port 8000
+# -----------------------------
+
+MAX_BATCH_SIZE = 8
+MAX_WAIT_MS = 50
+MAX_K = 50  # evidence passages per request; bounds the index search a batch can ask for
+
+
+class HypothesisRequest(BaseModel):
+    gene: str
+    disease: str
+    k: int = Field(5, ge=1, le=MAX_K)
+
+
+def _run_batch(pairs, k: int):
+    # one trace per micro-batch: its requests share every stage
+    with metrics.trace("hypothesis_batch", pairs=pairs, k=k):
+        results = generate_batch(pairs, k=k)
+        novelty = novelty_scores(pairs)
+        return [(hyp, evid, score) for (hyp, evid), score in zip(results, novelty)]
+
+
+class Batcher:
+    def __init__(self, max_batch_size: int = MAX_BATCH_SIZE, max_wait_ms: float = MAX_WAIT_MS):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        # one thread: the model runs one batch at a time, the event loop stays free
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generate")
+        self.stats = {"requests": 0, "batches": 0, "batched_requests": 0, "errors": 0}
+        self._task = None
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+        self.executor.shutdown(wait=False)
+
+    async def submit(self, req: HypothesisRequest):
+        fut = asyncio.get_running_loop().create_future()
+        self.stats["requests"] += 1
+        await self.queue.put((req, fut, time.perf_counter()))
+        return await fut
+
+    async def _collect(self):
+        batch = [await self.queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.stats["batches"] += 1
+            self.stats["batched_requests"] += len(batch)
+            # generate_batch takes one k; split the micro-batch by k
+            by_k = defaultdict(list)
+            for item in batch:
+                by_k[item[0].k].append(item)
+            for k, items in by_k.items():
+                pairs = [(req.gene, req.disease) for req, _, _ in items]
+                try:
+                    results = await loop.run_in_executor(self.executor, _run_batch, pairs, k)
+                except Exception as e:
+                    self.stats["errors"] += 1
+                    for _, fut, _ in items:
+                        if not fut.done():
+                            fut.set_exception(e)
+                    continue
+                for (req, fut, t0), (hypothesis, evidence, novelty) in zip(items, results):
+                    metrics.observe("request_seconds", time.perf_counter() - t0,
+                                    help="Time from request arrival to response, including queueing")
+                    if not fut.done():
+                        fut.set_result({
+                            "gene": req.gene,
+                            "disease": req.disease,
+                            "hypothesis": hypothesis,
+                            "novelty_score": novelty,
+                            "evidence": evidence,
+                            "batch_size": len(items),
+                            "latency_s": round(time.perf_counter() - t0, 3),
+                        })
+
+    def info(self) -> dict:
+        batches = self.stats["batches"]
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "avg_batch_size": round(self.stats["batched_requests"] / batches, 2) if batches else 0.0,
+            **self.stats,
+        }
+
+
+batcher = Batcher()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry.prewarm(["encoder", "faiss_index", "passages", "generator", "disgenet_index"])
+    batcher.start()
+    yield
+    await batcher.stop()
+
+
+app = FastAPI(title="Gene-Disease Hypothesis Service", lifespan=lifespan)
+
+
+@app.post("/hypothesis")
+async def hypothesis(req: HypothesisRequest):
+    return await batcher.submit(req)
+
+
+@app.get("/stats")
+async def stats():
+    return {**batcher.info(), "load_times": registry.load_times(), "stages": metrics.summary()}
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "generator_loaded": registry.is_loaded("generator")}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=8000)
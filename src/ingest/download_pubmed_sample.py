@@ -1,23 +1,201 @@
-import requests
+import argparse
+import os
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 
+import requests
+from requests.adapters import HTTPAdapter
+
+from src import metrics
+
 DATA_RAW = Path("data/raw")
 DATA_RAW.mkdir(parents=True, exist_ok=True)
 
+# override to test against a local stub server
+EUTILS_BASE = os.environ.get("NCBI_EUTILS_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils")
+API_KEY = os.environ.get("NCBI_API_KEY")
+
+BATCH_SIZE = 200          # PMIDs per efetch call
+MAX_CONCURRENCY = 3
+RETRIES = 5
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """
+    Spaces request starts at least 1/rate seconds apart across threads.
+    NCBI allows 3 requests/s without an API key and 10 with one.
+    """
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def make_session(pool_size: int = MAX_CONCURRENCY) -> requests.Session:
+    s = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
+_session = None
+_limiter = None
+
+
+def _default_client():
+    global _session, _limiter
+    if _session is None:
+        _session = make_session()
+        _limiter = RateLimiter(10 if API_KEY else 3)
+    return _session, _limiter
+
+
+def efetch(pmids, session: requests.Session = None, limiter: RateLimiter = None,
+           base_url: str = None, api_key: str = None, retries: int = RETRIES) -> str:
+    """
+    Fetch PubMed XML for a list of PMIDs in a single efetch call, retrying
+    throttling / server errors with exponential backoff.
+    """
+    if session is None or limiter is None:
+        session, limiter = _default_client()
+    url = f"{(base_url or EUTILS_BASE).rstrip('/')}/efetch.fcgi"
+    data = {"db": "pubmed", "id": ",".join(pmids), "retmode": "xml"}
+    api_key = api_key or API_KEY
+    if api_key:
+        data["api_key"] = api_key
+    for attempt in range(retries + 1):
+        limiter.wait()
+        try:
+            # POST: long id lists do not fit in a URL
+            with metrics.span("ingest.efetch", pmids=len(pmids), attempt=attempt):
+                r = session.post(url, data=data, timeout=60)
+            if r.status_code not in RETRY_STATUS:
+                r.raise_for_status()
+                return r.text
+            retry_after = r.headers.get("Retry-After")
+            err = requests.HTTPError(f"{r.status_code} from efetch", response=r)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            retry_after, err = None, e
+        if attempt == retries:
+            raise err
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else 2 ** attempt
+        time.sleep(delay + random.uniform(0, 0.5))
+
+
 def fetch_pubmed_abstract(pmid: str) -> str:
-    url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-    params = {"db": "pubmed", "id": pmid, "retmode": "xml"}
-    r = requests.get(url, params=params, timeout=30)
-    r.raise_for_status()
-    return r.text
+    return efetch([pmid])
+
+
+def split_articles(xml: str):
+    """
+    Yield (pmid, xml) for every PubmedArticle in an efetch response, each
+    wrapped in its own PubmedArticleSet so files look like single fetches.
+    PubmedBookArticle records (NCBI Bookshelf) yield (pmid, None): they
+    have no abstract layout that passageize reads.
+    """
+    root = ET.fromstring(xml)
+    for art in root:
+        if art.tag == "PubmedArticle":
+            pmid = art.findtext("MedlineCitation/PMID")
+            if pmid:
+                body = ET.tostring(art, encoding="unicode")
+                yield pmid.strip(), f'<?xml version="1.0" ?>\n<PubmedArticleSet>\n{body}\n</PubmedArticleSet>\n'
+        elif art.tag == "PubmedBookArticle":
+            pmid = art.findtext("BookDocument/PMID")
+            if pmid:
+                yield pmid.strip(), None
+
+
+def download(pmids, out_dir: Path = DATA_RAW, batch_size: int = BATCH_SIZE,
+             concurrency: int = MAX_CONCURRENCY, base_url: str = None, api_key: str = None,
+             rate: float = None) -> dict:
+    """
+    Download PMIDs not already present in out_dir, batch_size per request and
+    up to `concurrency` requests in flight. Returns counts.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    unique = [p for p in dict.fromkeys(str(p).strip() for p in pmids) if p]
+    todo = [p for p in unique if not (out_dir / f"{p}.xml").exists()]
+    skipped = len(unique) - len(todo)
+    api_key = api_key or API_KEY
+    session = make_session(concurrency)
+    limiter = RateLimiter(rate or (10 if api_key else 3))
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    saved, failed, books = 0, [], []
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(efetch, b, session, limiter, base_url, api_key): b for b in batches}
+        for fut in as_completed(futures):
+            batch = futures[fut]
+            try:
+                xml = fut.result()
+            except Exception as e:
+                print(f"Error fetching batch of {len(batch)} starting {batch[0]}:", e)
+                failed.extend(batch)
+                continue
+            try:
+                # parse the whole response before writing anything from it
+                articles = list(split_articles(xml))
+            except ET.ParseError as e:
+                print(f"Malformed response for batch of {len(batch)} starting {batch[0]}:", e)
+                failed.extend(batch)
+                continue
+            got, book = set(), set()
+            with metrics.span("ingest.write", pmids=len(batch)):
+                for pmid, article in articles:
+                    if article is None:
+                        book.add(pmid)
+                        continue
+                    (out_dir / f"{pmid}.xml").write_text(article, encoding="utf-8")
+                    got.add(pmid)
+            saved += len(got)
+            books.extend(book)
+            metrics.inc("ingested_articles_total", len(got), help="PubMed articles downloaded")
+            failed.extend(p for p in batch if p not in got and p not in book)
+    elapsed = time.perf_counter() - t0
+    stats = {"requested": len(todo), "saved": saved, "skipped_existing": skipped,
+             "skipped_books": len(books), "failed": len(failed), "seconds": round(elapsed, 1)}
+    print("Download summary:", stats)
+    if books:
+        print("Skipped book records (first 20):", books[:20])
+    if failed:
+        print("Missing PMIDs (first 20):", failed[:20])
+    return stats
+
 
 if __name__ == "__main__":
-    sample_pmids = ["31452104","30049270","31086495"]  # small sample list
-    for pmid in sample_pmids:
-        try:
-            xml = fetch_pubmed_abstract(pmid)
-            out = DATA_RAW / f"{pmid}.xml"
-            out.write_text(xml, encoding="utf-8")
-            print("Saved", out)
-        except Exception as e:
-            print("Error fetching", pmid, e)
+    ap = argparse.ArgumentParser(description="Download PubMed XML via batched efetch.")
+    ap.add_argument("--pmids", nargs="*", default=None)
+    ap.add_argument("--pmid-file", type=Path, default=None, help="one PMID per line")
+    ap.add_argument("--out-dir", type=Path, default=DATA_RAW)
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY)
+    ap.add_argument("--base-url", default=None, help=f"E-utilities base URL (default {EUTILS_BASE})")
+    ap.add_argument("--rate", type=float, default=None, help="requests/sec (default 3, or 10 with an API key)")
+    args = ap.parse_args()
+
+    pmids = args.pmids or []
+    if args.pmid_file:
+        pmids += [l.strip() for l in args.pmid_file.read_text(encoding="utf-8").splitlines() if l.strip()]
+    if not pmids:
+        pmids = ["31452104","30049270","31086495"]  # small sample list
+    download(pmids, args.out_dir, batch_size=args.batch_size, concurrency=args.concurrency,
+             base_url=args.base_url, rate=args.rate)
+    print("Stage timings:", metrics.summary())
+    metrics.write_textfile()
@@ -0,0 +1,209 @@
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# -----------------------------
+# Timing spans, histograms and Prometheus text export.
+#
+#   with metrics.span("retrieve.search"):
+#       ...
+#
+# Every span is observed into the stage-duration histogram. Inside a
+# metrics.trace(...) block spans are also collected per request and,
+# when TRACE_LOG is set, written as one JSON line per request; without
+# it trace() costs a single check. render() returns the Prometheus text
+# exposition format (served by the API at /metrics); batch scripts call
+# write_textfile() for the node_exporter textfile collector.
+#
+#   HYPOTHESIS_METRICS=0          disable spans and histograms
+#   HYPOTHESIS_TRACE_LOG=path     append per-request traces (JSONL)
+#   HYPOTHESIS_METRICS_FILE=path  where batch scripts write their metrics
+# -----------------------------
+
+ENABLED = os.environ.get("HYPOTHESIS_METRICS", "1") != "0"
+TRACE_LOG = os.environ.get("HYPOTHESIS_TRACE_LOG")
+TEXTFILE = os.environ.get("HYPOTHESIS_METRICS_FILE")
+PREFIX = "hypothesis_"
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+_lock = threading.Lock()
+_histograms = {}   # (name, labels) -> Histogram
+_counters = {}     # (name, labels) -> float
+_help = {}
+_trace = contextvars.ContextVar("hypothesis_trace", default=None)
+_trace_lock = threading.Lock()
+
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, buckets=SECONDS_BUCKETS, help: str = "", **labels):
+    if not ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = Histogram(buckets)
+            _help.setdefault(name, help)
+        h.observe(value)
+
+
+def inc(name: str, value: float = 1, help: str = "", **labels):
+    if not ENABLED:
+        return
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+        _help.setdefault(name, help)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """
+    Time a block as `stage`. Extra attributes only go to the trace log.
+    """
+    if not ENABLED:
+        yield attrs
+        return
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    finally:
+        record(stage, time.perf_counter() - t0, t0, **attrs)
+
+
+def record(stage: str, seconds: float, start: float = None, **attrs):
+    """
+    Add a stage timing measured elsewhere (start is a perf_counter value).
+    """
+    if not ENABLED:
+        return
+    observe("stage_seconds", seconds, help="Wall time per pipeline stage", stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        start = time.perf_counter() - seconds if start is None else start
+        trace["spans"].append({"stage": stage, "start_ms": round((start - trace["_t0"]) * 1000, 3),
+                               "ms": round(seconds * 1000, 3), **attrs})
+
+
+@contextmanager
+def trace(name: str, **attrs):
+    """
+    Collect the spans of one request and append them to TRACE_LOG.
+    """
+    if not (ENABLED and TRACE_LOG) or _trace.get() is not None:
+        yield
+        return
+    rec = {"name": name, "time": time.strftime("%Y-%m-%d %H:%M:%S"), **attrs, "spans": [],
+           "_t0": time.perf_counter()}
+    token = _trace.set(rec)
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+        rec["ms"] = round((time.perf_counter() - rec.pop("_t0")) * 1000, 3)
+        line = json.dumps(rec, ensure_ascii=False, default=str)
+        with _trace_lock, open(TRACE_LOG, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def record_generation(tokens: int, seconds: float, backend: str = ""):
+    inc("generated_tokens_total", tokens, help="Tokens generated by the language model", backend=backend)
+    if seconds > 0:
+        observe("generation_tokens_per_second", tokens / seconds, buckets=RATE_BUCKETS,
+                help="Decoding throughput per generate call", backend=backend)
+
+
+def _fmt_labels(labels, extra=()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in items) + "}"
+
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text exposition format.
+    """
+    lines = []
+    with _lock:
+        hists = sorted(_histograms.items())
+        counters = sorted(_counters.items())
+        helps = dict(_help)
+    seen = set()
+    for (name, labels), value in counters:
+        full = PREFIX + name
+        if full not in seen:
+            seen.add(full)
+            lines += [f"# HELP {full} {helps.get(name, '')}", f"# TYPE {full} counter"]
+        lines.append(f"{full}{_fmt_labels(labels)} {value}")
+    for (name, labels), h in hists:
+        full = PREFIX + name
+        if full not in seen:
+            seen.add(full)
+            lines += [f"# HELP {full} {helps.get(name, '')}", f"# TYPE {full} histogram"]
+        cum = 0
+        for le, n in zip(h.buckets, h.counts):
+            cum += n
+            lines.append(f"{full}_bucket{_fmt_labels(labels, [('le', le)])} {cum}")
+        lines.append(f"{full}_bucket{_fmt_labels(labels, [('le', '+Inf')])} {h.count}")
+        lines.append(f"{full}_sum{_fmt_labels(labels)} {h.sum}")
+        lines.append(f"{full}_count{_fmt_labels(labels)} {h.count}")
+    return "\n".join(lines) + "\n"
+
+
+def summary() -> dict:
+    """
+    {stage: {"count", "total_s", "mean_ms"}} from the stage histogram.
+    """
+    with _lock:
+        out = {}
+        for (name, labels), h in _histograms.items():
+            if name == "stage_seconds" and h.count:
+                out[dict(labels)["stage"]] = {"count": h.count, "total_s": round(h.sum, 3),
+                                              "mean_ms": round(h.sum / h.count * 1000, 3)}
+    return dict(sorted(out.items()))
+
+
+def write_textfile(path=None):
+    """
+    Write render() atomically to `path` (default HYPOTHESIS_METRICS_FILE);
+    no-op when neither is set.
+    """
+    path = path or TEXTFILE
+    if not path:
+        return
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(render(), encoding="utf-8")
+    tmp.replace(path)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
@@ -1,7 +1,13 @@
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+import argparse
+import hashlib
 import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import numpy as np
+from src import metrics, registry
 
 # -----------------------------
 # Configuration
@@ -11,21 +17,25 @@ MODEL = "d4data/biomedical-ner-all"
 
 IN_FILE = Path("data/processed/passages.jsonl")
 OUT_FILE = Path("data/processed/ner_predictions.jsonl")
+SHARD_DIR = Path("data/processed/ner_shards")
 
-if not IN_FILE.exists():
-    raise SystemExit("Run preprocessing (passageize.py) first.")
+BATCH_SIZE = 32
 
 # -----------------------------
-# Load tokenizer and model
+# Load tokenizer and model (lazily, on first use)
 # -----------------------------
-tokenizer = AutoTokenizer.from_pretrained(MODEL)
-model = AutoModelForTokenClassification.from_pretrained(MODEL)
-nlp = pipeline(
-    "ner",
-    model=model,
-    tokenizer=tokenizer,
-    aggregation_strategy="simple"  # merge subword tokens
-)
+def _load_ner_pipeline():
+    from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
+    model = AutoModelForTokenClassification.from_pretrained(MODEL)
+    return pipeline(
+        "ner",
+        model=model,
+        tokenizer=tokenizer,
+        aggregation_strategy="simple"  # merge subword tokens
+    )
+
+registry.register("ner_pipeline", _load_ner_pipeline)
 
 # -----------------------------
 # Helper to convert NumPy types to native Python types
@@ -44,18 +54,177 @@ def convert_numpy(obj):
 
 # -----------------------------
 # Run NER inference
+#
+# Passage i goes to shard i % workers. Each worker streams the input,
+# runs its passages through the pipeline in batches and appends to
+# shard-XXXXX.jsonl; after every batch it records (next input line,
+# output bytes) in shard-XXXXX.ckpt. A rerun truncates each shard to its
+# checkpoint and continues from there. The checkpoint also records the
+# input's size, mtime and sha256; a shard whose input has changed starts
+# over instead of resuming. When every shard is complete the shards are
+# interleaved back into input order in OUT_FILE.
 # -----------------------------
-with open(IN_FILE, "r", encoding="utf-8") as fin, open(OUT_FILE, "w", encoding="utf-8") as fout:
-    for line in fin:
-        doc = json.loads(line)
-        text = doc.get("text", "")
+def _shard_paths(shard_dir: Path, shard: int):
+    return shard_dir / f"shard-{shard:05d}.jsonl", shard_dir / f"shard-{shard:05d}.ckpt"
+
+def input_fingerprint(path: Path) -> dict:
+    st = path.stat()
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": h.hexdigest()}
+
+def _read_ckpt(path: Path):
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_ckpt(path: Path, ckpt: dict):
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(ckpt, f)
+    tmp.replace(path)
+
+def _infer_batch(nlp, texts, batch_size: int):
+    try:
+        with metrics.span("ner.batch", passages=len(texts)):
+            return [convert_numpy(ents) for ents in nlp(texts, batch_size=batch_size)]
+    except Exception as e:
+        print("NER batch error, retrying one by one:", e)
+    results = []
+    for text in texts:
         try:
-            ents = nlp(text)
-            ents = convert_numpy(ents)
+            results.append(convert_numpy(nlp(text)))
         except Exception as e:
             print("NER inference error:", e)
-            ents = []
-        doc["entities"] = ents
-        fout.write(json.dumps(doc, ensure_ascii=False) + "\n")
+            results.append([])
+    return results
+
+def run_shard(in_file: Path, shard_dir: Path, shard: int, num_shards: int,
+              batch_size: int = BATCH_SIZE, threads: int = None, fingerprint: dict = None) -> int:
+    """
+    Process the passages of one shard, resuming from its checkpoint unless
+    the input changed since it was written. Returns the number of passages
+    processed in this run.
+    """
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    fingerprint = fingerprint or input_fingerprint(in_file)
+    out_path, ckpt_path = _shard_paths(shard_dir, shard)
+    ckpt = _read_ckpt(ckpt_path)
+    if ckpt is not None and (ckpt.get("input") or {}).get("sha256") != fingerprint["sha256"]:
+        print(f"{in_file} changed since {ckpt_path} was written; restarting shard {shard}")
+        ckpt = None
+    if ckpt is None:
+        ckpt = {"next_line": 0, "bytes": 0, "done": False, "shards": num_shards}
+    ckpt["input"] = fingerprint
+    if ckpt["shards"] != num_shards:
+        raise SystemExit(f"{ckpt_path} was written with {ckpt['shards']} shards; rerun with "
+                         f"--workers {ckpt['shards']} or pass --restart.")
+    if ckpt["done"]:
+        return 0
+
+    nlp = None
+    processed = 0
+    with open(out_path, "a+b") as fout:
+        # drop anything written after the last checkpoint
+        fout.truncate(ckpt["bytes"])
+        fout.seek(ckpt["bytes"])
+        batch, batch_docs = [], []
+        with open(in_file, "r", encoding="utf-8") as fin:
+            for lineno, line in enumerate(fin):
+                if lineno < ckpt["next_line"] or lineno % num_shards != shard:
+                    continue
+                batch_docs.append(json.loads(line))
+                batch.append(lineno)
+                if len(batch) == batch_size:
+                    nlp = nlp or registry.get("ner_pipeline")
+                    processed += _flush(nlp, batch_docs, fout, batch_size)
+                    ckpt.update(next_line=batch[-1] + 1, bytes=fout.tell())
+                    _write_ckpt(ckpt_path, ckpt)
+                    batch, batch_docs = [], []
+        if batch:
+            nlp = nlp or registry.get("ner_pipeline")
+            processed += _flush(nlp, batch_docs, fout, batch_size)
+        ckpt.update(next_line=-1, bytes=fout.tell(), done=True)
+        _write_ckpt(ckpt_path, ckpt)
+    return processed
+
+def _flush(nlp, docs, fout, batch_size: int) -> int:
+    ents = _infer_batch(nlp, [doc.get("text", "") for doc in docs], batch_size)
+    for doc, e in zip(docs, ents):
+        doc["entities"] = e
+        fout.write((json.dumps(doc, ensure_ascii=False) + "\n").encode("utf-8"))
+    fout.flush()
+    os.fsync(fout.fileno())
+    return len(docs)
+
+def _run_shard_args(args):
+    return run_shard(*args)
+
+def merge_shards(shard_dir: Path, num_shards: int, out_file: Path) -> int:
+    """
+    Interleave shard outputs back into input order.
+    """
+    files = [open(_shard_paths(shard_dir, s)[0], "r", encoding="utf-8") for s in range(num_shards)]
+    n = 0
+    try:
+        with open(out_file, "w", encoding="utf-8") as fout:
+            while True:
+                line = files[n % num_shards].readline()
+                if not line:
+                    break
+                fout.write(line)
+                n += 1
+    finally:
+        for f in files:
+            f.close()
+    return n
+
+def run_ner(in_file: Path = IN_FILE, out_file: Path = OUT_FILE, workers: int = 1,
+            batch_size: int = BATCH_SIZE, threads: int = None, shard_dir: Path = SHARD_DIR,
+            restart: bool = False):
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    if restart:
+        for p in shard_dir.glob("shard-*"):
+            p.unlink()
+    t0 = time.perf_counter()
+    # hashed once here rather than in every worker
+    fingerprint = input_fingerprint(in_file)
+    jobs = [(in_file, shard_dir, s, workers, batch_size, threads, fingerprint) for s in range(workers)]
+    if workers == 1:
+        processed = [_run_shard_args(jobs[0])]
+    else:
+        # spawn: forked torch/tokenizer state is not safe to share; a crashed
+        # worker raises here and its shard resumes from the checkpoint next run
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn")) as pool:
+            processed = list(pool.map(_run_shard_args, jobs))
+    elapsed = time.perf_counter() - t0
+    with metrics.span("ner.merge"):
+        total = merge_shards(shard_dir, workers, out_file)
+    done = sum(processed)
+    metrics.record("ner.run", elapsed, t0, workers=workers)
+    metrics.inc("ner_passages_total", done, help="Passages tagged by NER")
+    print(f"Processed {done} passages in {elapsed:.1f}s "
+          f"({done / elapsed if elapsed > 0 else 0.0:.1f} passages/sec, {workers} workers, batch {batch_size})")
+    print(f"Saved NER predictions ({total} passages):", out_file)
 
-print("Saved NER predictions:", OUT_FILE)
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Batched, resumable NER over passages.jsonl.")
+    ap.add_argument("--in-file", type=Path, default=IN_FILE)
+    ap.add_argument("--out-file", type=Path, default=OUT_FILE)
+    ap.add_argument("--workers", type=int, default=1, help="worker processes (one shard each)")
+    ap.add_argument("--threads", type=int, default=None, help="torch threads per worker")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--shard-dir", type=Path, default=SHARD_DIR)
+    ap.add_argument("--restart", action="store_true", help="discard checkpoints and start over")
+    args = ap.parse_args()
+    if not args.in_file.exists():
+        raise SystemExit("Run preprocessing (passageize.py) first.")
+    threads = args.threads or max(1, (os.cpu_count() or 1) // args.workers)
+    run_ner(args.in_file, args.out_file, workers=args.workers, batch_size=args.batch_size,
+            threads=threads, shard_dir=args.shard_dir, restart=args.restart)
+    metrics.write_textfile()
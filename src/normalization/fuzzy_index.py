@@ -0,0 +1,37 @@
+from collections import Counter
+
+# -----------------------------
+# Character-trigram inverted index used to shortlist symbols before
+# fuzzy scoring, so each mention is scored against tens of strings
+# instead of the whole HGNC vocabulary.
+# -----------------------------
+
+
+def trigrams(s: str) -> set:
+    s = f"  {s.lower()} "
+    return {s[i:i + 3] for i in range(len(s) - 2)}
+
+
+class TrigramIndex:
+    def __init__(self, strings):
+        self.strings = list(strings)
+        self.postings = {}
+        for i, s in enumerate(self.strings):
+            for g in trigrams(s):
+                self.postings.setdefault(g, []).append(i)
+
+    def candidates(self, query: str, limit: int = 50):
+        """
+        Up to `limit` strings sharing the most trigrams with `query`,
+        ranked by Dice overlap so short symbols are not drowned out.
+        """
+        q = trigrams(query)
+        counts = Counter()
+        for g in q:
+            counts.update(self.postings.get(g, ()))
+        if not counts:
+            return []
+        scored = sorted(counts.items(),
+                        key=lambda kv: 2 * kv[1] / (len(q) + len(self.strings[kv[0]]) + 1),
+                        reverse=True)
+        return [self.strings[i] for i, _ in scored[:limit]]
@@ -1,58 +1,112 @@
 import json
+import pickle
+from functools import lru_cache
 from pathlib import Path
 import pandas as pd
 from fuzzywuzzy import process
+from src.normalization.fuzzy_index import TrigramIndex
 
 HGNC_TSV = Path("data/raw/databases/hgnc_complete_set.txt")
+HGNC_CACHE = Path("data/processed/hgnc_lookup.pkl")
 NER_IN = Path("data/processed/ner_predictions.jsonl")
 OUT = Path("data/processed/normalized_entities.jsonl")
 
-if not HGNC_TSV.exists():
-    raise SystemExit("Place HGNC file at data/raw/databases/hgnc_complete_set.txt")
-
-hgnc = pd.read_csv(HGNC_TSV, sep="\t", dtype=str, low_memory=False)
-# create lookup tables
-symbol_to_id = dict(zip(hgnc["symbol"].fillna(""), hgnc["hgnc_id"].fillna("")))
-# collect alias / previous symbols
-alias_map = {}
-for _, row in hgnc.iterrows():
-    hid = row.get("hgnc_id")
-    for col in ("alias_symbol", "prev_symbol"):
-        val = row.get(col)
-        if pd.notna(val):
-            for token in str(val).split("|"):
-                alias_map[token] = hid
-
-symbol_list = list(set(list(symbol_to_id.keys()) + list(alias_map.keys())))
-
-def fuzzy_match(name, limit=3):
-    return process.extract(name, symbol_list, limit=limit)
-
-with open(NER_IN, "r", encoding="utf-8") as fin, open(OUT, "w", encoding="utf-8") as fout:
-    for line in fin:
-        doc = json.loads(line)
-        out_norm = []
-        for e in doc.get("entities", []):
-            label = e.get("entity_group","").lower()
-            if label in ("gene","protein","gene_name","protein_name"):
-                mention = e.get("word")
-                if not mention:
-                    continue
-                # exact symbol
-                hid = symbol_to_id.get(mention)
-                if hid:
-                    out_norm.append({"mention": mention, "hgnc_id": hid, "method": "exact"})
-                    continue
-                # alias match
-                if mention in alias_map:
-                    out_norm.append({"mention": mention, "hgnc_id": alias_map[mention], "method": "alias"})
-                    continue
-                # fuzzy
-                cand = fuzzy_match(mention, limit=1)
-                if cand:
-                    out_norm.append({"mention": mention, "candidate": cand[0], "method": "fuzzy", "score": cand[0][1]})
-                else:
-                    out_norm.append({"mention": mention, "candidate": [], "method": "none"})
-        doc["normalized_genes"] = out_norm
-        fout.write(json.dumps(doc, ensure_ascii=False) + "\n")
-print("Saved normalized entities to", OUT)
+# fuzzy scoring only looks at this many trigram candidates per mention
+FUZZY_CANDIDATES = 50
+
+def build_lookup(tsv: Path = HGNC_TSV) -> dict:
+    hgnc = pd.read_csv(tsv, sep="\t", dtype=str, low_memory=False,
+                       usecols=lambda c: c in ("hgnc_id", "symbol", "alias_symbol", "prev_symbol"))
+    # create lookup tables
+    symbol_to_id = dict(zip(hgnc["symbol"].fillna(""), hgnc["hgnc_id"].fillna("")))
+    # collect alias / previous symbols; on conflicts the last row wins and,
+    # within a row, prev_symbol wins over alias_symbol
+    parts = []
+    for order, col in enumerate(("alias_symbol", "prev_symbol")):
+        if col not in hgnc.columns:
+            continue
+        s = hgnc[["hgnc_id", col]].dropna(subset=[col])
+        s = pd.DataFrame({"token": s[col].str.split("|"), "hgnc_id": s["hgnc_id"],
+                          "row": s.index, "order": order}).explode("token")
+        parts.append(s)
+    alias_map = {}
+    if parts:
+        aliases = pd.concat(parts).sort_values(["row", "order"], kind="stable")
+        alias_map = dict(zip(aliases["token"], aliases["hgnc_id"]))
+    symbol_list = list(set(list(symbol_to_id.keys()) + list(alias_map.keys())))
+    st = tsv.stat()
+    return {
+        "source": {"size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        "symbol_to_id": symbol_to_id,
+        "alias_map": alias_map,
+        "symbol_index": TrigramIndex(symbol_list),
+    }
+
+def load_lookup(tsv: Path = HGNC_TSV, cache: Path = HGNC_CACHE) -> dict:
+    """
+    HGNC lookup tables, read from the pickle cache unless the TSV changed.
+    """
+    st = tsv.stat()
+    if cache.exists():
+        with open(cache, "rb") as f:
+            lookup = pickle.load(f)
+        if lookup.get("source") == {"size": st.st_size, "mtime_ns": st.st_mtime_ns}:
+            return lookup
+    lookup = build_lookup(tsv)
+    cache.parent.mkdir(parents=True, exist_ok=True)
+    with open(cache, "wb") as f:
+        pickle.dump(lookup, f, protocol=pickle.HIGHEST_PROTOCOL)
+    print("Cached HGNC lookup tables to", cache)
+    return lookup
+
+def make_fuzzy_matcher(symbol_index: TrigramIndex, candidates: int = FUZZY_CANDIDATES):
+    @lru_cache(maxsize=100_000)
+    def fuzzy_match(name, limit=3):
+        shortlist = symbol_index.candidates(name, limit=candidates)
+        if not shortlist:
+            return []
+        return process.extract(name, shortlist, limit=limit)
+    return fuzzy_match
+
+def normalize_doc(doc: dict, symbol_to_id: dict, alias_map: dict, fuzzy_match) -> list:
+    out_norm = []
+    for e in doc.get("entities", []):
+        label = e.get("entity_group","").lower()
+        if label in ("gene","protein","gene_name","protein_name"):
+            mention = e.get("word")
+            if not mention:
+                continue
+            # exact symbol
+            hid = symbol_to_id.get(mention)
+            if hid:
+                out_norm.append({"mention": mention, "hgnc_id": hid, "method": "exact"})
+                continue
+            # alias match
+            if mention in alias_map:
+                out_norm.append({"mention": mention, "hgnc_id": alias_map[mention], "method": "alias"})
+                continue
+            # fuzzy
+            cand = fuzzy_match(mention, limit=1)
+            if cand:
+                out_norm.append({"mention": mention, "candidate": cand[0], "method": "fuzzy", "score": cand[0][1]})
+            else:
+                out_norm.append({"mention": mention, "candidate": [], "method": "none"})
+    return out_norm
+
+def run_normalization(ner_in: Path = NER_IN, out: Path = OUT, hgnc_tsv: Path = HGNC_TSV,
+                      hgnc_cache: Path = HGNC_CACHE):
+    lookup = load_lookup(hgnc_tsv, hgnc_cache)
+    fuzzy_match = make_fuzzy_matcher(lookup["symbol_index"])
+    with open(ner_in, "r", encoding="utf-8") as fin, open(out, "w", encoding="utf-8") as fout:
+        for line in fin:
+            doc = json.loads(line)
+            doc["normalized_genes"] = normalize_doc(doc, lookup["symbol_to_id"], lookup["alias_map"], fuzzy_match)
+            fout.write(json.dumps(doc, ensure_ascii=False) + "\n")
+    info = fuzzy_match.cache_info()
+    print(f"Fuzzy matches: {info.misses} scored, {info.hits} memoized")
+    print("Saved normalized entities to", out)
+
+if __name__ == "__main__":
+    if not HGNC_TSV.exists():
+        raise SystemExit("Place HGNC file at data/raw/databases/hgnc_complete_set.txt")
+    run_normalization()
@@ -0,0 +1,450 @@
+import argparse
+import ast
+import hashlib
+import json
+import multiprocessing as mp
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+# -----------------------------
+# Incremental runner for the offline pipeline
+#
+#   passageize -> ner -> normalize -> cooccurrence
+#              -> dedup -> embeddings ^
+#                                  -> faiss
+#   disgenet_index
+#
+# Each stage declares its input and output paths. A stage's fingerprint
+# hashes the contents of its inputs, its source files (the listed entry
+# modules plus every src module they import, transitively) and its
+# parameters; a stage whose fingerprint and outputs match the last
+# successful run is skipped. Stages whose dependencies are done run in
+# parallel worker processes, so the NER/normalize branch and the
+# embeddings/index branch overlap.
+#
+# Optional external inputs (the HGNC and DisGeNET downloads) may be
+# absent: their stages, and stages depending on them, are reported as
+# skipped and the rest of the pipeline still runs.
+#
+# With --artifact-cache, outputs are also stored under their fingerprint
+# and restored instead of recomputed when inputs return to an earlier
+# state.
+#
+#   python -m src.pipeline                 # run what is out of date
+#   python -m src.pipeline --dry-run       # show what would run
+#   python -m src.pipeline --force ner     # rerun ner and everything after it
+# -----------------------------
+
+STATE_FILE = Path("data/processed/pipeline_state.json")
+ARTIFACT_CACHE = Path("data/cache/artifacts")
+
+RAW_DIR = Path("data/raw")
+PASS_FILE = Path("data/processed/passages.jsonl")
+DEDUP_FILE = Path("data/processed/passages.dedup.jsonl")
+DEDUP_MAP = Path("data/processed/passages.dedup.jsonl.canonical.npy")
+NER_FILE = Path("data/processed/ner_predictions.jsonl")
+NORM_FILE = Path("data/processed/normalized_entities.jsonl")
+HGNC_TSV = Path("data/raw/databases/hgnc_complete_set.txt")
+DG_FILE = Path("data/raw/databases/disgenet_curated.tsv")
+DG_INDEX = Path("data/processed/disgenet_index.pkl")
+EMB = Path("data/processed/embeddings.npy")
+STORE_DIR = Path("data/processed/passage_store")
+MANIFEST = Path("data/processed/embedding_manifest.json")
+IDX = Path("models/faiss.index")
+IDX_META = Path("models/faiss.index.meta.json")
+BM25_DIR = Path("models/bm25")
+COOC_DIR = Path("data/processed/cooccurrence")
+
+
+class Stage:
+    def __init__(self, name: str, run, inputs, outputs, code, params=None, optional=()):
+        self.name = name
+        self.run = run            # top-level function(**params), executed in a worker process
+        self.inputs = [Path(p) for p in inputs]
+        self.optional = [Path(p) for p in optional]   # inputs whose absence skips the stage
+        self.outputs = [Path(p) for p in outputs]
+        self.code = [Path(p) for p in code]   # entry modules; imports are followed by code_files()
+        self.params = params or {}
+
+
+# stage bodies: imported lazily so the runner itself starts instantly
+
+def run_passageize():
+    from src.preprocess.passageize import run
+    run(RAW_DIR, PASS_FILE)
+
+
+def run_ner(workers: int = 1):
+    from src.ner.ner_infer import run_ner
+    # shard checkpoints fingerprint PASS_FILE, so they resume only on unchanged input
+    run_ner(PASS_FILE, NER_FILE, workers=workers)
+
+
+def run_normalize():
+    from src.normalization.normalize import run_normalization
+    run_normalization(NER_FILE, NORM_FILE, HGNC_TSV)
+
+
+def run_dedup():
+    from src.preprocess.dedup import dedup
+    dedup(PASS_FILE, DEDUP_FILE)
+
+
+def run_embeddings():
+    from src.retrieval.build_embeddings import build
+    build(DEDUP_FILE, EMB, STORE_DIR, MANIFEST, deduped=True)
+
+
+def run_faiss(index_type: str = "flat"):
+    from src.retrieval.build_faiss import build
+    build(index_type, EMB, IDX, MANIFEST)
+
+
+def run_cooccurrence():
+    from src.validation.cooccurrence import update
+    update(NORM_FILE, COOC_DIR, MANIFEST, HGNC_TSV, dedup_map=DEDUP_MAP)
+
+
+def run_disgenet_index():
+    from src.validation.validate import build_index
+    build_index(DG_FILE, DG_INDEX)
+
+
+def default_stages(index_type: str = "flat", ner_workers: int = 1):
+    return [
+        Stage("passageize", run_passageize, [RAW_DIR / "*.xml", RAW_DIR / "*.xml.gz"], [PASS_FILE], ["src/preprocess/passageize.py"]),
+        Stage("ner", run_ner, [PASS_FILE], [NER_FILE], ["src/ner/ner_infer.py"],
+              {"workers": ner_workers}),
+        Stage("normalize", run_normalize, [NER_FILE, HGNC_TSV], [NORM_FILE],
+              ["src/normalization/normalize.py", "src/normalization/fuzzy_index.py"], optional=[HGNC_TSV]),
+        Stage("dedup", run_dedup, [PASS_FILE], [DEDUP_FILE, DEDUP_FILE.with_name(DEDUP_FILE.name + ".report.json"),
+                                                DEDUP_MAP],
+              ["src/preprocess/dedup.py"]),
+        Stage("embeddings", run_embeddings, [DEDUP_FILE], [EMB, STORE_DIR, MANIFEST],
+              ["src/retrieval/build_embeddings.py", "src/retrieval/passage_store.py"]),
+        Stage("faiss", run_faiss, [EMB, MANIFEST, STORE_DIR], [IDX, IDX_META, BM25_DIR],
+              ["src/retrieval/build_faiss.py", "src/retrieval/faiss_utils.py", "src/retrieval/bm25.py"],
+              {"index_type": index_type}),
+        Stage("cooccurrence", run_cooccurrence, [NORM_FILE, MANIFEST, DEDUP_MAP], [COOC_DIR],
+              ["src/validation/cooccurrence.py"]),
+        Stage("disgenet_index", run_disgenet_index, [DG_FILE], [DG_INDEX],
+              ["src/validation/validate.py", "src/validation/association_index.py"], optional=[DG_FILE]),
+    ]
+
+
+def _matches(pattern: Path):
+    return sorted(p for p in pattern.parent.glob(pattern.name) if p.is_file())
+
+
+def _exists(path: Path) -> bool:
+    # glob inputs ("data/raw/*.xml*") need at least one match
+    return bool(_matches(path)) if "*" in path.name else path.exists()
+
+
+class Hasher:
+    """
+    Content hashes of files and directories. Hashes are remembered by
+    (size, mtime) so unchanged files are not read again on the next run.
+    """
+
+    def __init__(self, known: dict = None):
+        self.known = known or {}
+
+    def file(self, path: Path) -> str:
+        st = path.stat()
+        key = str(path)
+        hit = self.known.get(key)
+        if hit and hit[0] == st.st_size and hit[1] == st.st_mtime_ns:
+            return hit[2]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1 << 20):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self.known[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def path(self, path: Path) -> str:
+        if "*" in path.name:
+            h = hashlib.sha256()
+            for p in _matches(path):
+                h.update(f"{p.name}\0{self.file(p)}\n".encode("utf-8"))
+            return h.hexdigest()
+        if path.is_dir():
+            h = hashlib.sha256()
+            for p in sorted(q for q in path.rglob("*") if q.is_file()):
+                h.update(f"{p.relative_to(path)}\0{self.file(p)}\n".encode("utf-8"))
+            return h.hexdigest()
+        if path.exists():
+            return self.file(path)
+        return "missing"
+
+
+def _module_path(name: str):
+    base = Path(*name.split("."))
+    for p in (base.with_suffix(".py"), base / "__init__.py"):
+        if p.is_file():
+            return p
+    return None
+
+
+def _src_imports(path: Path):
+    """
+    Files of the src modules imported anywhere in `path`, including lazy
+    imports inside functions.
+    """
+    names = []
+    for node in ast.walk(ast.parse(path.read_text(encoding="utf-8"), str(path))):
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            # "from src.x import y" may name a module y or an attribute of x
+            names += [node.module] + [f"{node.module}.{a.name}" for a in node.names]
+    files = (_module_path(n) for n in names if n == "src" or n.startswith("src."))
+    return [p for p in files if p is not None]
+
+
+def code_files(code) -> list:
+    """
+    The given source files plus every src module they import, transitively.
+    """
+    seen, todo = set(), [Path(p) for p in code]
+    while todo:
+        p = todo.pop()
+        if p in seen:
+            continue
+        seen.add(p)
+        if p.suffix == ".py" and p.is_file():
+            todo += _src_imports(p)
+    return sorted(seen)
+
+
+def fingerprint(stage: Stage, hasher: Hasher) -> str:
+    h = hashlib.sha256()
+    for kind, paths in (("in", stage.inputs), ("code", code_files(stage.code))):
+        for p in paths:
+            h.update(f"{kind}:{p}:{hasher.path(p)}\n".encode("utf-8"))
+    h.update(json.dumps(stage.params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def output_hashes(stage: Stage, hasher: Hasher) -> dict:
+    return {str(p): hasher.path(p) for p in stage.outputs}
+
+
+def load_state(path: Path = STATE_FILE) -> dict:
+    if not path.exists():
+        return {"stages": {}, "files": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state: dict, path: Path = STATE_FILE):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=1)
+    tmp.replace(path)
+
+
+def dependencies(stages) -> dict:
+    """
+    stage -> names of the stages producing any of its inputs.
+    """
+    producer = {str(o): s.name for s in stages for o in s.outputs}
+    return {s.name: {producer[str(i)] for i in s.inputs if str(i) in producer} for s in stages}
+
+
+def _copy(src: Path, dst: Path):
+    if dst.is_dir():
+        shutil.rmtree(dst)
+    elif dst.exists():
+        dst.unlink()
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    if src.is_dir():
+        shutil.copytree(src, dst)
+    else:
+        shutil.copy2(src, dst)
+
+
+def store_artifacts(stage: Stage, fp: str, cache_dir: Path):
+    # copies, not links: stages rewrite their outputs in place
+    dest = cache_dir / stage.name / fp
+    tmp = dest.with_name(fp + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    for i, p in enumerate(stage.outputs):
+        if p.exists():
+            _copy(p, tmp / f"{i}-{p.name}")
+    shutil.rmtree(dest, ignore_errors=True)
+    tmp.rename(dest)
+
+
+def restore_artifacts(stage: Stage, fp: str, cache_dir: Path) -> bool:
+    src = cache_dir / stage.name / fp
+    if not src.is_dir():
+        return False
+    for i, p in enumerate(stage.outputs):
+        cached = src / f"{i}-{p.name}"
+        if cached.exists():
+            _copy(cached, p)
+    return True
+
+
+def _run_stage(stage: Stage) -> float:
+    t0 = time.perf_counter()
+    stage.run(**stage.params)
+    return time.perf_counter() - t0
+
+
+def run(stages, state_path: Path = STATE_FILE, workers: int = 2, force=(), only=None,
+        dry_run: bool = False, cache_dir: Path = None) -> dict:
+    """
+    Run every out-of-date stage, respecting dependencies. Returns
+    {stage: {"status", "seconds"}}.
+    """
+    state = load_state(state_path)
+    hasher = Hasher(state.get("files"))
+    deps = dependencies(stages)
+    by_name = {s.name: s for s in stages}
+    wanted = set(only) if only else set(by_name)
+    forced = set(force)
+    # forcing a stage also reruns everything downstream of it
+    changed = True
+    while changed:
+        changed = False
+        for name, d in deps.items():
+            if name not in forced and d & forced:
+                forced.add(name)
+                changed = True
+
+    report, done, failed, ran = {}, set(), set(), set()
+    unavailable = set()   # skipped for a missing optional input, directly or upstream
+    pending = [s.name for s in stages if s.name in wanted]
+    # stages outside `only` count as done
+    done |= set(by_name) - wanted
+
+    def decide(stage: Stage):
+        fp = fingerprint(stage, hasher)
+        prev = state["stages"].get(stage.name)
+        if (stage.name not in forced and prev and prev.get("fingerprint") == fp
+                and prev.get("outputs") == output_hashes(stage, hasher)):
+            return fp, "skipped"
+        if stage.name not in forced and cache_dir and not dry_run and restore_artifacts(stage, fp, cache_dir):
+            return fp, "restored"
+        return fp, "run"
+
+    ctx = mp.get_context("spawn")
+    t_start = time.perf_counter()
+    with ProcessPoolExecutor(max(1, workers), mp_context=ctx) as pool:
+        running = {}
+        while pending or running:
+            for name in list(pending):
+                stage = by_name[name]
+                if deps[name] & failed:
+                    pending.remove(name)
+                    failed.add(name)
+                    report[name] = {"status": "blocked", "seconds": 0.0}
+                    continue
+                if not deps[name] <= done:
+                    continue
+                pending.remove(name)
+                absent = [str(p) for p in stage.optional if not _exists(p)]
+                if absent or deps[name] & unavailable:
+                    reason = f"optional input missing: {absent}" if absent else \
+                        f"upstream skipped: {sorted(deps[name] & unavailable)}"
+                    print(f"[{name}] skipped ({reason})")
+                    report[name] = {"status": "skipped", "seconds": 0.0, "reason": reason}
+                    unavailable.add(name)
+                    done.add(name)
+                    continue
+                missing = [str(p) for p in stage.inputs if not _exists(p) and "*" not in p.name]
+                if all("*" in p.name for p in stage.inputs) and not any(_exists(p) for p in stage.inputs):
+                    missing = [str(p) for p in stage.inputs]
+                if missing and not (deps[name] & ran and dry_run):
+                    print(f"[{name}] missing inputs: {missing}")
+                    failed.add(name)
+                    report[name] = {"status": "missing inputs", "seconds": 0.0}
+                    continue
+                # after a dry-run "would run", downstream fingerprints are not knowable yet
+                fp, status = ("?", "run") if dry_run and deps[name] & ran else decide(stage)
+                if status != "run":
+                    print(f"[{name}] {status}")
+                    report[name] = {"status": status, "seconds": 0.0}
+                    if status == "restored":
+                        state["stages"][name] = {"fingerprint": fp, "outputs": output_hashes(stage, hasher),
+                                                 "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+                        ran.add(name)
+                    done.add(name)
+                    continue
+                if dry_run:
+                    print(f"[{name}] would run")
+                    report[name] = {"status": "would run", "seconds": 0.0}
+                    done.add(name)
+                    ran.add(name)
+                    continue
+                print(f"[{name}] running ...")
+                running[pool.submit(_run_stage, stage)] = (name, fp)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name, fp = running.pop(fut)
+                stage = by_name[name]
+                try:
+                    seconds = fut.result()
+                except Exception as e:
+                    print(f"[{name}] FAILED: {type(e).__name__}: {e}")
+                    failed.add(name)
+                    report[name] = {"status": "failed", "seconds": None, "error": str(e)}
+                    continue
+                outputs = output_hashes(stage, hasher)
+                state["stages"][name] = {"fingerprint": fp, "outputs": outputs, "seconds": round(seconds, 2),
+                                         "finished_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+                if cache_dir:
+                    store_artifacts(stage, fp, cache_dir)
+                state["files"] = hasher.known
+                save_state(state, state_path)
+                print(f"[{name}] done in {seconds:.1f}s")
+                report[name] = {"status": "ran", "seconds": round(seconds, 2)}
+                done.add(name)
+                ran.add(name)
+
+    if not dry_run:
+        state["files"] = hasher.known
+        save_state(state, state_path)
+    report["_total"] = {"status": "failed" if failed else "ok", "seconds": round(time.perf_counter() - t_start, 2)}
+    return report
+
+
+def main():
+    from src.retrieval.faiss_utils import INDEX_TYPES
+    names = [s.name for s in default_stages()]
+    ap = argparse.ArgumentParser(description="Run the offline pipeline, skipping up-to-date stages.")
+    ap.add_argument("--only", nargs="+", choices=names, default=None, help="consider only these stages")
+    ap.add_argument("--force", nargs="+", choices=names, default=(), help="rerun these and their dependents")
+    ap.add_argument("--workers", type=int, default=2, help="stages run in parallel")
+    ap.add_argument("--ner-workers", type=int, default=1)
+    ap.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--artifact-cache", nargs="?", type=Path, const=ARTIFACT_CACHE, default=None,
+                    help=f"keep outputs per fingerprint (default dir {ARTIFACT_CACHE})")
+    ap.add_argument("--state", type=Path, default=STATE_FILE)
+    args = ap.parse_args()
+
+    stages = default_stages(args.index_type, args.ner_workers)
+    report = run(stages, args.state, workers=args.workers, force=args.force, only=args.only,
+                 dry_run=args.dry_run, cache_dir=args.artifact_cache)
+
+    print(f"\n{'stage':<16}{'status':<16}{'wall s':>8}")
+    print("-" * 40)
+    for name, r in report.items():
+        secs = "-" if r["seconds"] is None else f"{r['seconds']:.2f}"
+        print(f"{name:<16}{r['status']:<16}{secs:>8}")
+    if report["_total"]["status"] == "failed":
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
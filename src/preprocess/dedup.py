@@ -0,0 +1,200 @@
+import argparse
+import json
+import re
+import time
+import zlib
+from pathlib import Path
+import numpy as np
+from src import metrics
+from src.retrieval.incremental import content_hash
+from src.retrieval.passage_store import iter_jsonl
+
+# -----------------------------
+# Duplicate and near-duplicate passage removal
+#
+# Runs between passageize and build_embeddings. Exact copies (same
+# content_hash as the manifest uses) are found by hash; near-duplicates
+# by MinHash signatures over word shingles, bucketed with LSH (BANDS bands
+# of ROWS values) and confirmed when the estimated Jaccard similarity to
+# the group's first passage is at least THRESHOLD. Every group keeps its
+# first passage as the canonical one; its record gains a "sources" list
+# with the source / pmid / section of every member, so no reference is
+# lost. Output order follows the input. The canonical input line of every
+# input line is saved next to the output (out_file + .canonical.npy), so
+# per-line data derived from the input (NER, co-occurrence) can follow
+# merged passages to their surviving id.
+#
+#   python -m src.preprocess.dedup    # passages.jsonl -> passages.dedup.jsonl
+# -----------------------------
+
+IN_FILE = Path("data/processed/passages.jsonl")
+OUT_FILE = Path("data/processed/passages.dedup.jsonl")
+
+SHINGLE = 5          # words per shingle
+NUM_PERM = 128       # MinHash permutations
+BANDS = 16           # LSH bands x rows = NUM_PERM; candidates from ~0.71 Jaccard up
+ROWS = NUM_PERM // BANDS
+THRESHOLD = 0.8      # estimated Jaccard to count as a duplicate
+SOURCE_FIELDS = ("source", "pmid", "section")
+
+_WORD = re.compile(r"\w+")
+
+
+def _permutations(num_perm: int = NUM_PERM, seed: int = 1):
+    # multiply-add-shift hashing: (a*h + b) mod 2**64 (numpy wraps), top 32 bits
+    rng = np.random.default_rng(seed)
+    a = rng.integers(0, np.iinfo("uint64").max, num_perm, dtype="uint64", endpoint=True) | np.uint64(1)
+    b = rng.integers(0, np.iinfo("uint64").max, num_perm, dtype="uint64", endpoint=True)
+    return a[:, None], b[:, None]
+
+
+def shingles(text: str, size: int = SHINGLE) -> np.ndarray:
+    words = _WORD.findall(text.lower())
+    grams = [" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))]
+    return np.array(sorted({zlib.crc32(g.encode("utf-8")) for g in grams}), dtype="uint64")
+
+
+def minhash(text: str, perms) -> np.ndarray:
+    a, b = perms
+    return ((a * shingles(text)[None, :] + b) >> np.uint64(32)).min(axis=1).astype("uint32")
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = np.arange(n)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i: int, j: int):
+        # the smaller (earlier) index stays the root: it is the canonical passage
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            self.parent[max(ri, rj)] = min(ri, rj)
+
+
+def canonical_path(out_file: Path) -> Path:
+    return out_file.with_name(out_file.name + ".canonical.npy")
+
+
+def find_duplicates(texts, threshold: float = THRESHOLD, bands: int = BANDS, near: bool = True):
+    """
+    canonical[i] = index of the first passage that passage i duplicates
+    (i itself when unique), plus the number of exact and near duplicates.
+    """
+    perms = _permutations(bands * (NUM_PERM // bands))
+    first, canonical, sigs, uniq = {}, [], [], []
+    for i, text in enumerate(texts):
+        h = content_hash(text)
+        if h in first:
+            canonical.append(first[h])
+            continue
+        first[h] = i
+        canonical.append(i)
+        if near:
+            uniq.append(i)
+            sigs.append(minhash(text, perms))
+    canonical = np.array(canonical, dtype="int64")
+    exact = int((canonical != np.arange(len(canonical))).sum())
+    if not near or len(uniq) < 2:
+        return canonical, exact, 0
+
+    # LSH over the exact-unique passages: same band -> candidate, confirm on the full signature
+    sigs = np.vstack(sigs)
+    rows = sigs.shape[1] // bands
+    uf = _UnionFind(len(uniq))
+    for band in range(bands):
+        keys = np.ascontiguousarray(sigs[:, band * rows:(band + 1) * rows]).view(np.dtype((np.void, 4 * rows))).ravel()
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        shared = counts[inverse] > 1
+        if not shared.any():
+            continue
+        members = np.flatnonzero(shared)
+        members = members[np.argsort(inverse[members], kind="stable")]
+        starts = np.flatnonzero(np.r_[True, inverse[members][1:] != inverse[members][:-1]])
+        for group in np.split(members, starts[1:]):
+            head = group[0]
+            sim = (sigs[group[1:]] == sigs[head]).mean(axis=1)
+            for j in group[1:][sim >= threshold]:
+                uf.union(head, j)
+    uniq = np.array(uniq, dtype="int64")
+    roots = np.array([uf.find(j) for j in range(len(uniq))])
+    near_dups = int((roots != np.arange(len(uniq))).sum())
+    # exact copies follow their (possibly merged) first occurrence
+    remap = np.arange(len(canonical))
+    remap[uniq] = uniq[roots]
+    return remap[canonical], exact, near_dups
+
+
+def dedup(in_file: Path = IN_FILE, out_file: Path = OUT_FILE, threshold: float = THRESHOLD,
+          near: bool = True) -> dict:
+    """
+    Write the canonical passages of in_file to out_file, the canonical
+    line map (out_file + .canonical.npy) and a report (out_file +
+    .report.json). Returns the report.
+    """
+    t0 = time.perf_counter()
+    with metrics.span("dedup.signatures"):
+        canonical, exact, near_dups = find_duplicates((rec.get("text", "") for rec in iter_jsonl(in_file)),
+                                                      threshold, near=near)
+    group_size = np.bincount(canonical, minlength=len(canonical))
+
+    # sources of every passage in a group, gathered before writing the canonical record
+    sources = {}
+    bytes_in = 0
+    for i, rec in enumerate(iter_jsonl(in_file)):
+        bytes_in += len(rec.get("text", "").encode("utf-8"))
+        c = canonical[i]
+        if group_size[c] > 1:
+            ref = {k: rec[k] for k in SOURCE_FIELDS if k in rec}
+            if ref not in sources.setdefault(int(c), []):
+                sources[int(c)].append(ref)
+
+    bytes_out = n_out = 0
+    tmp = out_file.with_name(out_file.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as fout:
+        for i, rec in enumerate(iter_jsonl(in_file)):
+            if canonical[i] != i:
+                continue
+            if i in sources:
+                rec["sources"] = sources[i]
+            fout.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            bytes_out += len(rec.get("text", "").encode("utf-8"))
+            n_out += 1
+    tmp.replace(out_file)
+    np.save(canonical_path(out_file), canonical)
+
+    n_in = len(canonical)
+    report = {
+        "passages_in": n_in, "passages_out": n_out,
+        "exact_duplicates": exact, "near_duplicates": near_dups,
+        "groups_merged": len(sources),
+        "passages_removed_pct": round(100 * (n_in - n_out) / n_in, 2) if n_in else 0.0,
+        "text_bytes_in": bytes_in, "text_bytes_out": bytes_out,
+        "threshold": threshold, "num_perm": NUM_PERM, "bands": BANDS,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+    with open(out_file.with_name(out_file.name + ".report.json"), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    metrics.record("dedup.run", time.perf_counter() - t0, t0)
+    metrics.inc("dedup_removed_total", n_in - n_out, help="Duplicate passages removed before embedding")
+    print(f"Dedup: {n_in} -> {n_out} passages ({exact} exact, {near_dups} near duplicates, "
+          f"-{report['passages_removed_pct']}%), text {bytes_in / 1e6:.1f} -> {bytes_out / 1e6:.1f} MB. "
+          f"Saved {out_file}")
+    return report
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Collapse duplicate and near-duplicate passages.")
+    ap.add_argument("--in-file", type=Path, default=IN_FILE)
+    ap.add_argument("--out-file", type=Path, default=OUT_FILE)
+    ap.add_argument("--threshold", type=float, default=THRESHOLD, help="estimated Jaccard for near duplicates")
+    ap.add_argument("--exact-only", action="store_true", help="skip MinHash/LSH")
+    args = ap.parse_args()
+    dedup(args.in_file, args.out_file, args.threshold, near=not args.exact_only)
+    metrics.write_textfile()
@@ -1,13 +1,22 @@
+import argparse
+import gzip
+import io
 import re, json
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import nltk
 nltk.download("punkt", quiet=True)
+nltk.download("punkt_tab", quiet=True)  # needed by sent_tokenize on nltk >= 3.8.2
 from nltk import sent_tokenize
+from src import metrics
 
 RAW_DIR = Path("data/raw")
 OUT_DIR = Path("data/processed")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 OUT_FILE = OUT_DIR / "passages.jsonl"
+PARTS_DIR = OUT_DIR / "passage_parts"
 
 def clean_text(s: str) -> str:
     s = re.sub(r"\s+", " ", s)
@@ -15,15 +24,52 @@ def clean_text(s: str) -> str:
     s = s.replace("\n", " ")
     return s.strip()
 
+def _open_xml(source):
+    if isinstance(source, (str, Path)) and str(source).endswith(".gz"):
+        return gzip.open(source, "rb")
+    if isinstance(source, (str, Path)):
+        return open(source, "rb")
+    return source
+
+def iter_articles(source):
+    """
+    Stream (pmid, [(section, text), ...]) for every PubmedArticle in a
+    PubMed XML file (plain or .gz, single fetch or baseline file with
+    thousands of articles). Memory stays flat: each article is dropped
+    from the tree once it has been read.
+    """
+    with _open_xml(source) as fh:
+        root = None
+        for event, elem in ET.iterparse(fh, events=("start", "end")):
+            if event == "start":
+                if root is None:
+                    root = elem
+                continue
+            if elem.tag != "PubmedArticle":
+                continue
+            pmid = elem.findtext("MedlineCitation/PMID") or ""
+            sections = []
+            for ab in elem.iterfind(".//Abstract/AbstractText"):
+                label = ab.get("Label") or ab.get("NlmCategory") or "abstract"
+                text = "".join(ab.itertext()).strip()
+                if text:
+                    sections.append((label.lower(), text))
+            if not sections:
+                # fallback: ArticleTitle
+                title = elem.find(".//ArticleTitle")
+                if title is not None:
+                    text = "".join(title.itertext()).strip()
+                    if text:
+                        sections.append(("title", text))
+            yield pmid.strip(), sections
+            root.clear()
+
 def extract_text_from_pubmed_xml(xml: str) -> str:
-    # very lightweight extractor for development
-    m = re.search(r"<AbstractText.*?>(.*?)</AbstractText>", xml, flags=re.S|re.I)
-    if m:
-        return re.sub(r"<.*?>", "", m.group(1)).strip()
-    # fallback: try ArticleTitle
-    m2 = re.search(r"<ArticleTitle.*?>(.*?)</ArticleTitle>", xml, flags=re.S|re.I)
-    if m2:
-        return re.sub(r"<.*?>", "", m2.group(1)).strip()
+    """
+    All abstract sections of the first article in an XML string.
+    """
+    for _, sections in iter_articles(io.BytesIO(xml.encode("utf-8"))):
+        return " ".join(text for _, text in sections)
     return ""
 
 def passages_from_text(text: str, sentences_per_passage: int = 3):
@@ -32,16 +78,76 @@ def passages_from_text(text: str, sentences_per_passage: int = 3):
     sents = sent_tokenize(text)
     return [" ".join(sents[i:i+sentences_per_passage]) for i in range(0, len(sents), sentences_per_passage)]
 
-if __name__ == "__main__":
-    xml_files = list(RAW_DIR.glob("*.xml"))
+def passageize_file(path: Path, out_path: Path, sentences_per_passage: int = 3) -> int:
+    """
+    Write the passages of one raw file to out_path. Returns the passage count.
+    """
+    n = 0
+    with open(out_path, "w", encoding="utf-8") as fout:
+        for pmid, sections in iter_articles(path):
+            for section, text in sections:
+                for p in passages_from_text(clean_text(text), sentences_per_passage=sentences_per_passage):
+                    record = {"source": path.name, "pmid": pmid, "section": section, "text": p}
+                    fout.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    n += 1
+    return n
+
+def _part_path(parts_dir: Path, i: int, path: Path) -> Path:
+    return parts_dir / f"{i:06d}-{path.name.split('.')[0]}.jsonl"
+
+def _passageize_job(args):
+    # runs in a worker process: timings travel back with the count
+    path, out_path, spp = args
+    t0 = time.perf_counter()
+    try:
+        n = passageize_file(path, out_path, spp)
+    except ET.ParseError as e:
+        print("Skipping malformed XML", path, e)
+        # drop the passages written before the error; the (empty) part is still concatenated
+        open(out_path, "w").close()
+        n = 0
+    return n, time.perf_counter() - t0
+
+def run(raw_dir: Path = RAW_DIR, out_file: Path = OUT_FILE, workers: int = None,
+        sharded: bool = False, parts_dir: Path = PARTS_DIR, sentences_per_passage: int = 3):
+    xml_files = sorted(list(raw_dir.glob("*.xml")) + list(raw_dir.glob("*.xml.gz")))
     if not xml_files:
         print("No XML files found in data/raw/ — run ingestion first.")
-    with open(OUT_FILE, "w", encoding="utf-8") as fout:
-        for f in xml_files:
-            raw = f.read_text(encoding="utf-8", errors="ignore")
-            txt = extract_text_from_pubmed_xml(raw)
-            txt = clean_text(txt)
-            for p in passages_from_text(txt, sentences_per_passage=3):
-                record = {"source": f.name, "text": p}
-                fout.write(json.dumps(record, ensure_ascii=False) + "\n")
-    print("Wrote passages to", OUT_FILE)
+        return
+    parts_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(f, _part_path(parts_dir, i, f), sentences_per_passage) for i, f in enumerate(xml_files)]
+    with metrics.span("passageize.run", files=len(jobs)):
+        with ProcessPoolExecutor(workers) as pool:
+            done = list(pool.map(_passageize_job, jobs, chunksize=max(1, len(jobs) // 256)))
+    counts = [n for n, _ in done]
+    for (f, _, _), (n, seconds) in zip(jobs, done):
+        metrics.record("passageize.file", seconds, file=f.name, passages=n)
+    metrics.inc("passages_total", sum(counts), help="Passages written by passageize")
+    print(f"Passageized {len(xml_files)} files into {sum(counts)} passages")
+    if sharded:
+        print("Wrote passage shards to", parts_dir)
+        return
+    # concatenate in input order, then drop the parts
+    with metrics.span("passageize.concat"), open(out_file, "wb") as fout:
+        for _, part, _ in jobs:
+            with open(part, "rb") as fin:
+                while chunk := fin.read(1 << 20):
+                    fout.write(chunk)
+            part.unlink()
+    if not any(parts_dir.iterdir()):
+        parts_dir.rmdir()
+    print("Wrote passages to", out_file)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Split PubMed XML (.xml / .xml.gz) into passages.")
+    ap.add_argument("--raw-dir", type=Path, default=RAW_DIR)
+    ap.add_argument("--out-file", type=Path, default=OUT_FILE)
+    ap.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    ap.add_argument("--sharded", action="store_true",
+                    help=f"leave one JSONL per input file in {PARTS_DIR} instead of one ordered file")
+    ap.add_argument("--sentences-per-passage", type=int, default=3)
+    args = ap.parse_args()
+    run(args.raw_dir, args.out_file, workers=args.workers, sharded=args.sharded,
+        sentences_per_passage=args.sentences_per_passage)
+    print("Stage timings:", metrics.summary())
+    metrics.write_textfile()
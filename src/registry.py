@@ -0,0 +1,103 @@
+import threading
+import time
+
+# -----------------------------
+# Process-wide registry of lazily loaded models and indexes.
+#
+# Modules register a zero-argument loader under a name at import time
+# (cheap), and the heavy object is only built the first time get(name)
+# is called. Every later call in the same process returns the cached
+# object.
+# -----------------------------
+
+_loaders = {}
+_cache = {}
+_locks = {}
+_load_times = {}
+_registry_lock = threading.Lock()
+
+
+def register(name: str, loader):
+    """
+    Register a zero-argument loader for `name`. Re-registering replaces the
+    loader and drops any cached object.
+    """
+    with _registry_lock:
+        _loaders[name] = loader
+        _locks.setdefault(name, threading.Lock())
+        _cache.pop(name, None)
+        _load_times.pop(name, None)
+
+
+def get(name: str):
+    """
+    Return the object registered under `name`, loading it on first use.
+    """
+    if name in _cache:
+        return _cache[name]
+    if name not in _loaders:
+        raise KeyError(f"Nothing registered under '{name}'. Registered: {sorted(_loaders)}")
+    with _locks[name]:
+        # another thread may have finished loading while we waited
+        if name in _cache:
+            return _cache[name]
+        t0 = time.perf_counter()
+        obj = _loaders[name]()
+        dt = time.perf_counter() - t0
+        _cache[name] = obj
+        _load_times[name] = dt
+        print(f"Loaded {name} in {dt:.2f}s")
+        return obj
+
+
+def is_loaded(name: str) -> bool:
+    return name in _cache
+
+
+def invalidate(name: str = None):
+    """
+    Drop a cached object (or all of them) so the next get() reloads it.
+    """
+    with _registry_lock:
+        if name is None:
+            _cache.clear()
+            _load_times.clear()
+        else:
+            _cache.pop(name, None)
+            _load_times.pop(name, None)
+
+
+def load_times() -> dict:
+    """
+    Seconds spent in each loader that has run in this process.
+    """
+    return dict(_load_times)
+
+
+def prewarm(names=None, background: bool = True):
+    """
+    Load the given names (default: everything registered) ahead of use.
+
+    With background=True the loads run in a daemon thread and the thread is
+    returned; callers that need a model simply call get() and block until
+    that particular load finishes.
+    """
+    names = list(_loaders) if names is None else list(names)
+    # skip anything already cached or currently being loaded by another thread
+    pending = [n for n in names if n not in _cache and not (n in _locks and _locks[n].locked())]
+    if not pending:
+        return None
+
+    def _run():
+        for n in pending:
+            try:
+                get(n)
+            except Exception as e:
+                print(f"Prewarm of {n} failed:", e)
+
+    if not background:
+        _run()
+        return None
+    t = threading.Thread(target=_run, name="registry-prewarm", daemon=True)
+    t.start()
+    return t
@@ -0,0 +1,108 @@
+import argparse
+import json
+import time
+import faiss, numpy as np
+from pathlib import Path
+from src.retrieval.faiss_utils import build_index, set_search_params
+
+EMB = Path("data/processed/embeddings.npy")
+
+# -----------------------------
+# Recall@k vs. the exact flat index, and per-query latency,
+# for a sweep of ANN index types and search parameters.
+# -----------------------------
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / (len(truth) * k)
+
+def time_queries(index, queries: np.ndarray, k: int):
+    """
+    Search one query at a time (the retrieve() access pattern) and
+    return (ids, per-query latencies in ms).
+    """
+    ids = np.empty((len(queries), k), dtype="int64")
+    lat = np.empty(len(queries))
+    for i in range(len(queries)):
+        t0 = time.perf_counter()
+        _, I = index.search(queries[i:i + 1], k)
+        lat[i] = (time.perf_counter() - t0) * 1000
+        ids[i] = I[0]
+    return ids, lat
+
+def run_benchmark(emb: np.ndarray, k: int = 10, n_queries: int = 200,
+                  nprobes=(1, 4, 16, 64), ef_searches=(16, 64, 256),
+                  types=("flat", "ivf_flat", "ivf_pq", "hnsw"), seed: int = 0, **build_kw):
+    rng = np.random.default_rng(seed)
+    emb = np.ascontiguousarray(emb, dtype="float32")
+    faiss.normalize_L2(emb)
+    # perturbed corpus vectors stand in for real queries
+    q = emb[rng.choice(len(emb), min(n_queries, len(emb)), replace=False)]
+    q = q + rng.normal(scale=0.05, size=q.shape).astype("float32")
+    faiss.normalize_L2(q)
+    k = min(k, len(emb))
+
+    flat, _ = build_index(emb, "flat")
+    _, truth = flat.search(q, k)
+
+    rows = []
+    for t in types:
+        t0 = time.perf_counter()
+        index, meta = build_index(emb, t, **build_kw)
+        build_s = time.perf_counter() - t0
+        if t in ("ivf_flat", "ivf_pq"):
+            sweep = [("nprobe", p) for p in nprobes if p <= meta["nlist"]]
+        elif t == "hnsw":
+            sweep = [("efSearch", ef) for ef in ef_searches]
+        else:
+            sweep = [(None, None)]
+        for param, value in sweep:
+            if param == "nprobe":
+                set_search_params(index, meta, nprobe=value)
+            elif param == "efSearch":
+                set_search_params(index, meta, ef_search=value)
+            found, lat = time_queries(index, q, k)
+            rows.append({
+                "type": t, "param": param, "value": value,
+                f"recall@{k}": round(recall_at_k(truth, found), 4),
+                "p50_ms": round(float(np.percentile(lat, 50)), 3),
+                "p99_ms": round(float(np.percentile(lat, 99)), 3),
+                "build_s": round(build_s, 2),
+                "nlist": meta.get("nlist"),
+            })
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description="Recall/latency benchmark for FAISS index types.")
+    ap.add_argument("--emb", type=Path, default=EMB)
+    ap.add_argument("--synthetic", type=int, default=0,
+                    help="benchmark N random vectors instead of the real embeddings")
+    ap.add_argument("--dim", type=int, default=768)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--queries", type=int, default=200)
+    ap.add_argument("--nlist", type=int, default=None)
+    ap.add_argument("--pq-m", type=int, default=16)
+    ap.add_argument("--json", type=Path, default=None, help="also write rows as JSON")
+    args = ap.parse_args()
+
+    if args.synthetic:
+        emb = np.random.default_rng(0).standard_normal((args.synthetic, args.dim)).astype("float32")
+    else:
+        emb = np.load(args.emb)
+    print(f"Benchmarking {len(emb)} vectors, dim={emb.shape[1]}, k={args.k}")
+    rows = run_benchmark(emb, k=args.k, n_queries=args.queries, nlist=args.nlist, pq_m=args.pq_m)
+
+    header = f"{'type':<10}{'param':<10}{'value':>7}{'recall':>9}{'p50 ms':>9}{'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    rkey = f"recall@{min(args.k, len(emb))}"
+    for r in rows:
+        print(f"{r['type']:<10}{str(r['param'] or '-'):<10}{str(r['value'] or '-'):>7}"
+              f"{r[rkey]:>9.3f}{r['p50_ms']:>9.3f}{r['p99_ms']:>9.3f}")
+    if args.json:
+        args.json.write_text(json.dumps(rows, indent=2), encoding="utf-8")
+        print("Wrote", args.json)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import json
+import re
+from pathlib import Path
+import numpy as np
+from src.retrieval.passage_store import STORE_DIR, PassageStore
+
+# -----------------------------
+# BM25 inverted index over the passage store
+#
+#   vocab.json     term -> term id
+#   offsets.npy    int64[n_terms+1], postings of term t are [off[t]:off[t+1]]
+#   doc_ids.npy    int64 passage ids (same ids as the FAISS index)
+#   tfs.npy        float32 term frequencies
+#   doc_len.npy    float32 length of every passage id (0 for dead ids)
+#   meta.json      k1, b, avgdl, n_docs
+#
+# The arrays are memory-mapped, and a query only reads its own terms'
+# posting lists.
+# -----------------------------
+
+BM25_DIR = Path("models/bm25")
+K1 = 1.2
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset("""
+a an and are as at be been by for from has have in is it its of on or that the their this
+to was were which with we our these those than into not no
+""".split())
+
+
+def tokenize(text: str):
+    return [t for t in _TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def build_bm25(store: PassageStore, ids=None, out_dir: Path = BM25_DIR, k1: float = K1, b: float = B) -> int:
+    """
+    Index the given passage ids (default: all) of a store. Returns the vocabulary size.
+    """
+    ids = range(len(store)) if ids is None else [int(i) for i in ids]
+    vocab, postings = {}, []
+    doc_len = np.zeros(len(store), dtype="float32")
+    for pid in ids:
+        toks = tokenize(store.text(pid))
+        doc_len[pid] = len(toks)
+        counts = {}
+        for t in toks:
+            counts[t] = counts.get(t, 0) + 1
+        for t, c in counts.items():
+            tid = vocab.setdefault(t, len(vocab))
+            if tid == len(postings):
+                postings.append([])
+            postings[tid].append((pid, c))
+
+    offsets = np.zeros(len(postings) + 1, dtype="int64")
+    offsets[1:] = np.cumsum([len(p) for p in postings])
+    doc_ids = np.empty(offsets[-1], dtype="int64")
+    tfs = np.empty(offsets[-1], dtype="float32")
+    for tid, plist in enumerate(postings):
+        s = offsets[tid]
+        doc_ids[s:s + len(plist)] = [p for p, _ in plist]
+        tfs[s:s + len(plist)] = [c for _, c in plist]
+
+    n_docs = len(ids)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / "offsets.npy", offsets)
+    np.save(out_dir / "doc_ids.npy", doc_ids)
+    np.save(out_dir / "tfs.npy", tfs)
+    np.save(out_dir / "doc_len.npy", doc_len)
+    with open(out_dir / "vocab.json", "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"k1": k1, "b": b, "n_docs": n_docs,
+                   "avgdl": float(doc_len.sum() / n_docs) if n_docs else 0.0}, f)
+    return len(vocab)
+
+
+class BM25Index:
+    def __init__(self, index_dir: Path = BM25_DIR):
+        d = Path(index_dir)
+        with open(d / "vocab.json", "r", encoding="utf-8") as f:
+            self.vocab = json.load(f)
+        with open(d / "meta.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.k1, self.b, self.n_docs, self.avgdl = meta["k1"], meta["b"], meta["n_docs"], meta["avgdl"]
+        self.offsets = np.load(d / "offsets.npy", mmap_mode="r")
+        self.doc_ids = np.load(d / "doc_ids.npy", mmap_mode="r")
+        self.tfs = np.load(d / "tfs.npy", mmap_mode="r")
+        self.doc_len = np.load(d / "doc_len.npy", mmap_mode="r")
+
+    def search(self, query: str, k: int = 100):
+        """
+        Top-k (passage ids, BM25 scores), best first. Empty if no query term is indexed.
+        """
+        ids_parts, score_parts = [], []
+        for t in set(tokenize(query)):
+            tid = self.vocab.get(t)
+            if tid is None:
+                continue
+            s, e = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            docs = np.asarray(self.doc_ids[s:e])
+            tf = np.asarray(self.tfs[s:e])
+            df = e - s
+            idf = np.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * np.asarray(self.doc_len[docs]) / max(self.avgdl, 1e-9))
+            ids_parts.append(docs)
+            score_parts.append(idf * tf * (self.k1 + 1) / (tf + norm))
+        if not ids_parts:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        docs, inv = np.unique(np.concatenate(ids_parts), return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(score_parts)).astype("float32")
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return docs[top], scores[top]
+
+
+def build_from_manifest(store_dir: Path = STORE_DIR, out_dir: Path = BM25_DIR) -> int:
+    """
+    (Re)build over the live passages: the manifest's ids when one exists,
+    otherwise every passage in the store.
+    """
+    from src.retrieval.incremental import MANIFEST, live_ids, load_manifest
+    manifest = load_manifest(MANIFEST)
+    store = PassageStore(store_dir)
+    n_terms = build_bm25(store, live_ids(manifest) if manifest else None, out_dir)
+    print(f"Saved BM25 index ({n_terms} terms) to {out_dir}")
+    return n_terms
+
+
+if __name__ == "__main__":
+    build_from_manifest()
@@ -1,23 +1,183 @@
-from sentence_transformers import SentenceTransformer
-import numpy as np, json
+import argparse
+import multiprocessing as mp
+import os
+import time
+import numpy as np
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
+from src import metrics
+from src.retrieval.incremental import MANIFEST, dedup_path, new_manifest, save_manifest
+from src.retrieval.passage_store import STORE_DIR, PassageStore, iter_jsonl, write_store
 
 PASS_FILE = Path("data/processed/passages.jsonl")
 OUT_EMB = Path("data/processed/embeddings.npy")
-OUT_PASS = Path("data/processed/passages_list.json")
-
-model_name = "sentence-transformers/all-mpnet-base-v2"  # change to biomedical SBERT if desired
-model = SentenceTransformer(model_name)
-
-passages = []
-with open(PASS_FILE, "r", encoding="utf-8") as fin:
-    for line in fin:
-        rec = json.loads(line)
-        passages.append(rec["text"])
-
-print(f"Encoding {len(passages)} passages with {model_name} ...")
-emb = model.encode(passages, show_progress_bar=True, convert_to_numpy=True)
-np.save(OUT_EMB, emb)
-with open(OUT_PASS, "w", encoding="utf-8") as f:
-    json.dump(passages, f, ensure_ascii=False)
-print("Saved embeddings:", OUT_EMB, "and passages:", OUT_PASS)
+OUT_STORE = STORE_DIR
+
+# Full rebuild. For nightly updates use: python -m src.retrieval.incremental
+# (it keeps a --dedup build deduplicated: see the manifest's "dedup" flag)
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"  # change to biomedical SBERT if desired
+
+# -----------------------------
+# Streaming encoder
+#
+# Passages are written to the memory-mapped store first, then encoded
+# straight from it: ids are taken SORT_WINDOW at a time, sorted by text
+# length (so each batch pads to similar lengths) and cut into chunks of
+# CHUNK_SIZE. Worker processes read their chunk's texts from the store
+# and return embeddings, which are written into a preallocated
+# memory-mapped .npy. Memory stays bounded by the in-flight chunks, not
+# the corpus.
+# -----------------------------
+
+CHUNK_SIZE = 1024
+SORT_WINDOW = 100_000
+BATCH_SIZE = 64
+
+_model = None
+_store = None
+
+
+def _init_worker(model_name: str, store_dir: str, threads: int = None):
+    global _model, _store
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    _model = SentenceTransformer(model_name)
+    _store = PassageStore(Path(store_dir))
+
+
+def _embedding_dim() -> int:
+    return int(_model.get_sentence_embedding_dimension())
+
+
+def _encode_chunk(ids: np.ndarray, batch_size: int, dtype: str):
+    t0 = time.perf_counter()
+    texts = [_store.text(i) for i in ids]
+    emb = _model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+    return ids, emb.astype(dtype, copy=False), time.perf_counter() - t0
+
+
+def length_sorted_chunks(lengths: np.ndarray, chunk_size: int = CHUNK_SIZE, window: int = SORT_WINDOW):
+    """
+    Yield id arrays of at most chunk_size, sorted by length within each
+    window of consecutive ids (longest first, so memory peaks early).
+    """
+    for start in range(0, len(lengths), window):
+        order = start + np.argsort(-lengths[start:start + window], kind="stable")
+        for i in range(0, len(order), chunk_size):
+            yield order[i:i + chunk_size]
+
+
+def encode_store(store_dir: Path, out_emb: Path, model_name: str = MODEL_NAME, workers: int = 1,
+                 chunk_size: int = CHUNK_SIZE, batch_size: int = BATCH_SIZE, dtype: str = "float32",
+                 threads: int = None) -> int:
+    """
+    Encode every passage of a store into out_emb (row i = passage i).
+    Returns the number of rows written.
+    """
+    store = PassageStore(store_dir)
+    n = len(store)
+    lengths = store.lengths()
+    del store
+    if threads is None and workers > 1:
+        threads = max(1, (os.cpu_count() or 1) // workers)
+    init = (model_name, str(store_dir), threads)
+    tmp = out_emb.with_name(out_emb.name + ".tmp")
+    out_emb.parent.mkdir(parents=True, exist_ok=True)
+
+    print(f"Encoding {n} passages with {model_name} ({workers} workers, chunks of {chunk_size}, {dtype}) ...")
+    t0 = time.perf_counter()
+    if workers == 1:
+        _init_worker(*init)
+        out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(n, _embedding_dim()))
+        done = 0
+        for ids in length_sorted_chunks(lengths, chunk_size):
+            ids, emb, seconds = _encode_chunk(ids, batch_size, dtype)
+            out[ids] = emb
+            done += len(ids)
+            metrics.record("embeddings.chunk", seconds, passages=len(ids))
+            _progress(done, n, t0)
+    else:
+        # spawn: forked torch state is not safe to share
+        with ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn"),
+                                 initializer=_init_worker, initargs=init) as pool:
+            dim = pool.submit(_embedding_dim).result()
+            out = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=(n, dim))
+            chunks = length_sorted_chunks(lengths, chunk_size)
+            pending, done = set(), 0
+            while True:
+                # at most two chunks per worker in flight
+                for ids in chunks:
+                    pending.add(pool.submit(_encode_chunk, ids, batch_size, dtype))
+                    if len(pending) >= 2 * workers:
+                        break
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    ids, emb, seconds = fut.result()
+                    out[ids] = emb
+                    done += len(ids)
+                    metrics.record("embeddings.chunk", seconds, passages=len(ids))
+                _progress(done, n, t0)
+    out.flush()
+    del out
+    tmp.replace(out_emb)
+    elapsed = time.perf_counter() - t0
+    metrics.record("embeddings.run", elapsed, t0, workers=workers)
+    metrics.inc("embedded_passages_total", n, help="Passages encoded by build_embeddings")
+    print(f"Encoded {n} passages in {elapsed:.1f}s ({n / elapsed if elapsed > 0 else 0.0:.1f} passages/sec)")
+    return n
+
+
+def _progress(done: int, n: int, t0: float):
+    elapsed = time.perf_counter() - t0
+    print(f"  {done}/{n} passages ({done / elapsed if elapsed > 0 else 0.0:.1f}/s)", end="\r" if done < n else "\n")
+
+
+def build(pass_file: Path = PASS_FILE, out_emb: Path = OUT_EMB, out_store: Path = OUT_STORE,
+          manifest_path: Path = MANIFEST, model_name: str = MODEL_NAME, workers: int = 1,
+          chunk_size: int = CHUNK_SIZE, batch_size: int = BATCH_SIZE, dtype: str = "float32",
+          threads: int = None, dedup: bool = False, deduped: bool = False) -> int:
+    """
+    Rebuild store, embeddings and manifest from pass_file. `dedup` runs
+    src.preprocess.dedup first; `deduped` says pass_file already is dedup
+    output. Either way the manifest is marked so incremental updates dedup too.
+    """
+    report = None
+    if dedup:
+        from src.preprocess.dedup import dedup as run_dedup
+        out = dedup_path(pass_file)
+        report = run_dedup(pass_file, out)
+        pass_file = out
+    # row i of the embedding matrix is passage i of the store
+    n = write_store(iter_jsonl(pass_file), out_store)
+    encode_store(out_store, out_emb, model_name, workers=workers, chunk_size=chunk_size,
+                 batch_size=batch_size, dtype=dtype, threads=threads)
+    if report:
+        emb = np.load(out_emb, mmap_mode="r")
+        saved = (report["passages_in"] - n) * emb.shape[1] * emb.dtype.itemsize
+        print(f"Dedup skipped encoding {report['passages_in'] - n} passages; "
+              f"embeddings and a flat index are {saved / 1e6:.1f} MB smaller.")
+    store = PassageStore(out_store)
+    save_manifest(new_manifest((store.text(i) for i in range(n)), model_name, dedup=dedup or deduped), manifest_path)
+    print("Saved embeddings:", out_emb, "passage store:", out_store, "and manifest:", manifest_path)
+    return n
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Encode all passages into embeddings.npy (full rebuild).")
+    ap.add_argument("--passages", type=Path, default=PASS_FILE)
+    ap.add_argument("--workers", type=int, default=1, help="encoder processes")
+    ap.add_argument("--threads", type=int, default=None, help="torch threads per worker (default cores/workers)")
+    ap.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="passages per worker task")
+    ap.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    ap.add_argument("--dtype", choices=("float32", "float16"), default="float32",
+                    help="float16 halves the file; build_faiss upcasts when indexing")
+    ap.add_argument("--dedup", action="store_true",
+                    help="collapse duplicate / near-duplicate passages first (src.preprocess.dedup)")
+    args = ap.parse_args()
+    build(args.passages, workers=args.workers, chunk_size=args.chunk_size, batch_size=args.batch_size,
+          dtype=args.dtype, threads=args.threads, dedup=args.dedup)
+    metrics.write_textfile()
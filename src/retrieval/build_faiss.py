@@ -1,14 +1,63 @@
+import argparse
 import faiss, numpy as np
 from pathlib import Path
+from src.retrieval.bm25 import BM25_DIR, build_from_manifest
+from src.retrieval.faiss_utils import INDEX_TYPES, build_index, write_meta
+from src.retrieval.incremental import MANIFEST, live_ids, load_manifest
+from src.retrieval.shards import SHARD_DIR, write_shards
 
 EMB = Path("data/processed/embeddings.npy")
 IDX = Path("models/faiss.index")
 
-emb = np.load(EMB)
-# normalize for inner product search
-faiss.normalize_L2(emb)
-d = emb.shape[1]
-index = faiss.IndexFlatIP(d)
-index.add(emb)
-faiss.write_index(index, str(IDX))
-print("Saved FAISS index to", IDX)
+def build(index_type: str = "flat", emb_path: Path = EMB, out: Path = IDX, manifest_path: Path = MANIFEST,
+          bm25: bool = True, shards: int = 0, shard_dir: Path = SHARD_DIR, **params) -> dict:
+    """
+    Build and save the index (params go to faiss_utils.build_index), or
+    with shards > 0 one index per shard in shard_dir (see shards.py).
+    Returns the index metadata (the shard layout when sharded).
+    """
+    emb = np.load(emb_path, mmap_mode="r")
+    # skip tombstoned rows (removed or duplicate passages) if a manifest exists
+    manifest = load_manifest(manifest_path)
+    ids = live_ids(manifest) if manifest else None
+    # one float32 copy in RAM (embeddings may be stored as float16)
+    emb = (emb if ids is None else emb[ids]).astype("float32")
+    # normalize for inner product search
+    faiss.normalize_L2(emb)
+    if shards:
+        ids = np.arange(len(emb), dtype="int64") if ids is None else ids
+        meta = write_shards(emb, ids, shards, shard_dir, index_type, **params)
+    else:
+        index, meta = build_index(emb, index_type, ids=ids, **params)
+        out.parent.mkdir(parents=True, exist_ok=True)
+        faiss.write_index(index, str(out))
+        write_meta(out, meta)
+        print("Saved FAISS index to", out, meta)
+    if bm25:
+        # same live ids as the FAISS index, for hybrid retrieval in query.py
+        build_from_manifest()
+    return meta
+
+def main():
+    ap = argparse.ArgumentParser(description="Build the FAISS index over passage embeddings.")
+    ap.add_argument("--type", choices=INDEX_TYPES, default="flat")
+    ap.add_argument("--nlist", type=int, default=None, help="IVF lists (default ~4*sqrt(n))")
+    ap.add_argument("--nprobe", type=int, default=None, help="IVF lists probed at query time")
+    ap.add_argument("--pq-m", type=int, default=16, help="PQ sub-quantizers (must divide dim)")
+    ap.add_argument("--pq-nbits", type=int, default=8)
+    ap.add_argument("--hnsw-m", type=int, default=32)
+    ap.add_argument("--ef-construction", type=int, default=200)
+    ap.add_argument("--ef-search", type=int, default=64)
+    ap.add_argument("--train-size", type=int, default=100_000, help="vectors sampled for IVF/PQ training")
+    ap.add_argument("--out", type=Path, default=IDX)
+    ap.add_argument("--shards", type=int, default=0,
+                    help="split into this many shard indexes (served via HYPOTHESIS_SHARDS) instead of one")
+    ap.add_argument("--shard-dir", type=Path, default=SHARD_DIR)
+    ap.add_argument("--no-bm25", action="store_true", help=f"skip rebuilding the BM25 index in {BM25_DIR}")
+    args = ap.parse_args()
+    build(args.type, out=args.out, bm25=not args.no_bm25, shards=args.shards, shard_dir=args.shard_dir, nlist=args.nlist, nprobe=args.nprobe,
+          pq_m=args.pq_m, pq_nbits=args.pq_nbits, hnsw_m=args.hnsw_m,
+          ef_construction=args.ef_construction, ef_search=args.ef_search, train_size=args.train_size)
+
+if __name__ == "__main__":
+    main()
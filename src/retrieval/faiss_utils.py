@@ -0,0 +1,181 @@
+import hashlib
+import json
+import math
+import faiss
+import numpy as np
+from pathlib import Path
+
+# -----------------------------
+# Index construction and search configuration shared by
+# build_faiss.py, query.py and bench_ann.py
+# -----------------------------
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+
+def meta_path(index_path: Path) -> Path:
+    """
+    Metadata lives next to the index: models/faiss.index -> models/faiss.index.meta.json
+    """
+    index_path = Path(index_path)
+    return index_path.with_name(index_path.name + ".meta.json")
+
+
+def read_meta(index_path: Path) -> dict:
+    p = meta_path(index_path)
+    if not p.exists():
+        # indexes built before metadata existed are exact flat indexes
+        return {"type": "flat"}
+    with open(p, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_meta(index_path: Path, meta: dict):
+    with open(meta_path(index_path), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+
+def default_nlist(n: int) -> int:
+    """
+    ~4*sqrt(n) lists, but never more than the number of vectors allows
+    (faiss wants ~39 training points per centroid).
+    """
+    return max(1, min(int(4 * math.sqrt(n)), n // 39))
+
+
+def build_index(emb: np.ndarray, index_type: str = "flat", nlist: int = None,
+                nprobe: int = None, pq_m: int = 16, pq_nbits: int = 8,
+                hnsw_m: int = 32, ef_construction: int = 200, ef_search: int = 64,
+                train_size: int = 100_000, seed: int = 0, ids: np.ndarray = None):
+    """
+    Build an inner-product index over L2-normalized embeddings.
+
+    Vectors are stored under `ids` (default 0..n-1) so that passages can
+    later be added or removed by id without a rebuild.
+
+    Returns (index, meta); meta holds everything query.py needs to
+    configure search on the loaded index.
+    """
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}'. Choose one of {INDEX_TYPES}")
+    emb = np.ascontiguousarray(emb, dtype="float32")
+    n, d = emb.shape
+    meta = {"type": index_type, "dim": d, "metric": "ip"}
+
+    if index_type == "flat":
+        index = faiss.IndexFlatIP(d)
+
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+        meta.update({"hnsw_m": hnsw_m, "efConstruction": ef_construction, "efSearch": ef_search})
+
+    else:
+        nlist = nlist or default_nlist(n)
+        quantizer = faiss.IndexFlatIP(d)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, d, nlist, faiss.METRIC_INNER_PRODUCT)
+        else:
+            if d % pq_m != 0:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {d}")
+            # each PQ codebook wants ~39 training points per centroid (2**nbits centroids)
+            pq_nbits = max(1, min(pq_nbits, int(math.log2(max(n // 39, 2)))))
+            index = faiss.IndexIVFPQ(quantizer, d, nlist, pq_m, pq_nbits, faiss.METRIC_INNER_PRODUCT)
+            meta.update({"pq_m": pq_m, "pq_nbits": pq_nbits})
+
+        rng = np.random.default_rng(seed)
+        sample = emb if n <= train_size else emb[rng.choice(n, train_size, replace=False)]
+        index.train(sample)
+        nprobe = min(nprobe or max(1, nlist // 16), nlist)
+        index.nprobe = nprobe
+        meta.update({"nlist": nlist, "nprobe": nprobe, "train_size": int(len(sample))})
+
+    if index_type in ("flat", "hnsw"):
+        # IVF indexes carry ids natively; flat/HNSW need the id map
+        index = faiss.IndexIDMap2(index)
+    ids = np.arange(n, dtype="int64") if ids is None else np.asarray(ids, dtype="int64")
+    index.add_with_ids(emb, ids)
+    meta["ntotal"] = int(index.ntotal)
+    return index, meta
+
+
+def supports_ids(index) -> bool:
+    return isinstance(index, faiss.IndexIDMap) or faiss.try_extract_index_ivf(index) is not None
+
+
+def remove_ids(index, ids) -> bool:
+    """
+    Remove vectors by id. Returns False when the index type cannot delete
+    (HNSW), in which case callers must record the ids as tombstones.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    if len(ids) == 0:
+        return True
+    try:
+        index.remove_ids(ids)
+        return True
+    except RuntimeError:
+        return False
+
+
+def set_search_params(index, meta: dict, nprobe: int = None, ef_search: int = None):
+    """
+    Apply nprobe / efSearch from metadata (or explicit overrides) to a loaded index.
+    """
+    nprobe = nprobe or meta.get("nprobe")
+    ef_search = ef_search or meta.get("efSearch")
+    if nprobe:
+        ivf = faiss.try_extract_index_ivf(index)
+        if ivf is not None:
+            ivf.nprobe = int(nprobe)
+    if ef_search:
+        base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+        if hasattr(base, "hnsw"):
+            base.hnsw.efSearch = int(ef_search)
+    return index
+
+
+def load_index(index_path: Path, nprobe: int = None, ef_search: int = None):
+    """
+    Read an index and configure its search parameters from the saved metadata.
+    """
+    index = faiss.read_index(str(index_path))
+    meta = read_meta(index_path)
+    set_search_params(index, meta, nprobe=nprobe, ef_search=ef_search)
+    return index, meta
+
+
+def index_fingerprint(index_path: Path, *extra: Path) -> str:
+    """
+    Cheap version id for an index on disk (size + mtime of index, metadata
+    and any companion files). Changes whenever build_faiss.py or an
+    incremental update rewrites them.
+    """
+    parts = []
+    for p in (Path(index_path), meta_path(index_path), *map(Path, extra)):
+        if p.exists():
+            st = p.stat()
+            parts.append(f"{p.name}:{st.st_size}:{st.st_mtime_ns}")
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def search_subset(index, q_emb: np.ndarray, k: int, ids: np.ndarray):
+    """
+    Search only among `ids` through a FAISS ID selector, keeping the
+    index's configured nprobe / efSearch.
+    """
+    from src.retrieval.shards import ShardedIndex
+    if isinstance(index, ShardedIndex):
+        # routes each id to the shard holding it
+        return index.search_subset(q_emb, k, ids)
+    sel = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype="int64"))
+    ivf = faiss.try_extract_index_ivf(index)
+    base = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if ivf is not None:
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=ivf.nprobe)
+    elif hasattr(base, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=sel, efSearch=base.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    return index.search(q_emb, k, params=params)
@@ -0,0 +1,226 @@
+import argparse
+import hashlib
+import json
+import time
+import faiss, numpy as np
+from pathlib import Path
+from src.retrieval.bm25 import BM25_DIR, build_bm25
+from src.retrieval.faiss_utils import build_index, load_index, read_meta, remove_ids, supports_ids, write_meta
+from src.retrieval.npy_utils import append_npy
+from src.retrieval.passage_store import STORE_DIR, PassageStore, append_store, iter_jsonl
+from src.retrieval.shards import SHARD_DIR, update_shards
+
+# -----------------------------
+# Incremental embedding + index updates
+#
+# Every passage is keyed by a hash of its text. The manifest maps
+# hash -> passage id (= row in embeddings.npy = row in the passage store =
+# id in the FAISS index). A run only encodes passages whose hash is new,
+# appends them to the stores and index, and removes ids whose text no
+# longer appears in passages.jsonl. Rows of removed passages stay in the
+# stores (ids are never reused) but have no manifest entry; their vectors
+# are removed from the index (HNSW, which cannot delete, lists them as
+# tombstones in the index meta instead).
+#
+# A store built from deduplicated passages (build_embeddings --dedup or
+# the pipeline) is marked "dedup" in the manifest. For such stores every
+# run first dedups the full passages.jsonl again (src.preprocess.dedup)
+# and diffs its output, so new passages are matched against the existing
+# canonical ones and near-duplicates removed by dedup are never re-added.
+# (A stored canonical keeps the "sources" list it was first written with.)
+#
+# When build_faiss.py --shards has written SHARD_DIR, new vectors go to
+# their owning shard and removed ids are dropped there; the single index
+# is only updated if it exists. Shard workers pick the change up on restart.
+# -----------------------------
+
+PASS_FILE = Path("data/processed/passages.jsonl")
+EMB = Path("data/processed/embeddings.npy")
+IDX = Path("models/faiss.index")
+MANIFEST = Path("data/processed/embedding_manifest.json")
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+
+
+def dedup_path(pass_file: Path) -> Path:
+    return pass_file.with_name(pass_file.stem + ".dedup.jsonl")
+
+
+def new_manifest(texts, model_name: str = MODEL_NAME, dedup: bool = False) -> dict:
+    """
+    Manifest for a store whose passage i has text texts[i]. Repeated texts
+    keep their first id; later copies get none (dead rows, see dead_ids).
+    """
+    ids, n = {}, 0
+    for i, text in enumerate(texts):
+        ids.setdefault(content_hash(text), i)
+        n = i + 1
+    return {"model": model_name, "next_id": n, "ids": ids, "dedup": dedup,
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+
+def load_manifest(path: Path = MANIFEST):
+    if not path.exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: Path = MANIFEST):
+    manifest["updated_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    tmp.replace(path)
+
+
+def live_ids(manifest: dict) -> np.ndarray:
+    return np.array(sorted(manifest["ids"].values()), dtype="int64")
+
+
+def dead_ids(manifest: dict) -> np.ndarray:
+    """
+    Store rows without a manifest entry (removed or duplicate passages).
+    """
+    return np.setdiff1d(np.arange(manifest["next_id"], dtype="int64"), live_ids(manifest))
+
+
+def _rebuild_index(emb_path: Path, index_path: Path, manifest: dict):
+    """
+    Full rebuild over live ids, keeping the previous index type/params.
+    Used once when the existing index cannot address vectors by id.
+    """
+    old = read_meta(index_path) if index_path.exists() else {"type": "flat"}
+    ids = live_ids(manifest)
+    emb = np.load(emb_path, mmap_mode="r")[ids].astype("float32")
+    faiss.normalize_L2(emb)
+    params = {k: old[k] for k in ("nlist", "nprobe") if k in old}
+    if "efSearch" in old:
+        params["ef_search"] = old["efSearch"]
+    return build_index(emb, old.get("type", "flat"), ids=ids, **params)
+
+
+def _update_index(index_path: Path, emb_path: Path, manifest: dict, vecs, new_ids, dead) -> int:
+    """
+    Append new vectors to the single index and drop removed ids.
+    Returns the index size.
+    """
+    index = None
+    if index_path.exists():
+        index, meta = load_index(index_path)
+        if not supports_ids(index):
+            index = None
+    if index is None:
+        print("Existing index cannot address vectors by id; rebuilding once over live passages.")
+        index, meta = _rebuild_index(emb_path, index_path, manifest)
+    else:
+        if vecs is not None:
+            index.add_with_ids(vecs, new_ids)
+        if not remove_ids(index, dead):
+            # HNSW cannot delete: query.py filters these ids out of results
+            meta["tombstones"] = sorted(set(meta.get("tombstones", [])) | set(dead))
+    meta["ntotal"] = int(index.ntotal)
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    faiss.write_index(index, str(index_path))
+    write_meta(index_path, meta)
+    return int(index.ntotal)
+
+
+def update(pass_file: Path = PASS_FILE, emb_path: Path = EMB, store_dir: Path = STORE_DIR,
+           index_path: Path = IDX, manifest_path: Path = MANIFEST, bm25_dir: Path = BM25_DIR,
+           model_name: str = MODEL_NAME, batch_size: int = 64, dedup: bool = None,
+           shard_dir: Path = SHARD_DIR) -> dict:
+    """
+    Bring embeddings, passage store and FAISS index in line with pass_file,
+    encoding only new or changed passages. With `dedup` (default: whatever
+    the manifest records) pass_file is deduplicated first and its canonical
+    passages are diffed instead. Returns a summary dict.
+    """
+    t0 = time.perf_counter()
+    store = PassageStore(store_dir)
+    manifest = load_manifest(manifest_path)
+    duplicates = []
+    if manifest is None:
+        # first incremental run over a store built by build_embeddings.py:
+        # an index built without a manifest still holds repeated texts
+        manifest = new_manifest((store.text(i) for i in range(len(store))), model_name)
+        duplicates = dead_ids(manifest).tolist()
+    # the id list of earlier versions grew with every removal; it is derivable
+    manifest.pop("tombstones", None)
+    if manifest["model"] != model_name:
+        raise SystemExit(f"Manifest was built with {manifest['model']}; run a full build_embeddings.py for {model_name}.")
+    n_emb = len(np.load(emb_path, mmap_mode="r"))
+    if not manifest["next_id"] == len(store) == n_emb:
+        raise SystemExit(f"Store ({len(store)}), embeddings ({n_emb}) and manifest ({manifest['next_id']}) "
+                         "disagree; run a full build_embeddings.py + build_faiss.py.")
+    del store
+
+    if dedup is None:
+        dedup = manifest.get("dedup", False)
+    manifest["dedup"] = dedup
+    if dedup:
+        from src.preprocess.dedup import dedup as run_dedup
+        # canonical = first member of each group in input order, so existing
+        # canonicals keep their ids and new near-duplicates fold into them
+        deduped = dedup_path(pass_file)
+        run_dedup(pass_file, deduped)
+        pass_file = deduped
+
+    current = {}
+    for rec in iter_jsonl(pass_file):
+        current.setdefault(content_hash(rec["text"]), rec)
+    added = [(h, rec) for h, rec in current.items() if h not in manifest["ids"]]
+    removed = {h: i for h, i in manifest["ids"].items() if h not in current}
+
+    new_ids = np.arange(manifest["next_id"], manifest["next_id"] + len(added), dtype="int64")
+    new_emb = None
+    if added:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name)
+        print(f"Encoding {len(added)} new/changed passages with {model_name} ...")
+        new_emb = model.encode([rec["text"] for _, rec in added], batch_size=batch_size,
+                               show_progress_bar=True, convert_to_numpy=True)
+        append_store((rec for _, rec in added), store_dir)
+        append_npy(emb_path, new_emb.astype(np.load(emb_path, mmap_mode="r").dtype))
+
+    for h, rec_id in zip((h for h, _ in added), new_ids):
+        manifest["ids"][h] = int(rec_id)
+    for h in removed:
+        del manifest["ids"][h]
+    manifest["next_id"] += len(added)
+    dead = sorted(set(removed.values()) | set(duplicates))
+
+    vecs = None
+    if new_emb is not None:
+        vecs = new_emb.astype("float32")
+        faiss.normalize_L2(vecs)
+    sharded = (shard_dir / "shards.json").exists()
+    ntotal = None
+    if sharded:
+        layout = update_shards(vecs, new_ids, dead, shard_dir)
+        ntotal = layout["ntotal"]
+        print(f"Updated {layout['num_shards']} shards in {shard_dir}; restart shard workers to serve them.")
+    if index_path.exists() or not sharded:
+        ntotal = _update_index(index_path, emb_path, manifest, vecs, new_ids, dead)
+    save_manifest(manifest, manifest_path)
+    if added or dead or not (bm25_dir / "meta.json").exists():
+        # idf and avgdl depend on the whole corpus, so BM25 is rebuilt rather than patched
+        build_bm25(PassageStore(store_dir), live_ids(manifest), bm25_dir)
+
+    summary = {"added": len(added), "removed": len(removed), "duplicates_dropped": len(duplicates), "live": len(manifest["ids"]),
+               "index_ntotal": ntotal, "seconds": round(time.perf_counter() - t0, 2)}
+    print("Incremental update:", summary)
+    return summary
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Encode and index only new/changed passages.")
+    ap.add_argument("--passages", type=Path, default=PASS_FILE)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--dedup", action=argparse.BooleanOptionalAction, default=None,
+                    help="dedup passages before diffing (default: as recorded in the manifest)")
+    args = ap.parse_args()
+    update(pass_file=args.passages, batch_size=args.batch_size, dedup=args.dedup)
@@ -0,0 +1,49 @@
+import numpy as np
+from pathlib import Path
+
+fmt = np.lib.format
+
+
+def append_npy(path: Path, rows: np.ndarray):
+    """
+    Append rows to a C-ordered .npy file along axis 0.
+
+    The header is rewritten in place when the new shape still fits in its
+    padding (the usual case), so the cost is proportional to the appended
+    rows, not to the existing file. Otherwise the file is rewritten once.
+    """
+    path = Path(path)
+    rows = np.ascontiguousarray(rows)
+    if not path.exists():
+        np.save(path, rows)
+        return
+    with open(path, "r+b") as f:
+        version = fmt.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = fmt.read_array_header_1_0(f)
+            len_size = 2
+        else:
+            shape, fortran, dtype = fmt.read_array_header_2_0(f)
+            len_size = 4
+        data_start = f.tell()
+        if fortran or dtype != rows.dtype or tuple(shape[1:]) != rows.shape[1:]:
+            raise ValueError(f"Cannot append {rows.dtype}{rows.shape} to {dtype}{shape} in {path}")
+        new_shape = (shape[0] + rows.shape[0],) + tuple(shape[1:])
+        header = repr({"descr": fmt.dtype_to_descr(dtype), "fortran_order": False, "shape": new_shape})
+        header_start = 8 + len_size
+        room = data_start - header_start
+        if len(header) + 1 <= room:
+            f.seek(header_start)
+            f.write((header + " " * (room - len(header) - 1) + "\n").encode("latin1"))
+            f.seek(0, 2)
+            f.write(rows.tobytes())
+            return
+    # header padding exhausted: rewrite through a memmap
+    old = np.load(path, mmap_mode="r")
+    tmp = path.with_name(path.name + ".tmp")
+    out = fmt.open_memmap(tmp, mode="w+", dtype=old.dtype, shape=new_shape)
+    out[:len(old)] = old
+    out[len(old):] = rows
+    out.flush()
+    del out, old
+    tmp.replace(path)
@@ -0,0 +1,146 @@
+import json
+from array import array
+from pathlib import Path
+import numpy as np
+from src.retrieval.npy_utils import append_npy
+
+# -----------------------------
+# Memory-mapped passage store
+#
+#   texts.bin          UTF-8 passage texts, back to back
+#   text_offsets.npy   int64[n+1], passage i is texts.bin[off[i]:off[i+1]]
+#   meta.bin           per-passage metadata (source, pmid, ...) as JSON
+#   meta_offsets.npy   int64[n+1]
+#
+# Every file is opened with mmap, so opening the store costs almost no RSS,
+# only the passages actually looked up are decoded, and worker processes
+# share the same page-cache pages.
+# -----------------------------
+
+PASS_FILE = Path("data/processed/passages.jsonl")
+STORE_DIR = Path("data/processed/passage_store")
+
+
+def _pmid_from_source(source: str):
+    # data/raw files are named <PMID>.xml
+    stem = Path(source).name.split(".")[0] if source else ""
+    return stem if stem.isdigit() else None
+
+
+def _encode(rec: dict):
+    meta = {k: v for k, v in rec.items() if k != "text"}
+    if "pmid" not in meta:
+        meta["pmid"] = _pmid_from_source(meta.get("source"))
+    tb = rec.get("text", "").encode("utf-8")
+    mb = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    return tb, mb
+
+
+def _write_blobs(records, out_dir: Path, mode: str, text_start: int, meta_start: int):
+    text_off = array("q", [text_start])
+    meta_off = array("q", [meta_start])
+    with open(out_dir / "texts.bin", mode) as ft, open(out_dir / "meta.bin", mode) as fm:
+        for rec in records:
+            tb, mb = _encode(rec)
+            ft.write(tb)
+            fm.write(mb)
+            text_off.append(text_off[-1] + len(tb))
+            meta_off.append(meta_off[-1] + len(mb))
+    return np.frombuffer(text_off, dtype="int64"), np.frombuffer(meta_off, dtype="int64")
+
+
+def write_store(records, out_dir: Path = STORE_DIR) -> int:
+    """
+    Write an iterable of passage dicts ({"text": ..., "source": ..., ...})
+    to a store directory. Streams; only the offsets are held in memory.
+    Returns the number of passages written.
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    text_off, meta_off = _write_blobs(records, out_dir, "wb", 0, 0)
+    np.save(out_dir / "text_offsets.npy", text_off)
+    np.save(out_dir / "meta_offsets.npy", meta_off)
+    return len(text_off) - 1
+
+
+def append_store(records, store_dir: Path = STORE_DIR) -> int:
+    """
+    Append passages to an existing store; new passages get the next ids.
+    Returns the number of passages appended.
+    """
+    store_dir = Path(store_dir)
+    if not (store_dir / "text_offsets.npy").exists():
+        return write_store(records, store_dir)
+    old_text = np.load(store_dir / "text_offsets.npy", mmap_mode="r")
+    old_meta = np.load(store_dir / "meta_offsets.npy", mmap_mode="r")
+    text_off, meta_off = _write_blobs(records, store_dir, "ab", int(old_text[-1]), int(old_meta[-1]))
+    del old_text, old_meta
+    append_npy(store_dir / "text_offsets.npy", text_off[1:])
+    append_npy(store_dir / "meta_offsets.npy", meta_off[1:])
+    return len(text_off) - 1
+
+
+def iter_jsonl(path: Path):
+    with open(path, "r", encoding="utf-8") as fin:
+        for line in fin:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _map_blob(path: Path):
+    # np.memmap refuses zero-length files
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype="uint8")
+    return np.memmap(path, dtype="uint8", mode="r")
+
+
+class PassageStore:
+    """
+    Read-only view over a store directory written by write_store().
+    """
+
+    def __init__(self, store_dir: Path = STORE_DIR):
+        self.dir = Path(store_dir)
+        self._text_off = np.load(self.dir / "text_offsets.npy", mmap_mode="r")
+        self._meta_off = np.load(self.dir / "meta_offsets.npy", mmap_mode="r")
+        self._texts = _map_blob(self.dir / "texts.bin")
+        self._meta = _map_blob(self.dir / "meta.bin")
+
+    def __len__(self):
+        return len(self._text_off) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self.text(i)
+
+    def _check(self, i: int) -> int:
+        i = int(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"passage {i} out of range (store has {len(self)})")
+        return i
+
+    def lengths(self) -> np.ndarray:
+        """
+        UTF-8 byte length of every passage, without decoding any text.
+        """
+        return np.diff(self._text_off)
+
+    def text(self, i: int) -> str:
+        i = self._check(i)
+        return bytes(self._texts[self._text_off[i]:self._text_off[i + 1]]).decode("utf-8")
+
+    def meta(self, i: int) -> dict:
+        i = self._check(i)
+        return json.loads(bytes(self._meta[self._meta_off[i]:self._meta_off[i + 1]]))
+
+    def get(self, i: int) -> dict:
+        """
+        Text plus metadata for one passage.
+        """
+        return {"text": self.text(i), **self.meta(i)}
+
+
+if __name__ == "__main__":
+    n = write_store(iter_jsonl(PASS_FILE), STORE_DIR)
+    print(f"Wrote {n} passages to {STORE_DIR}")
@@ -1,33 +1,202 @@
-import faiss, json
+import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from pathlib import Path
+from src import metrics, registry
+from src.retrieval.bm25 import BM25_DIR, BM25Index
+from src.retrieval.faiss_utils import index_fingerprint, load_index, read_meta, search_subset
+from src.retrieval.lru import LRUCache
+from src.retrieval.passage_store import STORE_DIR, PassageStore
+from src.retrieval.shards import SHARD_DIR, SHARDS, open_index, shards_fingerprint
 
 INDEX = Path("models/faiss.index")
-PASS = Path("data/processed/passages_list.json")
+PASS = STORE_DIR
+ENCODER_MODEL = "sentence-transformers/all-mpnet-base-v2"
 
-# Load sentence embedding model
-model = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+# "dense": FAISS only; "prefilter": dense search restricted to the BM25 top
+# PREFILTER_CANDIDATES; "rrf": reciprocal-rank fusion of the dense and BM25
+# top RRF_DEPTH. Both hybrid modes are opt-in and fall back to dense without
+# a BM25 index. Hit scores are cosine similarities except in "rrf" mode,
+# where they are fused reciprocal-rank scores (not comparable to cosine).
+RETRIEVAL_MODES = ("dense", "prefilter", "rrf")
+RETRIEVAL_MODE = "dense"
+PREFILTER_CANDIDATES = 1000
+RRF_DEPTH = 50
+RRF_K = 60
 
-# Load FAISS index
-index = faiss.read_index(str(INDEX))
+# bounded by entry count: an all-mpnet embedding is 3 KB, a k=5 result a few KB
+EMBEDDING_CACHE = LRUCache(maxsize=10_000)
+RESULT_CACHE = LRUCache(maxsize=2_000)
 
-# Load passages
-with open(PASS, "r", encoding="utf-8") as f:
-    passages = json.load(f)
+def _load_encoder():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(ENCODER_MODEL)
 
-def retrieve(query: str, k: int = 5):
+def _load_index():
+    if SHARDS:
+        # shard workers (see shards.py); same search() interface, global ids
+        return open_index(SHARDS, SHARD_DIR)
+    # nprobe / efSearch come from the metadata written by build_faiss.py
+    index, meta = load_index(INDEX)
+    return index
+
+def _load_index_version():
+    # keys the result cache; invalidate together with "faiss_index" / "bm25"
+    if SHARDS:
+        return shards_fingerprint(SHARD_DIR) + index_fingerprint(BM25_DIR / "meta.json")
+    return index_fingerprint(INDEX, BM25_DIR / "meta.json")
+
+def _load_bm25():
+    if not (BM25_DIR / "meta.json").exists():
+        print(f"No BM25 index in {BM25_DIR}; hybrid retrieval falls back to dense. "
+              "Build it with `python -m src.retrieval.bm25`.")
+        return None
+    return BM25Index(BM25_DIR)
+
+def _load_passages():
+    # memory-mapped; only the returned hits are ever decoded
+    return PassageStore(PASS)
+
+def _load_tombstones():
+    # ids deleted from indexes that cannot remove vectors (HNSW)
+    if SHARDS:
+        return set(registry.get("faiss_index").tombstones)
+    return set(read_meta(INDEX).get("tombstones", []))
+
+registry.register("encoder", _load_encoder)
+registry.register("faiss_index", _load_index)
+registry.register("index_version", _load_index_version)
+registry.register("passages", _load_passages)
+registry.register("tombstones", _load_tombstones)
+registry.register("bm25", _load_bm25)
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.split())
+
+def encode_queries(queries):
+    """
+    Normalized embeddings for a list of (already normalized) queries, using
+    the embedding cache and one batched encoder call for the misses.
+    """
+    out = [EMBEDDING_CACHE.get((ENCODER_MODEL, q)) for q in queries]
+    missing = [i for i, e in enumerate(out) if e is None]
+    if missing:
+        model = registry.get("encoder")
+        emb = model.encode([queries[i] for i in missing], convert_to_numpy=True).astype("float32")
+        faiss.normalize_L2(emb)
+        for i, e in zip(missing, emb):
+            out[i] = e
+            EMBEDDING_CACHE.put((ENCODER_MODEL, queries[i]), e)
+    return np.vstack(out)
+
+def _dense_ranked(index, q_emb, depth: int, tombstones):
+    """
+    Per query, [(id, score), ...] of the top `depth` live ids.
     """
-    Retrieve top-k relevant passages for a query.
+    D, I = index.search(q_emb, depth + len(tombstones))
+    out = []
+    for row in range(len(q_emb)):
+        # -1: fewer than depth vectors reachable (small corpus / ANN index)
+        ranked = [(int(i), float(d)) for d, i in zip(D[row], I[row]) if i >= 0 and int(i) not in tombstones]
+        out.append(ranked[:depth])
+    return out
+
+def _prefilter_ranked(index, bm25, q: str, q_emb, k: int, tombstones):
+    cand, _ = bm25.search(q, PREFILTER_CANDIDATES)
+    cand = np.array([i for i in cand if int(i) not in tombstones], dtype="int64")
+    ranked = []
+    if len(cand):
+        D, I = search_subset(index, q_emb[None, :], k, cand)
+        ranked = [(int(i), float(d)) for d, i in zip(D[0], I[0]) if i >= 0]
+    if len(ranked) < k:
+        # IVF only sees candidates in the probed lists; top up from plain dense hits
+        seen = {i for i, _ in ranked}
+        ranked += [(i, d) for i, d in _dense_ranked(index, q_emb[None, :], k, tombstones)[0] if i not in seen]
+        # both lists hold inner products: merge by score
+        ranked.sort(key=lambda x: -x[1])
+    return ranked[:k]
+
+def _rrf_ranked(bm25, q: str, k: int, tombstones, dense):
+    ids, _ = bm25.search(q, RRF_DEPTH + len(tombstones))
+    lexical = [int(i) for i in ids if int(i) not in tombstones][:RRF_DEPTH]
+    fused = {}
+    for ranking in ([i for i, _ in dense], lexical):
+        for rank, i in enumerate(ranking):
+            fused[i] = fused.get(i, 0.0) + 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.items(), key=lambda x: -x[1])[:k]
+
+def retrieve_batch(queries, k: int = 5, mode: str = None):
     """
-    q_emb = model.encode([query], convert_to_numpy=True)
-    faiss.normalize_L2(q_emb)
-    D, I = index.search(q_emb, k)
-    hits = []
-    for i in range(len(I[0])):
-        idx = int(I[0][i])
-        hits.append({"score": float(D[0][i]), "idx": idx, "text": passages[idx]})
-    return hits
+    Retrieve top-k passages for many queries with one encoder forward pass
+    and one index search. Returns one hit list per query, in order.
+    `mode` is one of RETRIEVAL_MODES (default RETRIEVAL_MODE); in "rrf" mode
+    the hit score is the fused reciprocal-rank score.
+    """
+    mode = mode or RETRIEVAL_MODE
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"Unknown retrieval mode {mode!r}; expected one of {RETRIEVAL_MODES}")
+    index = registry.get("faiss_index")
+    version = registry.get("index_version")
+    passages = registry.get("passages")
+    tombstones = registry.get("tombstones")
+    bm25 = registry.get("bm25") if mode != "dense" else None
+    if bm25 is None:
+        mode = "dense"
+
+    with metrics.span("retrieve", queries=len(queries), mode=mode) as span:
+        norm = [normalize_query(q) for q in queries]
+        results = {}
+        todo = []
+        for q in dict.fromkeys(norm):
+            cached = RESULT_CACHE.get((q, k, mode, version))
+            if cached is None:
+                todo.append(q)
+            else:
+                results[q] = cached
+        span["cache_misses"] = len(todo)
+
+        if todo:
+            with metrics.span("retrieve.encode"):
+                q_emb = encode_queries(todo)
+            if mode == "prefilter":
+                # the subset search replaces the full one; dense only tops up short results
+                with metrics.span("retrieve.prefilter"):
+                    ranked = [_prefilter_ranked(index, bm25, q, q_emb[row], k, tombstones)
+                              for row, q in enumerate(todo)]
+            else:
+                depth = RRF_DEPTH if mode == "rrf" else k
+                with metrics.span("retrieve.search"):
+                    dense = _dense_ranked(index, q_emb, max(k, depth), tombstones)
+                with metrics.span(f"retrieve.{mode}"):
+                    if mode == "rrf":
+                        ranked = [_rrf_ranked(bm25, q, k, tombstones, dense[row]) for row, q in enumerate(todo)]
+                    else:
+                        ranked = [d[:k] for d in dense]
+            with metrics.span("retrieve.fetch"):
+                for q, hits_ranked in zip(todo, ranked):
+                    hits = []
+                    for idx, score in hits_ranked:
+                        rec = passages.get(idx)
+                        hit = {"score": score, "idx": idx, "text": rec["text"],
+                               "source": rec.get("source"), "pmid": rec.get("pmid")}
+                        if "sources" in rec:
+                            # canonical passage of a duplicate group (see preprocess/dedup.py)
+                            hit["sources"] = rec["sources"]
+                        hits.append(hit)
+                    RESULT_CACHE.put((q, k, mode, version), hits)
+                    results[q] = hits
+
+        # hand out copies so callers can't mutate cached hits
+        return [[dict(h) for h in results[q]] for q in norm]
+
+def retrieve(query: str, k: int = 5, mode: str = None):
+    """
+    Retrieve top-k relevant passages for a query. `score` is the cosine
+    similarity unless mode="rrf" (see retrieve_batch).
+    """
+    return retrieve_batch([query], k=k, mode=mode)[0]
+
+def cache_info() -> dict:
+    return {"embeddings": EMBEDDING_CACHE.info(), "results": RESULT_CACHE.info()}
 
 if __name__ == "__main__":
     print("Test retrieve:", retrieve("BRCA1 breast cancer DNA repair", k=5))
@@ -0,0 +1,373 @@
+import argparse
+import atexit
+import ipaddress
+import json
+import multiprocessing as mp
+import os
+import secrets
+import threading
+import numpy as np
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from pathlib import Path
+from src.retrieval.faiss_utils import build_index, index_fingerprint, load_index, read_meta, search_subset, write_meta
+
+# -----------------------------
+# Sharded retrieval
+#
+# build_faiss.py --shards N splits the live passages by id % N and writes
+# one index per shard under SHARD_DIR, each keeping the global passage ids.
+# Every shard is served by its own process (multiprocessing.connection
+# over TCP, so shards can also run on other machines); ShardedIndex fans a
+# query batch out to all shards at once and merges the per-shard top-k by
+# score. For flat shards the merged result equals a single flat index.
+#
+#   python -m src.retrieval.shards serve --shard 0 --port 7100
+#
+# query.py uses HYPOTHESIS_SHARDS: "local" starts one worker per shard
+# in SHARD_DIR, "host:port,host:port,..." connects to running workers.
+#
+# Requests are pickled, so the connection key is the only thing between a
+# client and code execution in the worker. There is no built-in key:
+# spawned workers get a random key per run, and served workers use
+# HYPOTHESIS_SHARD_AUTHKEY. Without it, serve on a loopback address
+# generates a random key into AUTHKEY_NAME in the shard directory (mode
+# 0600, reused by later workers and by connect); other addresses refuse.
+# -----------------------------
+
+SHARD_DIR = Path("models/shards")
+SHARDS = os.environ.get("HYPOTHESIS_SHARDS")
+AUTHKEY = os.environ.get("HYPOTHESIS_SHARD_AUTHKEY", "").encode("utf-8") or None
+AUTHKEY_NAME = "authkey"
+
+
+def _is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _key_file(path: Path, create: bool = False):
+    """
+    Read the development key at `path`; with `create`, generate it first
+    (readable by the owner only) when it does not exist yet.
+    """
+    if create and not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # another worker created it first
+        else:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(secrets.token_bytes(32).hex())
+            print(f"Generated shard authkey {path} (set HYPOTHESIS_SHARD_AUTHKEY to choose one)")
+    if not path.exists():
+        return None
+    return path.read_text(encoding="utf-8").strip().encode("utf-8")
+
+
+def resolve_authkey(hosts, authkey: bytes = AUTHKEY, key_file: Path = None, create: bool = False) -> bytes:
+    """
+    The connection key for workers on `hosts`: the given or configured key,
+    else (loopback hosts only) the development key in `key_file`.
+    """
+    if authkey:
+        return authkey
+    remote = [h for h in hosts if not _is_loopback(h)]
+    key = None if remote or key_file is None else _key_file(Path(key_file), create)
+    if key is None:
+        raise SystemExit(f"Shard workers on {', '.join(remote or hosts)} need HYPOTHESIS_SHARD_AUTHKEY set "
+                         "(requests are unpickled by the worker).")
+    return key
+
+
+def shard_path(shard_dir: Path, shard: int) -> Path:
+    return Path(shard_dir) / f"shard-{shard:03d}.index"
+
+
+def read_layout(shard_dir: Path = SHARD_DIR) -> dict:
+    with open(Path(shard_dir) / "shards.json", "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def write_shards(emb: np.ndarray, ids: np.ndarray, num_shards: int, shard_dir: Path = SHARD_DIR,
+                 index_type: str = "flat", **params) -> dict:
+    """
+    Build one index per shard from normalized embeddings; row i of emb has
+    global id ids[i] and goes to shard ids[i] % num_shards.
+    """
+    import faiss
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    for p in shard_dir.glob("shard-*.index*"):
+        p.unlink()
+    ids = np.asarray(ids, dtype="int64")
+    layout = {"num_shards": num_shards, "type": index_type, "dim": int(emb.shape[1]), "shards": []}
+    for s in range(num_shards):
+        rows = np.flatnonzero(ids % num_shards == s)
+        index, meta = build_index(emb[rows], index_type, ids=ids[rows], **params)
+        meta.update(shard=s, num_shards=num_shards)
+        path = shard_path(shard_dir, s)
+        faiss.write_index(index, str(path))
+        write_meta(path, meta)
+        layout["shards"].append({"path": path.name, "ntotal": meta["ntotal"]})
+        print(f"Saved shard {s} ({meta['ntotal']} vectors) to {path}")
+    layout["ntotal"] = sum(s["ntotal"] for s in layout["shards"])
+    with open(shard_dir / "shards.json", "w", encoding="utf-8") as f:
+        json.dump(layout, f, indent=2)
+    return layout
+
+
+def update_shards(vecs: np.ndarray, ids: np.ndarray, dead, shard_dir: Path = SHARD_DIR) -> dict:
+    """
+    Add normalized vectors with global ids to their owning shards (id %
+    num_shards) and remove (or tombstone, for HNSW) the `dead` ids.
+    Running workers keep serving the old shards until restarted.
+    """
+    import faiss
+    from src.retrieval.faiss_utils import remove_ids, supports_ids
+    shard_dir = Path(shard_dir)
+    layout = read_layout(shard_dir)
+    n = layout["num_shards"]
+    ids = np.asarray(ids, dtype="int64")
+    dead = np.asarray(dead, dtype="int64")
+    for s, entry in enumerate(layout["shards"]):
+        rows, gone = np.flatnonzero(ids % n == s), dead[dead % n == s]
+        if not len(rows) and not len(gone):
+            continue
+        path = shard_dir / entry["path"]
+        index, meta = load_index(path)
+        if not supports_ids(index):
+            raise SystemExit(f"{path} cannot address vectors by id; rebuild with build_faiss.py --shards {n}.")
+        if len(rows):
+            index.add_with_ids(np.ascontiguousarray(vecs[rows], dtype="float32"), ids[rows])
+        if not remove_ids(index, gone):
+            meta["tombstones"] = sorted(set(meta.get("tombstones", [])) | set(int(i) for i in gone))
+        meta["ntotal"] = entry["ntotal"] = int(index.ntotal)
+        faiss.write_index(index, str(path))
+        write_meta(path, meta)
+    layout["ntotal"] = sum(e["ntotal"] for e in layout["shards"])
+    with open(shard_dir / "shards.json", "w", encoding="utf-8") as f:
+        json.dump(layout, f, indent=2)
+    return layout
+
+
+def shards_fingerprint(shard_dir: Path = SHARD_DIR) -> str:
+    shard_dir = Path(shard_dir)
+    return index_fingerprint(shard_dir / "shards.json", *sorted(shard_dir.glob("shard-*.index")))
+
+
+# -----------------------------
+# Shard worker
+# -----------------------------
+
+def serve(index_path: Path, address=("127.0.0.1", 0), authkey: bytes = None, ready=None,
+          shard: int = None, num_shards: int = None):
+    """
+    Load one shard and answer requests forever, one thread per client
+    connection (FAISS releases the GIL while searching). `ready` (a
+    Connection) receives the bound address once the index is loaded.
+
+    Requests are tuples: ("search", q_emb, k), ("search_subset", q_emb, k, ids)
+    and ("info",). Replies are ("ok", value) or ("error", message).
+    Without `authkey` the HYPOTHESIS_SHARD_AUTHKEY key is used, or on a
+    loopback address the generated key next to the index; binding another
+    address without one is refused. The shard number and
+    shard count come from the index meta (written by write_shards), or
+    from `shard` / `num_shards` for older shard files.
+    """
+    authkey = resolve_authkey([address[0]], authkey or AUTHKEY,
+                              key_file=Path(index_path).parent / AUTHKEY_NAME, create=True)
+    index, meta = load_index(index_path)
+    tombstones = meta.get("tombstones", [])
+    if shard is not None and meta.get("shard", shard) != shard:
+        raise SystemExit(f"{index_path} is shard {meta['shard']}, not shard {shard}")
+    layout = {"shard": meta.get("shard", shard), "num_shards": meta.get("num_shards", num_shards)}
+    if None in layout.values():
+        raise SystemExit(f"{index_path}: unknown shard number / count; pass --shard and keep shards.json next to it")
+    with Listener(address, authkey=authkey) as listener:
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        else:
+            print(f"Serving {index_path} ({index.ntotal} vectors) on {listener.address}")
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError as e:
+                print("Rejected shard client:", e)
+                continue
+            threading.Thread(target=_handle, args=(conn, index, tombstones, layout), daemon=True).start()
+
+
+def _handle(conn, index, tombstones, layout):
+    with conn:
+        while True:
+            try:
+                req = conn.recv()
+            except EOFError:
+                return
+            op = req[0]
+            try:
+                if op == "search":
+                    value = index.search(req[1], req[2])
+                elif op == "search_subset":
+                    value = search_subset(index, req[1], req[2], req[3])
+                elif op == "info":
+                    value = {"ntotal": int(index.ntotal), "tombstones": tombstones, **layout}
+                else:
+                    raise ValueError(f"unknown request {op!r}")
+                conn.send(("ok", value))
+            except Exception as e:
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+def _serve_local(index_path, authkey, ready, shard, num_shards):
+    serve(Path(index_path), authkey=authkey, ready=ready, shard=shard, num_shards=num_shards)
+
+
+# -----------------------------
+# Coordinator
+# -----------------------------
+
+def _merge(results, k: int):
+    """
+    Merge per-shard (D, I) into the global top-k per query, highest score
+    first; ties keep shard order, then per-shard rank.
+    """
+    D = np.hstack([r[0] for r in results])
+    I = np.hstack([r[1] for r in results])
+    # missing hits (-1) sort last
+    key = np.where(I < 0, -np.inf, D)
+    order = np.argsort(-key, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+
+class ShardedIndex:
+    """
+    Client side of the shard workers with the search() interface of a FAISS
+    index: search(q_emb, k) -> (D, I) with global passage ids.
+    """
+
+    def __init__(self, addresses, authkey: bytes = None, processes=(), shard_dir: Path = SHARD_DIR):
+        self.addresses = list(addresses)
+        authkey = resolve_authkey([host for host, _ in self.addresses], authkey or AUTHKEY,
+                                  key_file=Path(shard_dir) / AUTHKEY_NAME)
+        self.conns = [Client(a, authkey=authkey) for a in self.addresses]
+        self.processes = list(processes)
+        # one request in flight per connection
+        self._lock = threading.Lock()
+        info = self._call_all([("info",)] * len(self.conns))
+        # ids are routed by shard number, so order the connections by the
+        # shard each worker reports rather than by position in the address list
+        num_shards = {i["num_shards"] for i in info}
+        shards = sorted(i["shard"] for i in info)
+        if len(num_shards) != 1 or shards != list(range(len(info))) or num_shards != {len(info)}:
+            self.close()
+            raise RuntimeError("Inconsistent shard layout: workers report "
+                               + ", ".join(f"{a[0]}:{a[1]} = shard {i['shard']} of {i['num_shards']}"
+                                           for a, i in zip(self.addresses, info)))
+        order = np.argsort([i["shard"] for i in info])
+        self.addresses = [self.addresses[j] for j in order]
+        self.conns = [self.conns[j] for j in order]
+        info = [info[j] for j in order]
+        self.shard_sizes = [i["ntotal"] for i in info]
+        self.ntotal = sum(self.shard_sizes)
+        self.tombstones = sorted({t for i in info for t in i["tombstones"]})
+        atexit.register(self.close)
+
+    @classmethod
+    def spawn(cls, shard_dir: Path = SHARD_DIR, authkey: bytes = None):
+        """
+        Start one local worker process per shard in `shard_dir`, keyed with
+        a fresh random authkey unless one is given.
+        """
+        authkey = authkey or os.urandom(32)
+        layout = read_layout(shard_dir)
+        ctx = mp.get_context("spawn")
+        procs, waiting = [], []
+        for num, s in enumerate(layout["shards"]):
+            recv, send = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=_serve_local, daemon=True, name=f"shard-{s['path']}",
+                            args=(str(Path(shard_dir) / s["path"]), authkey, send, num, layout["num_shards"]))
+            p.start()
+            send.close()
+            procs.append(p)
+            waiting.append(recv)
+        # shards load concurrently; collect their addresses as they come up
+        addresses = []
+        for p, recv in zip(procs, waiting):
+            try:
+                addresses.append(recv.recv())
+            except EOFError:
+                for q in procs:
+                    q.terminate()
+                raise RuntimeError(f"Shard worker {p.name} exited during startup (code {p.exitcode})")
+        return cls(addresses, authkey=authkey, processes=procs)
+
+    @classmethod
+    def connect(cls, spec: str, authkey: bytes = None, shard_dir: Path = SHARD_DIR):
+        """
+        Connect to running workers: "host:port,host:port,...".
+        """
+        addresses = []
+        for part in spec.split(","):
+            host, port = part.strip().rsplit(":", 1)
+            addresses.append((host, int(port)))
+        return cls(addresses, authkey=authkey, shard_dir=shard_dir)
+
+    def _call_all(self, requests):
+        # send everything first so the shards work in parallel
+        with self._lock:
+            for conn, req in zip(self.conns, requests):
+                conn.send(req)
+            replies = [conn.recv() for conn in self.conns]
+        for addr, (status, value) in zip(self.addresses, replies):
+            if status != "ok":
+                raise RuntimeError(f"Shard {addr}: {value}")
+        return [value for _, value in replies]
+
+    def search(self, q_emb: np.ndarray, k: int):
+        q_emb = np.ascontiguousarray(q_emb, dtype="float32")
+        return _merge(self._call_all([("search", q_emb, k)] * len(self.conns)), k)
+
+    def search_subset(self, q_emb: np.ndarray, k: int, ids: np.ndarray):
+        q_emb = np.ascontiguousarray(q_emb, dtype="float32")
+        ids = np.asarray(ids, dtype="int64")
+        n = len(self.conns)
+        # conns are ordered by shard number; shard s only holds ids with id % n == s
+        return _merge(self._call_all([("search_subset", q_emb, k, ids[ids % n == s]) for s in range(n)]), k)
+
+    def close(self):
+        for conn in self.conns:
+            conn.close()
+        self.conns = []
+        # workers started by spawn() belong to this coordinator
+        for p in self.processes:
+            p.terminate()
+            p.join(timeout=5)
+        self.processes = []
+
+
+def open_index(spec: str = SHARDS, shard_dir: Path = SHARD_DIR) -> ShardedIndex:
+    return ShardedIndex.spawn(shard_dir) if spec == "local" else ShardedIndex.connect(spec, shard_dir=shard_dir)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Serve one retrieval shard.")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sp = sub.add_parser("serve")
+    sp.add_argument("--shard", type=int, required=True)
+    sp.add_argument("--shard-dir", type=Path, default=SHARD_DIR)
+    sp.add_argument("--host", default="127.0.0.1")
+    sp.add_argument("--port", type=int, default=0)
+    args = ap.parse_args()
+    path = shard_path(args.shard_dir, args.shard)
+    print(f"Shard {args.shard}: {read_meta(path)}")
+    layout_file = args.shard_dir / "shards.json"
+    num_shards = read_layout(args.shard_dir)["num_shards"] if layout_file.exists() else None
+    serve(path, (args.host, args.port), shard=args.shard, num_shards=num_shards)
@@ -10,11 +10,15 @@ sys.path.append(ROOT)
 import streamlit as st
 import pandas as pd
 import json
-import time
-from pathlib import Path
 
+from src import registry
 from src.generation.generate import generate_hypothesis
 from src.validation.validate import novelty_score
+from src.ui import store
+
+# Load models/indexes in the background so the page renders immediately.
+# Already-loaded (or loading) entries are skipped on Streamlit reruns.
+registry.prewarm(["encoder", "faiss_index", "passages", "generator", "disgenet_index"])
 
 
 # -----------------------------------------------------------
@@ -173,18 +177,22 @@ st.markdown("""
 #  STORAGE SETUP
 # -----------------------------------------------------------
 
-HYP_FILE = Path("data/processed/hypotheses.csv")
-FB_FILE = Path("data/processed/feedback.csv")
-FB_FILE.parent.mkdir(parents=True, exist_ok=True)
+PAGE_SIZE = 50
+
+@st.cache_resource
+def init_store():
+    # schema + one-time CSV import run once per server process
+    store.open_store().close()
 
-if not HYP_FILE.exists():
-    pd.DataFrame(columns=[
-        "hypothesis_id","gene_symbol","disease_name",
-        "hypothesis_text","evidence_passages",
-        "novelty_flag","novelty_score","created_at"
-    ]).to_csv(HYP_FILE, index=False)
+def get_store():
+    # one connection per browser session: a sqlite3 connection must not be
+    # used by two sessions' script threads at once (WAL lets them coexist)
+    if "db" not in st.session_state:
+        init_store()
+        st.session_state.db = store.connect()
+    return st.session_state.db
 
-df = pd.read_csv(HYP_FILE)
+db = get_store()
 
 
 # -----------------------------------------------------------
@@ -215,41 +223,47 @@ if st.button("Generate Hypothesis"):
         st.error("Please enter a gene symbol.")
 
     else:
-        with st.spinner("Processing biomedical text and generating hypothesis..."):
-            hypothesis_text, evidence = generate_hypothesis(gene_input, disease_input, k=5)
-            evidence_texts = [e["text"] for e in evidence]
-
-            nscore = novelty_score(gene_input, disease_input)
-            nflag = 1 if nscore > 0.5 else 0
-            hid = int(time.time())
-
-            pd.DataFrame([{
-                "hypothesis_id": hid,
-                "gene_symbol": gene_input,
-                "disease_name": disease_input,
-                "hypothesis_text": hypothesis_text.replace("\n"," "),
-                "evidence_passages": json.dumps(evidence_texts),
-                "novelty_flag": nflag,
-                "novelty_score": nscore,
-                "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
-            }]).to_csv(HYP_FILE, mode="a", header=False, index=False)
-
-        st.success("Hypothesis successfully generated.")
+        with st.spinner("Retrieving evidence..."):
+            stream = generate_hypothesis(gene_input, disease_input, k=5, stream=True)
+        evidence_texts = [e["text"] for e in stream.evidence]
 
         # st.markdown("#### Generated Hypothesis")
         st.markdown('<p class="light-label">Generated Hypothesis</p>', unsafe_allow_html=True)
-
-        st.markdown(f'<div class="text-card">{hypothesis_text}</div>', unsafe_allow_html=True)
+        hypothesis_box = st.empty()
+        # any click reruns the script, which abandons the loop below and cancels generation
+        st.button("Stop Generation")
 
         # st.markdown("#### Evidence Passages")
         st.markdown('<p class="light-label">Evidence Passages</p>', unsafe_allow_html=True)
         for txt in evidence_texts:
             st.markdown(f'<div class="text-card">{txt}</div>', unsafe_allow_html=True)
 
+        try:
+            for _ in stream:
+                hypothesis_box.markdown(f'<div class="text-card">{stream.text}▌</div>', unsafe_allow_html=True)
+        finally:
+            stream.cancel()
+        hypothesis_text = stream.text
+        hypothesis_box.markdown(f'<div class="text-card">{hypothesis_text}</div>', unsafe_allow_html=True)
+
+        nscore = novelty_score(gene_input, disease_input)
+        nflag = 1 if nscore > 0.5 else 0
+        hid = store.add_hypothesis(
+            db,
+            gene_symbol=gene_input,
+            disease_name=disease_input,
+            hypothesis_text=hypothesis_text.replace("\n"," "),
+            evidence_passages=evidence_texts,
+            novelty_flag=nflag,
+            novelty_score=nscore,
+        )
+
         # st.markdown("#### Novelty Score")
         st.markdown('<p class="light-label">Novelty Score</p>', unsafe_allow_html=True)
         st.markdown(f'<div class="text-card">{nscore:.2f}</div>', unsafe_allow_html=True)
 
+        st.success("Hypothesis successfully generated.")
+
 st.markdown('</div>', unsafe_allow_html=True)
 
 
@@ -265,16 +279,20 @@ st.markdown(
 
 
 
-query = st.text_input("Search Gene or Disease")
+query = st.text_input("Search Gene, Disease or Hypothesis Text")
 
-results = df[df["gene_symbol"].str.contains(query, case=False, na=False) |
-             df["disease_name"].str.contains(query, case=False, na=False)] if query else df
+_, total = store.search(db, query, limit=0)
+pages = max(1, -(-total // PAGE_SIZE))
+page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, step=1,
+                       key=f"page-{query}")  # new search starts at page 1
+rows, total = store.search(db, query, limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+results = pd.DataFrame(rows, columns=list(store.LIST_COLUMNS))
 
 st.dataframe(results[["hypothesis_id","gene_symbol","disease_name","novelty_flag","created_at"]])
 
 if not results.empty:
     selected = st.selectbox("Select Hypothesis ID", results["hypothesis_id"].astype(str))
-    row = df[df["hypothesis_id"].astype(str) == selected].iloc[0]
+    row = store.get_hypothesis(db, int(selected))
 
     st.markdown('<div class="section-title" style="color: #E4F1FE;">Hypothesis</div>',
     unsafe_allow_html=True)
@@ -300,8 +318,9 @@ st.markdown('</div>', unsafe_allow_html=True)
 st.markdown('<div class="panel">', unsafe_allow_html=True)
 st.markdown('<div class="section-title">Expert Feedback</div>', unsafe_allow_html=True)
 
-if not df.empty:
-    fb_selected = st.selectbox("Choose Hypothesis ID to Review", df["hypothesis_id"].astype(str))
+recent, _ = store.search(db, limit=200)
+if recent:
+    fb_selected = st.selectbox("Choose Hypothesis ID to Review", [str(r["hypothesis_id"]) for r in recent])
 
     fb_choice = st.radio(
         "How would you rate this hypothesis?",
@@ -315,13 +334,7 @@ if not df.empty:
     )
 
     if st.button("Submit Feedback"):
-        with open(FB_FILE, "a", encoding="utf-8") as f:
-            f.write(",".join([
-                fb_selected,
-                fb_choice.replace(",", ";"),
-                fb_comment.replace(",", ";"),
-                str(time.time())
-            ]) + "\n")
+        store.add_feedback(db, int(fb_selected), fb_choice, fb_comment)
         st.success("Feedback successfully recorded.")
 
 st.markdown('</div>', unsafe_allow_html=True)
@@ -0,0 +1,234 @@
+import csv
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+# -----------------------------
+# SQLite storage for generated hypotheses and expert feedback
+# -----------------------------
+
+DB_FILE = Path("data/processed/hypotheses.sqlite")
+HYP_CSV = Path("data/processed/hypotheses.csv")
+FB_CSV = Path("data/processed/feedback.csv")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS hypotheses (
+    hypothesis_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    gene_symbol TEXT NOT NULL,
+    disease_name TEXT NOT NULL,
+    hypothesis_text TEXT NOT NULL,
+    evidence_passages TEXT NOT NULL DEFAULT '[]',
+    novelty_flag INTEGER,
+    novelty_score REAL,
+    created_at TEXT NOT NULL,
+    legacy_id TEXT
+);
+CREATE INDEX IF NOT EXISTS hypotheses_gene ON hypotheses(gene_symbol COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS hypotheses_disease ON hypotheses(disease_name COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS hypotheses_legacy ON hypotheses(legacy_id);
+
+CREATE TABLE IF NOT EXISTS feedback (
+    feedback_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    hypothesis_id INTEGER NOT NULL REFERENCES hypotheses(hypothesis_id),
+    rating TEXT NOT NULL,
+    comment TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS feedback_hypothesis ON feedback(hypothesis_id);
+
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS hypotheses_fts USING fts5(
+    gene_symbol, disease_name, hypothesis_text,
+    content='hypotheses', content_rowid='hypothesis_id'
+);
+CREATE TRIGGER IF NOT EXISTS hypotheses_ai AFTER INSERT ON hypotheses BEGIN
+    INSERT INTO hypotheses_fts(rowid, gene_symbol, disease_name, hypothesis_text)
+    VALUES (new.hypothesis_id, new.gene_symbol, new.disease_name, new.hypothesis_text);
+END;
+CREATE TRIGGER IF NOT EXISTS hypotheses_ad AFTER DELETE ON hypotheses BEGIN
+    INSERT INTO hypotheses_fts(hypotheses_fts, rowid, gene_symbol, disease_name, hypothesis_text)
+    VALUES ('delete', old.hypothesis_id, old.gene_symbol, old.disease_name, old.hypothesis_text);
+END;
+CREATE TRIGGER IF NOT EXISTS hypotheses_au AFTER UPDATE ON hypotheses BEGIN
+    INSERT INTO hypotheses_fts(hypotheses_fts, rowid, gene_symbol, disease_name, hypothesis_text)
+    VALUES ('delete', old.hypothesis_id, old.gene_symbol, old.disease_name, old.hypothesis_text);
+    INSERT INTO hypotheses_fts(rowid, gene_symbol, disease_name, hypothesis_text)
+    VALUES (new.hypothesis_id, new.gene_symbol, new.disease_name, new.hypothesis_text);
+END;
+"""
+
+LIST_COLUMNS = ("hypothesis_id", "gene_symbol", "disease_name", "novelty_flag", "novelty_score", "created_at")
+
+
+def _columns(prefix: str = "") -> str:
+    return ", ".join(prefix + c for c in LIST_COLUMNS)
+
+
+def _now() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def connect(path: Path = DB_FILE) -> sqlite3.Connection:
+    """
+    Open the database (WAL mode, so the app and scripts can write concurrently).
+    A connection is not locked: use it from one thread at a time (the app
+    keeps one per session). check_same_thread is off because Streamlit may
+    rerun a session's script on another thread.
+    """
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(path), timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def has_fts(conn) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'hypotheses_fts'").fetchone() is not None
+
+
+def init_db(conn):
+    conn.executescript(SCHEMA)
+    try:
+        conn.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5: search falls back to LIKE
+        print("FTS5 unavailable, using LIKE search:", e)
+    conn.commit()
+
+
+def add_hypothesis(conn, gene_symbol: str, disease_name: str, hypothesis_text: str, evidence_passages,
+                   novelty_flag: int, novelty_score: float, created_at: str = None, legacy_id: str = None) -> int:
+    cur = conn.execute(
+        "INSERT INTO hypotheses (gene_symbol, disease_name, hypothesis_text, evidence_passages, "
+        "novelty_flag, novelty_score, created_at, legacy_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (gene_symbol, disease_name, hypothesis_text,
+         evidence_passages if isinstance(evidence_passages, str) else json.dumps(evidence_passages),
+         novelty_flag, novelty_score, created_at or _now(), legacy_id),
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def get_hypothesis(conn, hypothesis_id: int):
+    row = conn.execute("SELECT * FROM hypotheses WHERE hypothesis_id = ?", (hypothesis_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def _fts_query(text: str) -> str:
+    # every word must match, as a prefix; quoted so FTS syntax in input is inert
+    words = re.findall(r"\w+", text)
+    return " AND ".join(f'"{w}"*' for w in words)
+
+
+def search(conn, query: str = "", limit: int = 50, offset: int = 0):
+    """
+    One page of hypotheses, newest first, optionally filtered by a full-text
+    query over gene, disease and hypothesis text. Returns (rows, total).
+    """
+    query = (query or "").strip()
+    if not query:
+        total = conn.execute("SELECT COUNT(*) FROM hypotheses").fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {_columns()} FROM hypotheses ORDER BY hypothesis_id DESC LIMIT ? OFFSET ?",
+            (limit, offset)).fetchall()
+    elif has_fts(conn) and _fts_query(query):
+        match = _fts_query(query)
+        total = conn.execute(
+            "SELECT COUNT(*) FROM hypotheses_fts WHERE hypotheses_fts MATCH ?", (match,)).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {_columns('h.')} "
+            "FROM hypotheses_fts JOIN hypotheses h ON h.hypothesis_id = hypotheses_fts.rowid "
+            "WHERE hypotheses_fts MATCH ? ORDER BY h.hypothesis_id DESC LIMIT ? OFFSET ?",
+            (match, limit, offset)).fetchall()
+    else:
+        like = f"%{query}%"
+        where = "gene_symbol LIKE ? OR disease_name LIKE ? OR hypothesis_text LIKE ?"
+        total = conn.execute(f"SELECT COUNT(*) FROM hypotheses WHERE {where}", (like,) * 3).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT {_columns()} FROM hypotheses WHERE {where} "
+            "ORDER BY hypothesis_id DESC LIMIT ? OFFSET ?", (like,) * 3 + (limit, offset)).fetchall()
+    return [dict(r) for r in rows], total
+
+
+def add_feedback(conn, hypothesis_id: int, rating: str, comment: str = "", created_at: str = None) -> int:
+    cur = conn.execute(
+        "INSERT INTO feedback (hypothesis_id, rating, comment, created_at) VALUES (?, ?, ?, ?)",
+        (hypothesis_id, rating, comment, created_at or _now()),
+    )
+    conn.commit()
+    return cur.lastrowid
+
+
+def migrate_csv(conn, hyp_csv: Path = HYP_CSV, fb_csv: Path = FB_CSV) -> dict:
+    """
+    One-time import of the CSV files the app used to write. Original IDs are
+    kept in legacy_id and used to attach the old feedback rows.
+    """
+    if conn.execute("SELECT 1 FROM meta WHERE name = 'csv_migrated'").fetchone():
+        return {"hypotheses": 0, "feedback": 0}
+    # take the write lock, then re-check: another process may have just migrated
+    conn.execute("BEGIN IMMEDIATE")
+    if conn.execute("SELECT 1 FROM meta WHERE name = 'csv_migrated'").fetchone():
+        conn.rollback()
+        return {"hypotheses": 0, "feedback": 0}
+    n_hyp = n_fb = 0
+    if hyp_csv.exists():
+        with open(hyp_csv, "r", encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                conn.execute(
+                    "INSERT INTO hypotheses (gene_symbol, disease_name, hypothesis_text, evidence_passages, "
+                    "novelty_flag, novelty_score, created_at, legacy_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (row.get("gene_symbol", ""), row.get("disease_name", ""), row.get("hypothesis_text", ""),
+                     row.get("evidence_passages") or "[]",
+                     int(float(row["novelty_flag"])) if row.get("novelty_flag") else None,
+                     float(row["novelty_score"]) if row.get("novelty_score") else None,
+                     row.get("created_at") or _now(), row.get("hypothesis_id")),
+                )
+                n_hyp += 1
+    if fb_csv.exists():
+        with open(fb_csv, "r", encoding="utf-8", newline="") as f:
+            # legacy rows: hypothesis_id, rating, comment, unix time (no header)
+            for row in csv.reader(f):
+                if len(row) < 4:
+                    continue
+                legacy_id, rating, comment, ts = row[0], row[1], ",".join(row[2:-1]), row[-1]
+                hit = conn.execute("SELECT hypothesis_id FROM hypotheses WHERE legacy_id = ? "
+                                   "ORDER BY hypothesis_id LIMIT 1", (legacy_id,)).fetchone()
+                if hit is None:
+                    continue
+                try:
+                    created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(float(ts)))
+                except ValueError:
+                    created = _now()
+                conn.execute("INSERT INTO feedback (hypothesis_id, rating, comment, created_at) "
+                             "VALUES (?, ?, ?, ?)", (hit[0], rating, comment, created))
+                n_fb += 1
+    conn.execute("INSERT INTO meta VALUES ('csv_migrated', ?)", (_now(),))
+    conn.commit()
+    return {"hypotheses": n_hyp, "feedback": n_fb}
+
+
+def open_store(path: Path = DB_FILE) -> sqlite3.Connection:
+    """
+    Connect, create the schema if needed and import the legacy CSVs once.
+    """
+    conn = connect(path)
+    init_db(conn)
+    migrated = migrate_csv(conn)
+    if any(migrated.values()):
+        print("Imported from CSV:", migrated)
+    return conn
+
+
+if __name__ == "__main__":
+    conn = open_store()
+    rows, total = search(conn, limit=5)
+    print(f"{total} hypotheses in {DB_FILE}")
@@ -0,0 +1,100 @@
+import pickle
+import re
+from pathlib import Path
+import pandas as pd
+
+# -----------------------------
+# Precomputed DisGeNET association index
+#
+#   gene symbol (upper) -> frozenset of disease codes
+#   disease-name token  -> frozenset of disease codes
+#
+# Built once from the TSV and pickled, so novelty checks are set lookups
+# instead of a full table scan per call.
+# -----------------------------
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str):
+    return _TOKEN.findall(str(text).lower())
+
+
+class AssociationIndex:
+    def __init__(self, disease_ids, disease_names, gene_to_diseases, token_to_diseases, source=None):
+        self.disease_ids = disease_ids
+        self.disease_names = disease_names
+        self.gene_to_diseases = gene_to_diseases
+        self.token_to_diseases = token_to_diseases
+        self.source = source or {}
+
+    @classmethod
+    def from_tsv(cls, tsv: Path):
+        cols = ["geneSymbol", "diseaseName", "diseaseId"]
+        dg = pd.read_csv(tsv, sep="\t", dtype=str, low_memory=False,
+                         usecols=lambda c: c in cols)
+        dg = dg.dropna(subset=["geneSymbol", "diseaseName"])
+        if "diseaseId" not in dg.columns:
+            dg["diseaseId"] = dg["diseaseName"]
+        dg["diseaseId"] = dg["diseaseId"].fillna(dg["diseaseName"])
+
+        diseases = dg.drop_duplicates("diseaseId")[["diseaseId", "diseaseName"]]
+        disease_ids = diseases["diseaseId"].tolist()
+        disease_names = diseases["diseaseName"].tolist()
+        code = {d: i for i, d in enumerate(disease_ids)}
+
+        genes = {}
+        for gene, did in zip(dg["geneSymbol"].str.upper(), dg["diseaseId"]):
+            genes.setdefault(gene, set()).add(code[did])
+        tokens = {}
+        for i, name in enumerate(disease_names):
+            for tok in set(tokenize(name)):
+                tokens.setdefault(tok, set()).add(i)
+
+        st = Path(tsv).stat()
+        return cls(
+            disease_ids, disease_names,
+            {g: frozenset(s) for g, s in genes.items()},
+            {t: frozenset(s) for t, s in tokens.items()},
+            source={"path": str(tsv), "size": st.st_size, "mtime_ns": st.st_mtime_ns},
+        )
+
+    def save(self, path: Path):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(self.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: Path):
+        with open(path, "rb") as f:
+            return cls(**pickle.load(f))
+
+    def is_stale(self, tsv: Path) -> bool:
+        if not Path(tsv).exists():
+            return False
+        st = Path(tsv).stat()
+        return (st.st_size, st.st_mtime_ns) != (self.source.get("size"), self.source.get("mtime_ns"))
+
+    def diseases_matching(self, disease_name: str) -> frozenset:
+        """
+        Disease codes whose name contains every token of `disease_name`.
+        """
+        toks = tokenize(disease_name)
+        if not toks:
+            return frozenset()
+        postings = [self.token_to_diseases.get(t, frozenset()) for t in set(toks)]
+        return frozenset.intersection(*sorted(postings, key=len))
+
+    def is_known(self, gene_symbol: str, disease_name: str, matching: frozenset = None) -> bool:
+        """
+        `matching` may carry a precomputed diseases_matching(disease_name).
+        An empty disease name matches any disease of the gene.
+        """
+        diseases = self.gene_to_diseases.get(gene_symbol.upper())
+        if not diseases:
+            return False
+        if not tokenize(disease_name):
+            return True
+        if matching is None:
+            matching = self.diseases_matching(disease_name)
+        return not diseases.isdisjoint(matching)
@@ -0,0 +1,398 @@
+import argparse
+import json
+import time
+from pathlib import Path
+import numpy as np
+from src import metrics, registry
+from src.retrieval.incremental import MANIFEST, content_hash, load_manifest
+from src.retrieval.passage_store import iter_jsonl
+
+# -----------------------------
+# Gene x disease co-occurrence matrix over the corpus
+#
+#   genes.json        {"ids": [HGNC id, ...], "symbols": [...]}
+#   diseases.json     normalized disease mentions, one per column
+#   indptr.npy        int64[n_genes+1], CSR row pointers
+#   indices.npy       int32 disease column of each stored pair
+#   counts.npy        int32 passages mentioning both
+#   post_offsets.npy  int64[nnz+1], passages of pair e are post_ids[off[e]:off[e+1]]
+#   post_ids.npy      int64 passage ids (same ids as the FAISS index)
+#   d_indptr.npy      int64[n_diseases+1], disease-major view of the pairs:
+#   d_entries.npy     int64 pair indices, for disease -> gene lookups
+#   passages.npy      int64 sorted ids of the passages already counted
+#   meta.json
+#
+# Genes come from normalized_genes (exact and alias matches, plus fuzzy
+# ones scoring at least MIN_FUZZY_SCORE), diseases from the NER
+# Disease_disorder mentions of the same passages. Everything is
+# memory-mapped; a query reads one row and its posting lists.
+#
+# update() only parses passages that are not counted yet and drops
+# passages the manifest no longer lists, then rewrites the arrays.
+# After dedup, a passage merged into another one has no manifest id of
+# its own; the dedup canonical line map sends its pairs to the surviving
+# passage's id. Lines that still resolve to no id are counted in meta.
+# -----------------------------
+
+NORM_FILE = Path("data/processed/normalized_entities.jsonl")
+COOC_DIR = Path("data/processed/cooccurrence")
+HGNC_TSV = Path("data/raw/databases/hgnc_complete_set.txt")
+DEDUP_MAP = Path("data/processed/passages.dedup.jsonl.canonical.npy")
+
+MIN_FUZZY_SCORE = 90
+DISEASE_LABELS = ("disease_disorder", "disease")
+
+
+def normalize_disease(name: str) -> str:
+    return " ".join(str(name).lower().split())
+
+
+def _gene_resolver(hgnc_tsv: Path):
+    """
+    (resolve(normalized_gene) -> hgnc id or None, {hgnc id: symbol}).
+    Without the HGNC file only exact/alias matches (which carry the id)
+    resolve, and ids double as symbols.
+    """
+    symbol_to_id, alias_map = {}, {}
+    if Path(hgnc_tsv).exists():
+        from src.normalization.normalize import HGNC_CACHE, load_lookup
+        lookup = load_lookup(Path(hgnc_tsv), HGNC_CACHE)
+        symbol_to_id, alias_map = lookup["symbol_to_id"], lookup["alias_map"]
+    symbols = {hid: sym for sym, hid in symbol_to_id.items() if hid}
+
+    def resolve(g: dict):
+        if g.get("hgnc_id"):
+            return g["hgnc_id"]
+        cand = g.get("candidate")
+        if g.get("method") == "fuzzy" and cand and cand[1] >= MIN_FUZZY_SCORE:
+            return symbol_to_id.get(cand[0]) or alias_map.get(cand[0])
+        return None
+
+    return resolve, symbols
+
+
+def _triples(records, passage_id, skip, resolve, gene_ids: dict, disease_ids: dict):
+    """
+    (gene, disease, passage) code arrays for the records whose passage id
+    is not in `skip`; new genes and diseases are appended to the vocabularies.
+    Records sharing an id (merged duplicates) all contribute to it.
+    """
+    g_out, d_out, p_out = [], [], []
+    seen = set()
+    unresolved = 0
+    for lineno, rec in enumerate(records):
+        pid = passage_id(lineno, rec)
+        if pid is None:
+            unresolved += 1
+            continue
+        if pid in skip:
+            continue
+        seen.add(pid)
+        genes = {resolve(g) for g in rec.get("normalized_genes", [])} - {None}
+        diseases = {normalize_disease(e.get("word", "")) for e in rec.get("entities", [])
+                    if e.get("entity_group", "").lower() in DISEASE_LABELS}
+        diseases.discard("")
+        for hid in genes:
+            g = gene_ids.setdefault(hid, len(gene_ids))
+            for name in diseases:
+                g_out.append(g)
+                d_out.append(disease_ids.setdefault(name, len(disease_ids)))
+                p_out.append(pid)
+    # passages without pairs still count as processed
+    skip |= seen
+    return (np.array(g_out, dtype="int64"), np.array(d_out, dtype="int64"),
+            np.array(p_out, dtype="int64"), len(seen), unresolved)
+
+
+def _write(out_dir: Path, g, d, p, gene_list, symbols, disease_list, passages, meta):
+    order = np.lexsort((p, d, g))
+    g, d, p = g[order], d[order], p[order]
+    keep = np.ones(len(g), dtype=bool)
+    keep[1:] = (g[1:] != g[:-1]) | (d[1:] != d[:-1]) | (p[1:] != p[:-1])
+    g, d, p = g[keep], d[keep], p[keep]
+
+    new_pair = np.ones(len(g), dtype=bool)
+    new_pair[1:] = (g[1:] != g[:-1]) | (d[1:] != d[:-1])
+    starts = np.flatnonzero(new_pair)
+    pair_g, pair_d = g[starts], d[starts]
+    post_offsets = np.append(starts, len(p)).astype("int64")
+    counts = np.diff(post_offsets).astype("int32")
+    indptr = np.searchsorted(pair_g, np.arange(len(gene_list) + 1)).astype("int64")
+    by_disease = np.argsort(pair_d, kind="stable")
+    d_indptr = np.searchsorted(pair_d[by_disease], np.arange(len(disease_list) + 1)).astype("int64")
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    arrays = {"indptr": indptr, "indices": pair_d.astype("int32"), "counts": counts,
+              "post_offsets": post_offsets, "post_ids": p, "d_indptr": d_indptr,
+              "d_entries": by_disease.astype("int64"), "passages": np.array(sorted(passages), dtype="int64")}
+    for name, arr in arrays.items():
+        np.save(out_dir / f"{name}.npy", arr)
+    with open(out_dir / "genes.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": gene_list, "symbols": [symbols.get(h, h) for h in gene_list]}, f)
+    with open(out_dir / "diseases.json", "w", encoding="utf-8") as f:
+        json.dump(disease_list, f, ensure_ascii=False)
+    meta.update({"genes": len(gene_list), "diseases": len(disease_list), "pairs": int(len(counts)),
+                 "postings": int(len(p)), "passages": len(passages),
+                 "updated_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+    with open(out_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _manifest_resolver(manifest: dict, dedup_map: Path = None):
+    """
+    passage_id(lineno, rec) for a manifest. With a dedup canonical line map,
+    a line whose text has no id takes the id of its canonical line (which
+    comes earlier in the file, so it has been resolved already).
+    """
+    ids = manifest["ids"]
+    if dedup_map is None or not Path(dedup_map).exists():
+        return lambda lineno, rec: ids.get(content_hash(rec.get("text", "")))
+    canonical = np.load(dedup_map, mmap_mode="r")
+    line_id = np.full(len(canonical), -1, dtype="int64")
+
+    def passage_id(lineno, rec):
+        pid = ids.get(content_hash(rec.get("text", "")))
+        if lineno >= len(canonical):
+            return pid
+        if pid is None and line_id[canonical[lineno]] >= 0:
+            pid = int(line_id[canonical[lineno]])
+        if pid is not None:
+            line_id[lineno] = pid
+        return pid
+
+    return passage_id
+
+
+def update(norm_file: Path = NORM_FILE, out_dir: Path = COOC_DIR, manifest_path: Path = MANIFEST,
+           hgnc_tsv: Path = HGNC_TSV, rebuild: bool = False, dedup_map: Path = DEDUP_MAP) -> dict:
+    """
+    Count pairs for passages not in the matrix yet and drop passages the
+    manifest no longer lists (everything, if rebuild or no matrix exists).
+    Passage ids come from the embedding manifest (content hash -> id, via
+    the dedup canonical line map for merged passages), or are line numbers
+    when there is none. Returns the metadata.
+    """
+    t0 = time.perf_counter()
+    manifest = load_manifest(manifest_path)
+    if manifest:
+        passage_id = _manifest_resolver(manifest, dedup_map if manifest.get("dedup") else None)
+        live = set(manifest["ids"].values())
+    else:
+        passage_id = lambda lineno, rec: lineno
+        live = None
+    resolve, symbols = _gene_resolver(hgnc_tsv)
+
+    existing = None if rebuild or not (out_dir / "meta.json").exists() else CooccurrenceIndex(out_dir)
+    if existing is not None and bool(existing.meta.get("line_ids")) != (manifest is None):
+        print("Passage ids changed scheme (manifest added or removed); rebuilding.")
+        existing = None
+    if existing is None:
+        gene_list, disease_list, done = [], [], set()
+        g0 = d0 = p0 = np.zeros(0, dtype="int64")
+    else:
+        gene_list, disease_list = list(existing.gene_ids), list(existing.diseases)
+        done = set(existing._passages.tolist())
+        g0, d0, p0 = existing.triples()
+        symbols = {**dict(zip(existing.gene_ids, existing.symbols)), **symbols}
+    removed = set()
+    if live is not None:
+        removed = done - live
+        done -= removed
+    gene_ids = {h: i for i, h in enumerate(gene_list)}
+    disease_ids = {n: i for i, n in enumerate(disease_list)}
+
+    with metrics.span("cooccurrence.scan"):
+        g1, d1, p1, n_new, unresolved = _triples(iter_jsonl(norm_file), passage_id, done, resolve,
+                                                 gene_ids, disease_ids)
+    if removed:
+        keep = ~np.isin(p0, np.fromiter(removed, dtype="int64"))
+        g0, d0, p0 = g0[keep], d0[keep], p0[keep]
+    del existing
+    meta = _write(out_dir, np.concatenate([g0, g1]), np.concatenate([d0, d1]), np.concatenate([p0, p1]),
+                  list(gene_ids), symbols, list(disease_ids), done,
+                  {"source": str(norm_file), "line_ids": manifest is None, "min_fuzzy_score": MIN_FUZZY_SCORE,
+                   "unresolved_passages": unresolved})
+    elapsed = time.perf_counter() - t0
+    metrics.record("cooccurrence.update", elapsed, t0, added=n_new, removed=len(removed))
+    print(f"Co-occurrence matrix: {n_new} passages added, {len(removed)} removed, {meta['pairs']} pairs "
+          f"over {meta['genes']} genes x {meta['diseases']} diseases ({elapsed:.1f}s) -> {out_dir}")
+    if unresolved:
+        print(f"  {unresolved} passages matched no embedding id (manifest or dedup map out of date?); not counted.")
+    return meta
+
+
+class CooccurrenceIndex:
+    """
+    Read-only, memory-mapped view of a matrix written by update().
+    """
+
+    def __init__(self, cooc_dir: Path = COOC_DIR):
+        self.dir = Path(cooc_dir)
+        load = lambda name: np.load(self.dir / f"{name}.npy", mmap_mode="r")
+        self.indptr, self.indices, self.counts = load("indptr"), load("indices"), load("counts")
+        self.post_offsets, self.post_ids = load("post_offsets"), load("post_ids")
+        self.d_indptr, self.d_entries = load("d_indptr"), load("d_entries")
+        self._passages = load("passages")
+        with open(self.dir / "genes.json", "r", encoding="utf-8") as f:
+            genes = json.load(f)
+        self.gene_ids, self.symbols = genes["ids"], genes["symbols"]
+        with open(self.dir / "diseases.json", "r", encoding="utf-8") as f:
+            self.diseases = json.load(f)
+        with open(self.dir / "meta.json", "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._gene_row = {h: i for i, h in enumerate(self.gene_ids)}
+        for i, sym in enumerate(self.symbols):
+            self._gene_row.setdefault(sym.upper(), i)
+        self._disease_col = {n: i for i, n in enumerate(self.diseases)}
+
+    def gene_row(self, gene: str):
+        """
+        Row of a gene given as HGNC id or symbol (case-insensitive); None if unseen.
+        """
+        return self._gene_row.get(gene, self._gene_row.get(gene.strip().upper()))
+
+    def disease_col(self, disease: str):
+        return self._disease_col.get(normalize_disease(disease))
+
+    def _entry(self, gene: str, disease: str):
+        row, col = self.gene_row(gene), self.disease_col(disease)
+        if row is None or col is None:
+            return None
+        lo, hi = self.indptr[row], self.indptr[row + 1]
+        j = lo + np.searchsorted(self.indices[lo:hi], col)
+        return int(j) if j < hi and self.indices[j] == col else None
+
+    def count(self, gene: str, disease: str) -> int:
+        e = self._entry(gene, disease)
+        return 0 if e is None else int(self.counts[e])
+
+    def passages(self, gene: str, disease: str, limit: int = None) -> np.ndarray:
+        """
+        Ids of the passages mentioning both, ascending.
+        """
+        e = self._entry(gene, disease)
+        if e is None:
+            return np.zeros(0, dtype="int64")
+        lo, hi = self.post_offsets[e], self.post_offsets[e + 1]
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return np.array(self.post_ids[lo:hi])
+
+    def _top(self, entries: np.ndarray, top: int):
+        counts = np.asarray(self.counts[entries])
+        if len(entries) > top:
+            part = np.argpartition(-counts, top - 1)[:top]
+            entries, counts = entries[part], counts[part]
+        order = np.argsort(-counts, kind="stable")
+        return entries[order], counts[order]
+
+    def _with_passages(self, e: int, n_passages: int) -> list:
+        lo = self.post_offsets[e]
+        return np.array(self.post_ids[lo:min(self.post_offsets[e + 1], lo + n_passages)]).tolist()
+
+    def diseases_for_gene(self, gene: str, top: int = 20, n_passages: int = 5) -> list:
+        """
+        [{"disease", "count", "passages"}, ...] for the diseases most often
+        mentioned with `gene`, with up to n_passages supporting passage ids.
+        """
+        row = self.gene_row(gene)
+        if row is None:
+            return []
+        entries, counts = self._top(np.arange(self.indptr[row], self.indptr[row + 1]), top)
+        return [{"disease": self.diseases[self.indices[e]], "count": int(c),
+                 "passages": self._with_passages(e, n_passages)} for e, c in zip(entries, counts)]
+
+    def genes_for_disease(self, disease: str, top: int = 20, n_passages: int = 5) -> list:
+        """
+        [{"gene", "hgnc_id", "count", "passages"}, ...] for the genes most
+        often mentioned with `disease` (exact normalized mention).
+        """
+        col = self.disease_col(disease)
+        if col is None:
+            return []
+        entries = np.array(self.d_entries[self.d_indptr[col]:self.d_indptr[col + 1]])
+        entries, counts = self._top(entries, top)
+        rows = np.searchsorted(self.indptr, entries, side="right") - 1
+        return [{"gene": self.symbols[r], "hgnc_id": self.gene_ids[r], "count": int(c),
+                 "passages": self._with_passages(e, n_passages)} for e, r, c in zip(entries, rows, counts)]
+
+    def top_pairs(self, top: int = 100, min_count: int = 1):
+        """
+        [(gene symbol, disease, count), ...] with the highest counts.
+        """
+        entries, counts = self._top(np.flatnonzero(np.asarray(self.counts) >= min_count), top)
+        rows = np.searchsorted(self.indptr, entries, side="right") - 1
+        return [(self.symbols[r], self.diseases[self.indices[e]], int(c)) for e, r, c in zip(entries, rows, counts)]
+
+    def triples(self):
+        """
+        (gene row, disease col, passage id) of every posting.
+        """
+        n = len(self.counts)
+        genes = np.repeat(np.arange(len(self.gene_ids), dtype="int64"), np.diff(self.indptr))
+        per_pair = np.diff(self.post_offsets)
+        return (np.repeat(genes, per_pair), np.repeat(np.asarray(self.indices, dtype="int64"), per_pair),
+                np.array(self.post_ids[:self.post_offsets[n]]))
+
+    def matrix(self):
+        """
+        The counts as a scipy.sparse CSR matrix (genes x diseases) over the mapped arrays.
+        """
+        from scipy.sparse import csr_matrix
+        return csr_matrix((self.counts, self.indices, self.indptr), shape=(len(self.gene_ids), len(self.diseases)))
+
+
+def _load_cooccurrence():
+    if not (COOC_DIR / "meta.json").exists():
+        print(f"No co-occurrence matrix in {COOC_DIR}. Build it with `python -m src.validation.cooccurrence`.")
+        return None
+    return CooccurrenceIndex(COOC_DIR)
+
+registry.register("cooccurrence", _load_cooccurrence)
+
+
+def mine_candidates(index: CooccurrenceIndex, top: int = 1000, min_count: int = 2) -> list:
+    """
+    Frequently co-mentioned pairs that DisGeNET does not already link,
+    as [(gene, disease, count), ...] - input for src.generation.screen.
+    """
+    from src.validation.validate import novelty_scores
+    pairs = index.top_pairs(top, min_count)
+    novelty = novelty_scores([(g, d) for g, d, _ in pairs])
+    return [p for p, s in zip(pairs, novelty) if s > 0]
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Build or update the gene x disease co-occurrence matrix.")
+    ap.add_argument("--in-file", type=Path, default=NORM_FILE)
+    ap.add_argument("--out-dir", type=Path, default=COOC_DIR)
+    ap.add_argument("--rebuild", action="store_true", help="recount every passage")
+    ap.add_argument("--gene", help="show the top diseases for a gene instead of building")
+    ap.add_argument("--disease", help="show the top genes for a disease instead of building")
+    ap.add_argument("--mine", type=Path, default=None,
+                    help="write frequent pairs DisGeNET does not know to this TSV (gene, disease, count)")
+    ap.add_argument("--top", type=int, default=20)
+    ap.add_argument("--min-count", type=int, default=2)
+    args = ap.parse_args()
+
+    if args.gene or args.disease or args.mine:
+        index = CooccurrenceIndex(args.out_dir)
+        t0 = time.perf_counter()
+        if args.gene and args.disease:
+            print(index.count(args.gene, args.disease), index.passages(args.gene, args.disease).tolist())
+        elif args.gene:
+            print(json.dumps(index.diseases_for_gene(args.gene, args.top), indent=2))
+        elif args.disease:
+            print(json.dumps(index.genes_for_disease(args.disease, args.top), indent=2))
+        if args.mine:
+            cands = mine_candidates(index, args.top, args.min_count)
+            with open(args.mine, "w", encoding="utf-8") as f:
+                f.write("gene\tdisease\tcount\n")
+                for g, d, c in cands:
+                    f.write(f"{g}\t{d}\t{c}\n")
+            print(f"Wrote {len(cands)} candidate pairs to {args.mine}")
+        print(f"({(time.perf_counter() - t0) * 1000:.1f} ms)")
+    else:
+        update(args.in_file, args.out_dir, rebuild=args.rebuild)
+        metrics.write_textfile()
@@ -1,25 +1,67 @@
-import pandas as pd
 from pathlib import Path
+from src import metrics, registry
+from src.validation.association_index import AssociationIndex
 
 DG_FILE = Path("data/raw/databases/disgenet_curated.tsv")
+DG_INDEX = Path("data/processed/disgenet_index.pkl")
 
-if DG_FILE.exists():
-    dg = pd.read_csv(DG_FILE, sep="\t", low_memory=False)
-else:
-    dg = None
+def build_index(tsv: Path = DG_FILE, out: Path = DG_INDEX) -> AssociationIndex:
+    """
+    Parse the DisGeNET TSV once and persist the association index.
+    """
+    index = AssociationIndex.from_tsv(tsv)
+    index.save(out)
+    print(f"Saved DisGeNET index ({len(index.gene_to_diseases)} genes, "
+          f"{len(index.disease_ids)} diseases) to {out}")
+    return index
+
+def _load_disgenet_index():
+    if DG_INDEX.exists():
+        index = AssociationIndex.load(DG_INDEX)
+        if not index.is_stale(DG_FILE):
+            return index
+    if DG_FILE.exists():
+        return build_index(DG_FILE, DG_INDEX)
     print("DisGeNET file not found. Place disgenet_curated.tsv at data/raw/databases/ to enable novelty checks.")
+    return None
+
+registry.register("disgenet_index", _load_disgenet_index)
 
 def check_known(gene_symbol: str, disease_name: str) -> bool:
-    if dg is None:
+    """
+    True if DisGeNET links the gene to a disease whose name contains all
+    words of disease_name (case-insensitive).
+    """
+    index = registry.get("disgenet_index")
+    if index is None:
         return False
-    hits = dg[(dg["geneSymbol"].str.upper() == gene_symbol.upper()) &
-              (dg["diseaseName"].str.contains(disease_name, case=False, na=False))]
-    return not hits.empty
+    return index.is_known(gene_symbol, disease_name)
 
 def novelty_score(gene_symbol: str, disease_name: str) -> float:
-    return 0.0 if check_known(gene_symbol, disease_name) else 1.0
+    with metrics.span("novelty_score"):
+        return 0.0 if check_known(gene_symbol, disease_name) else 1.0
+
+def novelty_scores(pairs):
+    """
+    Novelty scores for many (gene, disease) pairs; each distinct disease
+    name is resolved against the inverted index only once.
+    """
+    index = registry.get("disgenet_index")
+    if index is None:
+        return [1.0] * len(pairs)
+    matching = {}
+    scores = []
+    with metrics.span("novelty_score", pairs=len(pairs)):
+        for gene, disease in pairs:
+            if disease not in matching:
+                matching[disease] = index.diseases_matching(disease)
+            scores.append(0.0 if index.is_known(gene, disease, matching[disease]) else 1.0)
+    return scores
 
 if __name__ == "__main__":
+    import sys
+    if "--build" in sys.argv:
+        build_index()
     gene = "BRCA1"
     disease = "breast cancer"
     print("Novelty score for BRCA1 / breast cancer:", novelty_score(gene, disease))